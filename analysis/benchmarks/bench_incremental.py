@@ -0,0 +1,87 @@
+"""Refresh latency of the rolling indicator columns: full vs incremental.
+
+Run with: python benchmarks/bench_incremental.py [--bars 10000] [--repeat 50]
+
+Builds a synthetic daily history, then times (a) a full recomputation of every
+rolling column, (b) a refresh where only the in-progress bar was revised and
+(c) a refresh with one appended bar. Also runs the consistency check against
+full recomputation and exits non-zero if it fails.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from incremental import ROLLING_COLUMNS, IncrementalIndicatorCache, check_consistency, compute_full  # noqa: E402
+from indicators import IndicatorEngine  # noqa: E402
+
+
+def synthetic_history(bars, seed=7):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.015, bars)))
+    spread = np.abs(rng.normal(0, 0.01, bars))
+    index = pd.bdate_range(end='2026-01-02', periods=bars)
+    return pd.DataFrame({
+        'Open': close * (1 + rng.normal(0, 0.003, bars)),
+        'High': close * (1 + spread),
+        'Low': close * (1 - spread),
+        'Close': close,
+        'Volume': rng.integers(1_000_000, 50_000_000, bars).astype(float),
+    }, index=index)
+
+
+def _time(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bars', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    full_history = synthetic_history(args.bars + args.repeat + 1)
+    hist = full_history.iloc[:args.bars].copy()
+
+    full_ms = _time(lambda: compute_full(IndicatorEngine(hist), ROLLING_COLUMNS), args.repeat)
+
+    cache = IncrementalIndicatorCache()
+    cache.columns('bench', hist, ROLLING_COLUMNS)
+    revised = hist.copy()
+    ticks = iter(np.linspace(0.99, 1.01, args.repeat))
+
+    def revise():
+        revised.iloc[-1, revised.columns.get_loc('Close')] = hist['Close'].iloc[-1] * next(ticks)
+        cache.columns('bench', revised, ROLLING_COLUMNS)
+
+    revise_ms = _time(revise, args.repeat)
+
+    cache.columns('bench', hist, ROLLING_COLUMNS)
+    length = iter(range(args.bars + 1, args.bars + args.repeat + 1))
+    append_ms = _time(lambda: cache.columns('bench', full_history.iloc[:next(length)], ROLLING_COLUMNS), args.repeat)
+
+    print(f'{args.bars} bars, {len(ROLLING_COLUMNS)} rolling columns, median/max of {args.repeat} runs')
+    print(f'  full recompute      {full_ms[0]:8.2f} ms  {full_ms[1]:8.2f} ms')
+    print(f'  revise last bar     {revise_ms[0]:8.2f} ms  {revise_ms[1]:8.2f} ms')
+    print(f'  append one bar      {append_ms[0]:8.2f} ms  {append_ms[1]:8.2f} ms')
+    print(f'  full/incremental updates: {cache.full_updates}/{cache.incremental_updates}')
+
+    report = check_consistency(full_history)
+    worst = max((v, k) for k, v in report.items() if k != 'ok')
+    print(f'  consistency: {"ok" if report["ok"] else "MISMATCH"} (worst {worst[1]}: {worst[0]:.2e})')
+    return 0 if report['ok'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,295 @@
+"""Offline benchmark suite for the analysis service, run on synthetic data.
+
+Run with: python benchmarks/bench_suite.py [--quick] [--repeat 5] [--only REGEX]
+                                           [--record] [--compare] [--threshold 0.25]
+
+Every benchmark runs against SyntheticProvider, so no network is needed and the
+inputs are identical from run to run. History lengths go from 1 to 40 years of
+daily bars, plus 5-minute and 1-minute intraday. For each length the suite times:
+
+  indicators        all rolling chart/ML columns plus a set of indicator specs
+  history_cold      get_stock_price_history with empty indicator caches
+  history_warm      the same call again (engine and rolling caches hit)
+  serialize         the row serialization stage inside history_cold
+  archive_load      reading the archived bars behind an intraday chart (intraday only)
+  apply_rules, run_simulation, compute_metrics
+                    backtester steps for a moving-average crossover strategy
+  robustness        5000-path bootstrap and trade permutation analysis
+  portfolio         analytics for a 20-position portfolio (daily only)
+  screen_cold, screen_warm, screen
+                    run_screen over SCREEN_SYMBOLS symbols with an empty shared
+                    history cache (provider, cache writes and recompute), with a
+                    filled one but an empty universe (cache reads and
+                    recompute), and with everything warm
+  train, predict    RandomForest training and prediction (daily only)
+
+--record appends the run to benchmarks/results.jsonl. --compare checks the run
+against the latest recorded run from the same machine and exits non-zero if any
+median slowed by more than --threshold.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+# Keep models and histories out of the real shared cache directory
+os.environ['STOCK_CACHE_DIR'] = tempfile.mkdtemp(prefix='bench-cache-')
+os.environ['INTRADAY_ARCHIVE_DIR'] = tempfile.mkdtemp(prefix='bench-archive-')
+
+import pandas as pd  # noqa: E402
+
+import indicators  # noqa: E402
+import portfolio  # noqa: E402
+import robustness  # noqa: E402
+import stock_data  # noqa: E402
+from incremental import ROLLING_COLUMNS, IncrementalIndicatorCache, compute_full  # noqa: E402
+from indicators import PRICE_COLUMNS, IndicatorEngine  # noqa: E402
+from metrics import capture  # noqa: E402
+from providers import SyntheticProvider, set_provider  # noqa: E402
+
+RESULTS_PATH = os.path.join(HERE, 'results.jsonl')
+SYMBOL = 'BENCH'
+END_DATE = '2026-01-02'
+EXTRA_SPECS = ['EMA_20', 'RSI_14', 'MACDHIST_12_26_9', 'ATR_14', 'BBUPPER_20_2', 'BBLOWER_20_2', 'ROC_10']
+STRATEGY = {
+    'entry': {'left': 'Close', 'op': '>', 'right': 'MA_50'},
+    'exit_condition': {'left': 'Close', 'op': '<', 'right': 'MA_50'},
+}
+SCREEN_SYMBOLS = 500
+SCREEN = {'all': [
+    {'left': 'Pct_below_52week_high', 'op': '<=', 'right': 25},
+    {'left': '200MA', 'op': '>', 'right': 'MA200_month_ago'},
+]}
+# name -> (interval, years of history served for date_range='max')
+CASES = {
+    'daily-1y': ('1d', 1),
+    'daily-5y': ('1d', 5),
+    'daily-10y': ('1d', 10),
+    'daily-20y': ('1d', 20),
+    'daily-40y': ('1d', 40),
+    'intraday-5m': ('5m', None),
+    'intraday-1m': ('1m', None),
+}
+QUICK_CASES = ['daily-1y', 'daily-10y', 'intraday-5m']
+# Medians this small are dominated by timer noise and never count as regressions
+NOISE_FLOOR_MS = 1.0
+
+
+def _time(fn, repeat, setup=None):
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _clear_caches():
+    stock_data._rolling_cache = IncrementalIndicatorCache()
+    indicators._engine_cache.clear()
+    stock_data._model_cache.clear()
+    stock_data._history_cache.clear()
+    stock_data._info_cache.clear()
+    stock_data._closes_cache.clear()
+
+
+def _backtest_frame(hist, interval):
+    # Mirrors run_backtest's preparation of the rule operands
+    engine = IndicatorEngine(hist)
+    df = pd.DataFrame({col: hist[col].to_numpy() for col in PRICE_COLUMNS})
+    df.insert(0, 'Date', pd.to_datetime([stock_data._format_date(d, interval) for d in hist.index]))
+    df['MA_50'] = engine.compute('MA_50')
+    return df
+
+
+def run_case(case, repeat, only=None):
+    interval, years = CASES[case]
+    provider = SyntheticProvider(max_years=years or 40, end=END_DATE)
+    set_provider(provider)
+    hist = provider.history(SYMBOL, 'max', interval)
+    samples = {}
+
+    def wanted(*names):
+        # --only is applied before running, so filtered-out benchmarks (and
+        # the setup only they need) cost nothing
+        return any(only is None or re.search(only, f'{name}[{case}]') for name in names)
+
+    def bench(name, fn, setup=None, runs=repeat):
+        if wanted(name):
+            samples[name] = _time(fn, runs, setup)
+
+    bench('indicators', lambda: (
+        compute_full(IndicatorEngine(hist), ROLLING_COLUMNS),
+        IndicatorEngine(hist).compute_many(EXTRA_SPECS),
+    ))
+
+    serialize = []
+
+    def history_cold():
+        with capture() as captured:
+            stock_data.get_stock_price_history(SYMBOL, 'max', interval)
+        serialize.extend(s * 1000 for name, s in captured['stages'] if name == 'history.serialize')
+
+    if wanted('history_cold', 'serialize'):
+        samples['history_cold'] = _time(history_cold, repeat, _clear_caches)
+        samples['serialize'] = serialize
+    bench('history_warm', lambda: stock_data.get_stock_price_history(SYMBOL, 'max', interval))
+    if interval in stock_data.ARCHIVE_INTERVALS:
+        bench('archive_load', lambda: stock_data._intraday_archive.frame(provider.cache_id, SYMBOL, interval))
+
+    if wanted('apply_rules', 'run_simulation', 'compute_metrics', 'robustness'):
+        df = _backtest_frame(hist, interval)
+        rules = [STRATEGY['entry'], STRATEGY['exit_condition'], 'immediate', 3, 'month', 'daily']
+        bench('apply_rules', lambda: stock_data._apply_rules(df.copy(), *rules))
+        valid = stock_data._apply_rules(df.copy(), *rules).dropna(subset=['buy', 'sell_pct'])
+        bench('run_simulation', lambda: stock_data._run_simulation(valid, 10000))
+        trades, equity_curve, final_value = stock_data._run_simulation(valid, 10000)
+        bench('compute_metrics', lambda: stock_data._compute_metrics(trades, equity_curve, 10000, final_value))
+        bench('robustness', lambda: robustness.analyze(trades, equity_curve, 10000, {'paths': 5000, 'seed': 0}))
+
+    if interval == '1d' and wanted('portfolio'):
+        positions = [{'symbol': f'P{i}', 'quantity': 10 + i, 'cost_basis': None} for i in range(20)]
+        closes = provider.closes([p['symbol'] for p in positions] + [SYMBOL], 'max', '1d')
+        closes.index = [stock_data._format_date(d, '1d') for d in closes.index]
+        bench('portfolio', lambda: portfolio.analyze(closes, positions, SYMBOL))
+
+    if interval == '1d' and wanted('screen_cold', 'screen_warm', 'screen'):
+        # Through run_screen, so histories load via the shared cache like in the service
+        universe_symbols = [f'U{i}' for i in range(SCREEN_SYMBOLS)]
+
+        def screen():
+            result = stock_data.run_screen(universe_symbols, SCREEN, 'Price_Change_3M')
+            assert result['error'] is None, result['error']
+
+        def empty_universe():
+            stock_data._screen_universes.clear()
+
+        def empty_caches():
+            empty_universe()
+            stock_data._history_cache.clear()
+
+        bench('screen_cold', screen, setup=empty_caches, runs=min(repeat, 2))
+        if not wanted('screen_cold'):
+            screen()  # fills the history cache and universe the other two start from
+        bench('screen_warm', screen, setup=empty_universe)
+        bench('screen', screen)
+
+    if interval == '1d' and len(hist) > 300 and wanted('train', 'predict'):
+        _clear_caches()
+        rows = stock_data.get_stock_price_history(SYMBOL, 'max', interval, auto_predict=True)
+        rows = [r for r in rows if 'prediction' not in r]
+        runs = min(repeat, 3)
+        bench('train', lambda: stock_data.train_random_forest_model(rows), runs=runs)
+        model = stock_data.train_random_forest_model(rows)['model_data']
+        bench('predict', lambda: stock_data.predict_stock_recommendation(rows, model))
+
+    return len(hist), {
+        f'{name}[{case}]': {
+            'median_ms': round(statistics.median(values), 3),
+            'min_ms': round(min(values), 3),
+            'runs': len(values),
+        }
+        for name, values in samples.items() if values and wanted(name)
+    }
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _machine():
+    return f'{platform.node()}/{platform.machine()}/{os.cpu_count()}cpu'
+
+
+def _load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(results, previous, threshold):
+    """Print per-benchmark changes; return the names that regressed."""
+    regressions = []
+    print(f'\nCompared with {previous["commit"]} ({previous["timestamp"]}):')
+    for name, now in results.items():
+        before = previous['results'].get(name)
+        if before is None:
+            continue
+        change = now['median_ms'] / before['median_ms'] - 1 if before['median_ms'] else 0.0
+        slower = change > threshold and now['median_ms'] - before['median_ms'] > NOISE_FLOOR_MS
+        if slower:
+            regressions.append(name)
+        flag = '  REGRESSION' if slower else ''
+        print(f'  {name:34s} {before["median_ms"]:10.2f} -> {now["median_ms"]:10.2f} ms  {change:+7.1%}{flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--quick', action='store_true', help=f'only {", ".join(QUICK_CASES)}')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', help='regex over benchmark names, e.g. "history|train"')
+    parser.add_argument('--record', action='store_true', help='append this run to the results history')
+    parser.add_argument('--compare', action='store_true', help='fail on regressions against the last run')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown (0.25 = 25%%)')
+    parser.add_argument('--results', default=RESULTS_PATH)
+    args = parser.parse_args()
+
+    results = {}
+    for case in (QUICK_CASES if args.quick else CASES):
+        with contextlib.redirect_stderr(io.StringIO()):
+            bars, case_results = run_case(case, args.repeat, args.only)
+        results.update(case_results)
+        print(f'{case} ({bars} bars)')
+        for name, r in case_results.items():
+            print(f'  {name.split("[")[0]:18s} {r["median_ms"]:10.2f} ms median  {r["min_ms"]:10.2f} ms min')
+
+    record = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'machine': _machine(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'quick': args.quick,
+        'repeat': args.repeat,
+        'results': results,
+    }
+
+    status = 0
+    if args.compare:
+        previous = [r for r in _load_history(args.results) if r.get('machine') == record['machine']]
+        if previous:
+            regressions = compare(results, previous[-1], args.threshold)
+            if regressions:
+                print(f'\n{len(regressions)} regression(s) over {args.threshold:.0%}')
+                status = 1
+        else:
+            print('\nNo earlier run from this machine to compare with')
+
+    if args.record:
+        with open(args.results, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        print(f'\nRecorded to {args.results}')
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
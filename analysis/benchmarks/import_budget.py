@@ -0,0 +1,85 @@
+"""Cold-start budget for the analysis entry points.
+
+Run with: python benchmarks/import_budget.py [--repeat 3] [--scale 1.0]
+
+Starts a fresh interpreter per entry point and checks two things:
+  - wall time (best of --repeat, interpreter start-up included) stays within
+    budget; --scale multiplies every budget for slower machines
+  - heavy modules the entry point does not need are never imported
+Exits non-zero on any violation. CI runs it so that a stray top-level import
+(FastAPI in the backtest worker, pandas in ``import stock_data``) fails the
+build.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ANALYSIS_DIR = os.path.dirname(HERE)
+
+HEAVY = ('pandas', 'numpy', 'yfinance', 'sklearn', 'fastapi', 'pydantic', 'uvicorn')
+WORKER = 'from stock_data import run_backtest\nfrom metrics import capture'
+CLI_PRICE = (
+    "import runpy\n"
+    "sys.argv = ['stock_data.py', 'get_current_stock_price', 'BENCH']\n"
+    "runpy.run_path('stock_data.py', run_name='__main__')"
+)
+
+# (name, code, budget in seconds, modules that must not be loaded)
+ENTRY_POINTS = [
+    ('import stock_data', 'import stock_data', 0.3, HEAVY),
+    ('backtest worker start-up', WORKER, 0.3, HEAVY),
+    ('FastAPI app build', 'import stock_data\nstock_data.app', 1.5, ('pandas', 'numpy', 'yfinance', 'sklearn')),
+    ('CLI get_current_stock_price', CLI_PRICE, 1.2, ('fastapi', 'pydantic', 'uvicorn', 'sklearn')),
+]
+
+MARKER = 'IMPORT_BUDGET '
+
+
+def measure(code):
+    """Wall seconds for a fresh interpreter running code, and the heavy modules it loaded."""
+    wrapper = (
+        "import sys, json\n"
+        f"{code}\n"
+        f"sys.stderr.write({MARKER!r} + json.dumps([m for m in {HEAVY!r} if m in sys.modules]) + '\\n')\n"
+    )
+    env = dict(os.environ, STOCK_DATA_PROVIDER='synthetic', PYTHONDONTWRITEBYTECODE='1')
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-c', wrapper], cwd=ANALYSIS_DIR, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'failed')
+    line = next(l for l in proc.stderr.splitlines() if l.startswith(MARKER))
+    return elapsed, json.loads(line[len(MARKER):])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply every budget')
+    args = parser.parse_args()
+
+    baseline = min(measure('pass')[0] for _ in range(args.repeat))
+    print(f'bare interpreter: {baseline * 1000:.0f} ms')
+    failures = 0
+    for name, code, budget, forbidden in ENTRY_POINTS:
+        runs = [measure(code) for _ in range(args.repeat)]
+        elapsed = min(seconds for seconds, _ in runs)
+        loaded = sorted(set(runs[0][1]) & set(forbidden))
+        limit = budget * args.scale
+        problems = []
+        if elapsed > limit:
+            problems.append(f'over budget ({limit * 1000:.0f} ms)')
+        if loaded:
+            problems.append('imported ' + ', '.join(loaded))
+        failures += bool(problems)
+        status = 'FAIL ' + '; '.join(problems) if problems else 'ok'
+        print(f'{name:30s} {elapsed * 1000:7.0f} ms  {status}')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,356 @@
+"""Load test the FastAPI service end to end with mixed traffic, offline.
+
+Run with: python benchmarks/loadtest.py [--rate 10] [--duration 30] [--concurrency 16] [--workers 1]
+                                        [--mix chart=25,price=40,...] [--ref main] [--json out.json]
+
+Starts ``stock_data.py serve`` on a free local port with
+STOCK_DATA_PROVIDER=synthetic and QUOTE_SOURCE=fake, then sends requests at a
+fixed target rate (open loop: latency is measured from each request's scheduled
+send time, so a saturated server shows up as queueing delay rather than as a
+lower offered load). Reports per request kind: p50/p95/p99 latency, throughput,
+error and timeout rates, and the peak RSS of the service process tree while that
+kind was in flight. Each service run gets an empty STOCK_CACHE_DIR and
+INTRADAY_ARCHIVE_DIR, and --workers starts that many uvicorn workers
+(SERVICE_WORKERS).
+
+Each --ref (a git revision) is extracted with ``git archive`` and measured after
+the working tree, and the runs are printed side by side.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ANALYSIS_DIR = os.path.dirname(HERE)
+
+DEFAULT_MIX = {'chart': 25, 'chart_predict': 5, 'price': 40, 'fundamentals': 10, 'backtest': 5, 'model_status': 15}
+DEFAULT_SYMBOLS = ['AAA', 'BBB', 'CCC', 'DDD', 'EEE', 'FFF', 'GGG', 'HHH', 'III', 'JJJ']
+BACKTEST_STRATEGY = {
+    'entry': {'left': 'Close', 'op': '>', 'right': 'MA_50'},
+    'exit_condition': {'left': 'Close', 'op': '<', 'right': 'MA_50'},
+}
+
+
+def build_request(kind, rng, symbols):
+    """(method, path, json body) for one request of ``kind``."""
+    symbol = rng.choice(symbols)
+    if kind == 'chart':
+        body = {'symbol': symbol, 'date_range': rng.choice(['1y', '2y', '5y', 'max'])}
+        return 'POST', '/stock_history', body
+    if kind == 'chart_predict':
+        return 'POST', '/stock_history', {'symbol': symbol, 'date_range': '5y', 'auto_predict': True}
+    if kind == 'price':
+        return 'POST', '/current_price', {'symbol': symbol}
+    if kind == 'fundamentals':
+        return 'POST', '/fundamentals', {'symbol': symbol}
+    if kind == 'backtest':
+        return 'POST', '/backtest', {'symbol': symbol, 'strategy_config': BACKTEST_STRATEGY, 'date_range': '2y'}
+    if kind == 'model_status':
+        return 'GET', f'/model/status/{symbol}', None
+    raise ValueError(f'Unknown request kind: {kind}')
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        kind, _, weight = part.partition('=')
+        kind = kind.strip()
+        if kind not in DEFAULT_MIX:
+            raise SystemExit(f'Unknown request kind in --mix: {kind} (known: {", ".join(DEFAULT_MIX)})')
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+# ── Service process ─────────────────────────────────────────────────────────
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_service(analysis_dir, port, extra_env=None):
+    env = dict(os.environ, STOCK_DATA_PROVIDER='synthetic', QUOTE_SOURCE='fake', **(extra_env or {}))
+    proc = subprocess.Popen(
+        [sys.executable, 'stock_data.py', 'serve', '127.0.0.1', str(port)],
+        cwd=analysis_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f'Service in {analysis_dir} exited with code {proc.returncode}')
+        try:
+            if requests.get(f'http://127.0.0.1:{port}/health', timeout=1).ok:
+                return proc
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    proc.kill()
+    raise SystemExit(f'Service in {analysis_dir} did not become healthy')
+
+
+def stop_service(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def _rss_bytes(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def tree_rss(pid):
+    """RSS of pid plus its direct children (backtest workers); 0 off Linux."""
+    total = _rss_bytes(pid)
+    try:
+        entries = os.listdir('/proc')
+    except OSError:
+        return total
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            total += _rss_bytes(int(entry))
+    return total
+
+
+# ── Load generation ─────────────────────────────────────────────────────────
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.timeouts = defaultdict(int)
+        self.in_flight = defaultdict(int)
+        self.peak_rss = defaultdict(int)
+        self.rss_samples = []
+
+    def begin(self, kind):
+        with self.lock:
+            self.in_flight[kind] += 1
+
+    def end(self, kind, latency, outcome):
+        with self.lock:
+            self.in_flight[kind] -= 1
+            if outcome == 'ok':
+                self.latencies[kind].append(latency)
+            elif outcome == 'timeout':
+                self.timeouts[kind] += 1
+            else:
+                self.errors[kind] += 1
+
+    def sample_rss(self, rss):
+        with self.lock:
+            self.rss_samples.append(rss)
+            for kind, n in self.in_flight.items():
+                if n > 0:
+                    self.peak_rss[kind] = max(self.peak_rss[kind], rss)
+
+
+def run_load(base_url, pid, mix, rate, duration, concurrency, timeout, symbols, seed, record=True):
+    rng = random.Random(seed)
+    kinds, weights = zip(*mix.items())
+    total = int(rate * duration)
+    schedule = []
+    for i in range(total):
+        kind = rng.choices(kinds, weights)[0]
+        schedule.append((i / rate, kind, build_request(kind, rng, symbols)))
+    recorder = Recorder()
+    local = threading.local()
+    stop = threading.Event()
+
+    def sampler():
+        while not stop.wait(0.25):
+            recorder.sample_rss(tree_rss(pid))
+
+    def send(start_at, kind, request):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        method, path, body = request
+        recorder.begin(kind)
+        try:
+            resp = session.request(method, base_url + path, json=body, timeout=timeout)
+            outcome = 'ok' if resp.status_code < 400 else 'error'
+        except requests.Timeout:
+            outcome = 'timeout'
+        except requests.RequestException:
+            outcome = 'error'
+        recorder.end(kind, time.perf_counter() - start_at, outcome)
+
+    threading.Thread(target=sampler, daemon=True).start()
+    begin = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for offset, kind, request in schedule:
+            delay = begin + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, begin + offset, kind, request)
+    elapsed = time.perf_counter() - begin
+    stop.set()
+    return summarize(recorder, elapsed) if record else None
+
+
+def summarize(recorder, elapsed):
+    report = {'elapsedSeconds': round(elapsed, 2), 'kinds': {}}
+    kinds = sorted(set(recorder.latencies) | set(recorder.errors) | set(recorder.timeouts))
+    for kind in kinds + ['all']:
+        if kind == 'all':
+            lat = [x for k in kinds for x in recorder.latencies[k]]
+            errors = sum(recorder.errors[k] for k in kinds)
+            timeouts = sum(recorder.timeouts[k] for k in kinds)
+            peak = max(recorder.rss_samples, default=0)
+        else:
+            lat = recorder.latencies[kind]
+            errors, timeouts, peak = recorder.errors[kind], recorder.timeouts[kind], recorder.peak_rss[kind]
+        count = len(lat) + errors + timeouts
+        ms = np.array(lat) * 1000
+        report['kinds'][kind] = {
+            'requests': count,
+            'throughput': round(len(lat) / elapsed, 2),
+            'p50': round(float(np.percentile(ms, 50)), 1) if len(ms) else None,
+            'p95': round(float(np.percentile(ms, 95)), 1) if len(ms) else None,
+            'p99': round(float(np.percentile(ms, 99)), 1) if len(ms) else None,
+            'errorRate': round(errors / count, 4) if count else 0.0,
+            'timeoutRate': round(timeouts / count, 4) if count else 0.0,
+            'peakRssMB': round(peak / 2 ** 20, 1),
+        }
+    return report
+
+
+# ── Reporting ───────────────────────────────────────────────────────────────
+
+COLUMNS = [  # (key, header, width, is_rate)
+    ('requests', 'reqs', 7, False), ('throughput', 'rps', 8, False), ('p50', 'p50 ms', 10, False),
+    ('p95', 'p95 ms', 10, False), ('p99', 'p99 ms', 10, False), ('errorRate', 'err', 8, True),
+    ('timeoutRate', 'timeout', 9, True), ('peakRssMB', 'rss MB', 9, False),
+]
+
+
+def _cell(value, width, is_rate=False):
+    if value is None:
+        return f'{"-":>{width}}'
+    return f'{value:>{width}.2%}' if is_rate else f'{value:>{width}}'
+
+
+def print_report(label, report):
+    print(f'\n{label}  ({report["elapsedSeconds"]}s)')
+    print(f'  {"kind":14s}' + ''.join(f'{header:>{width}}' for _, header, width, _ in COLUMNS))
+    for kind, row in report['kinds'].items():
+        print(f'  {kind:14s}' + ''.join(_cell(row[key], width, rate) for key, _, width, rate in COLUMNS))
+
+
+def print_comparison(labels, reports):
+    base_label, base = labels[0], reports[0]
+    keys = ['p50', 'p95', 'p99', 'throughput']
+    for label, report in zip(labels[1:], reports[1:]):
+        print(f'\n{label} vs {base_label} (value and change)')
+        print(f'  {"kind":14s}' + ''.join(f'{k:>18}' for k in keys) + f'{"err":>16}')
+        for kind, row in report['kinds'].items():
+            ref = base['kinds'].get(kind)
+            if ref is None:
+                continue
+            cells = []
+            for key in keys:
+                before, after = ref[key], row[key]
+                change = f'{after / before - 1:+.0%}' if before and after is not None else ''
+                cells.append(f'{_cell(after, 11)} {change:>6}')
+            cells.append(f'{ref["errorRate"]:>8.1%} ->{row["errorRate"]:>5.1%}')
+            print(f'  {kind:14s}' + ''.join(cells))
+
+
+def extract_ref(ref, dest):
+    repo = subprocess.run(['git', 'rev-parse', '--show-toplevel'], cwd=HERE, capture_output=True, text=True,
+                          check=True).stdout.strip()
+    archive = subprocess.run(['git', 'archive', ref, 'analysis'], cwd=repo, capture_output=True, check=True).stdout
+    subprocess.run(['tar', '-x', '-C', dest], input=archive, check=True)
+    return os.path.join(dest, 'analysis')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rate', type=float, default=10, help='target requests per second')
+    parser.add_argument('--duration', type=float, default=30, help='seconds of measured load')
+    parser.add_argument('--warmup', type=float, default=5, help='seconds of unmeasured load first')
+    parser.add_argument('--concurrency', type=int, default=16, help='client threads')
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn worker processes')
+    parser.add_argument('--timeout', type=float, default=30, help='per-request timeout in seconds')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='kind=weight list; kinds: ' + ', '.join(DEFAULT_MIX))
+    parser.add_argument('--symbols', default=','.join(DEFAULT_SYMBOLS))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--ref', action='append', default=[], help='also test this git revision')
+    parser.add_argument('--json', help='write the reports to this file')
+    args = parser.parse_args()
+    symbols = [s.strip().upper() for s in args.symbols.split(',') if s.strip()]
+
+    builds = [('working tree', ANALYSIS_DIR)]
+    scratch = tempfile.mkdtemp(prefix='loadtest-')
+    try:
+        for ref in args.ref:
+            dest = os.path.join(scratch, str(len(builds)))
+            os.makedirs(dest)
+            builds.append((ref, extract_ref(ref, dest)))
+
+        reports = []
+        for label, analysis_dir in builds:
+            port = _free_port()
+            cache_dir = os.path.join(scratch, f'cache-{len(reports)}')
+            archive_dir = os.path.join(scratch, f'archive-{len(reports)}')
+            proc = start_service(analysis_dir, port, {'STOCK_CACHE_DIR': cache_dir,
+                                                      'INTRADAY_ARCHIVE_DIR': archive_dir,
+                                                      'SERVICE_WORKERS': str(args.workers)})
+            try:
+                base_url = f'http://127.0.0.1:{port}'
+                common = dict(mix=args.mix, rate=args.rate, concurrency=args.concurrency,
+                              timeout=args.timeout, symbols=symbols, seed=args.seed)
+                if args.warmup > 0:
+                    run_load(base_url, proc.pid, duration=args.warmup, record=False, **common)
+                report = run_load(base_url, proc.pid, duration=args.duration, **common)
+            finally:
+                stop_service(proc)
+            report['build'] = label
+            reports.append(report)
+            print_report(label, report)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    if len(reports) > 1:
+        print_comparison([label for label, _ in builds], reports)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': {k: v for k, v in vars(args).items() if k != 'json'}, 'reports': reports}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
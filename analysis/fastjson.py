@@ -0,0 +1,126 @@
+"""JSON encoding for API responses.
+
+FastAPI runs every returned object through jsonable_encoder and then the
+stdlib json module. For a chart payload of thousands of row dicts, that is a
+large share of the request time. Endpoints here return JSONBytesResponse with
+a body that is already encoded:
+
+  - dumps() uses orjson when it is installed, which also handles NumPy scalars
+    and arrays natively, and falls back to the stdlib encoder otherwise
+  - NaN and infinities are encoded as null on both paths (Starlette's encoder
+    raises on them instead)
+  - the output is compact UTF-8 JSON, like Starlette's JSONResponse; only float
+    spelling can differ (1e-05 vs 1e-5), which parses to the same value
+
+EncodedCache keeps encoded bodies so that repeated requests skip both the
+computation and the encoding.
+"""
+import datetime
+import json
+import math
+import threading
+from collections import OrderedDict
+
+from starlette.responses import Response
+
+from metrics import cache_lookup
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+
+def _default(obj):
+    """Types neither encoder knows natively: NumPy, pandas and sets."""
+    if hasattr(obj, 'tolist'):  # numpy arrays and scalars
+        return obj.tolist()
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if type(obj).__name__ in ('NAType', 'NaTType'):
+        return None
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def _finite(obj):
+    """Copy of obj with non-finite floats replaced by None (stdlib path only)."""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {k: _finite(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(v) for v in obj]
+    if hasattr(obj, 'tolist'):
+        return _finite(obj.tolist())
+    return obj
+
+
+def _stdlib_dumps(obj):
+    try:
+        text = json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(',', ':'), default=_default)
+    except ValueError:  # NaN or infinity somewhere
+        text = json.dumps(_finite(obj), ensure_ascii=False, allow_nan=False, separators=(',', ':'), default=_default)
+    return text.encode('utf-8')
+
+
+def dumps(obj):
+    """Encode obj as compact JSON bytes, with NaN and infinities as null."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+        except TypeError:  # e.g. integers wider than 64 bits
+            pass
+    return _stdlib_dumps(obj)
+
+
+class JSONBytesResponse(Response):
+    """JSON response whose content may already be encoded bytes."""
+
+    media_type = 'application/json'
+
+    def render(self, content):
+        if isinstance(content, (bytes, bytearray, memoryview)):
+            return bytes(content)
+        return dumps(content)
+
+
+class EncodedCache:
+    """LRU of encoded response bodies, bounded by total size in bytes."""
+
+    def __init__(self, name, max_bytes):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+        cache_lookup(self.name, body is not None)
+        return body
+
+    def put(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= len(old)
+            self._entries[key] = body
+            self.nbytes += len(body)
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= len(evicted)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
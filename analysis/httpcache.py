@@ -0,0 +1,83 @@
+"""Conditional GET and compression for large JSON responses.
+
+A chart response is identified by a strong ETag built from the request
+parameters and the version of the data behind it (see
+stock_data.history_etag), so a client that already has the current body gets
+a 304 without the server building or sending it again.
+
+Compressed bodies get their own tag (``"<tag>-gzip"``, ``"<tag>-br"``), since a
+strong validator names one exact byte sequence. If-None-Match compares the
+tag with that suffix removed. brotli is used when the ``brotli`` package is
+installed and the client accepts it; otherwise gzip.
+"""
+import gzip
+import hashlib
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is always available
+    brotli = None
+
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+_SUFFIXES = ('-gzip', '-br')
+
+
+def make_etag(*parts):
+    """Strong ETag (quoted) for the given version parts."""
+    return '"' + hashlib.sha1(repr(parts).encode()).hexdigest()[:24] + '"'
+
+
+def representation_etag(etag, encoding):
+    return etag if encoding == 'identity' else etag[:-1] + '-' + encoding + '"'
+
+
+def _base_tag(tag):
+    tag = tag.strip()
+    if tag.startswith('W/'):
+        tag = tag[2:]
+    for suffix in _SUFFIXES:
+        if tag.endswith(suffix + '"'):
+            return tag[:-len(suffix) - 1] + '"'
+    return tag
+
+
+def etag_matches(if_none_match, etag):
+    """True if an If-None-Match header value names etag in any content coding."""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return any(_base_tag(t) == etag for t in if_none_match.split(','))
+
+
+def choose_encoding(accept_encoding, size):
+    """Best content coding for a body of size bytes: 'br', 'gzip' or 'identity'."""
+    if size < MIN_COMPRESS_BYTES or not accept_encoding:
+        return 'identity'
+    accepted = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    for encoding in ('br', 'gzip'):
+        if encoding == 'br' and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return 'identity'
+
+
+def compress(body, encoding):
+    if encoding == 'gzip':
+        # mtime=0 keeps the output, and so the ETag, deterministic
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return body
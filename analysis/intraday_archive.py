@@ -0,0 +1,347 @@
+"""Append-only archive of intraday bars.
+
+Providers serve only a short window of intraday bars (Yahoo: about a week of
+1m, two months of 5m/15m, two years of 1h), so every intraday chart
+downloaded that whole window and anything older was lost. The archive keeps
+every completed bar it has seen, one file per symbol, interval and month:
+
+    <INTRADAY_ARCHIVE_DIR>/<provider cache_id>/<interval>/<SYMBOL>/<YYYY-MM>.npy
+
+A partition is a structured array of (time, open, high, low, close, volume)
+rows sorted by time, with time in UTC nanoseconds. Partitions are opened with
+np.load(mmap_mode='r'), so loading a range only pages in the months it
+covers. An append rewrites the newest partition through a temp file renamed
+over it, so readers in other processes never see a partial file; earlier
+months are not written again.
+
+The last bar of a download may still be forming and is not archived. A bar
+is archived once a later bar exists and is never revised afterwards.
+
+IntradayCollector appends the recent bars of recently charted symbols in a
+background thread, so charts only download the latest session on top of the
+archive (see stock_data._intraday_history). A chart load touches the
+symbol's .viewed file; symbols not viewed for TRACK_SECONDS, or beyond the
+MAX_TRACKED most recently viewed, are no longer downloaded (their archived
+bars stay).
+"""
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from lazy import LazyModule
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks are only process-local
+    fcntl = None
+
+np = LazyModule('numpy', globals(), 'np')
+pd = LazyModule('pandas', globals(), 'pd')
+
+ARCHIVE_DIR = os.environ.get(
+    'INTRADAY_ARCHIVE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive'),
+)
+ARCHIVE_INTERVALS = ('1m', '5m', '15m', '1h')
+# Longest window the provider serves per interval, downloaded when the
+# archive has no bars that reach the live window
+BACKFILL_PERIODS = {'1m': '5d', '5m': '1mo', '15m': '1mo', '1h': '2y'}
+# Downloaded by each collector run; spans a weekend or a short outage
+RECENT_PERIOD = '5d'
+# Downloaded by a chart load on top of the archive
+LIVE_PERIOD = '1d'
+# The collector keeps downloading a symbol for this long after its last chart view
+TRACK_SECONDS = float(os.environ.get('INTRADAY_TRACK_SECONDS', str(7 * 24 * 3600)))
+# and at most this many of the most recently viewed symbols per interval
+MAX_TRACKED = int(os.environ.get('INTRADAY_MAX_TRACKED', '500'))
+
+FIELDS = ('open', 'high', 'low', 'close', 'volume')
+COLUMNS = ('Open', 'High', 'Low', 'Close', 'Volume')
+BAR_DTYPE = [('time', '<i8')] + [(f, '<f8') for f in FIELDS[:4]] + [('volume', '<i8')]
+
+
+def _slug(text):
+    return re.sub(r'[^A-Za-z0-9_.^=-]+', '_', text)
+
+
+class IntradayArchive:
+    """The partitioned .npy files under one directory."""
+
+    def __init__(self, directory=ARCHIVE_DIR):
+        self.directory = directory
+        self._local_locks = {}
+        self._guard = threading.Lock()
+
+    def _path(self, source, symbol, interval):
+        return os.path.join(self.directory, _slug(source), interval, _slug(symbol.upper()))
+
+    def symbols(self, source, interval):
+        """Symbols with archived bars for interval."""
+        try:
+            return sorted(os.listdir(os.path.join(self.directory, _slug(source), interval)))
+        except FileNotFoundError:
+            return []
+
+    @staticmethod
+    def _partitions(path):
+        try:
+            return sorted(n for n in os.listdir(path) if n.endswith('.npy'))
+        except FileNotFoundError:
+            return []
+
+    @contextmanager
+    def _lock(self, path):
+        """Exclusive lock on one symbol's partitions across threads and processes."""
+        with self._guard:
+            local = self._local_locks.setdefault(path, threading.Lock())
+        with local:
+            os.makedirs(path, exist_ok=True)
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(path, '.lock'), 'a') as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def load(self, source, symbol, interval, start=None):
+        """Archived bars from start (a Timestamp) on, as a BAR_DTYPE array sorted by time."""
+        path = self._path(source, symbol, interval)
+        names = self._partitions(path)
+        if start is not None:
+            start = pd.Timestamp(start)
+            start = start.tz_localize('UTC') if start.tz is None else start.tz_convert('UTC')
+            first = f'{start:%Y-%m}.npy'
+            names = [n for n in names if n >= first]
+        parts = []
+        for name in names:
+            try:
+                parts.append(np.load(os.path.join(path, name), mmap_mode='r'))
+            except FileNotFoundError:
+                continue
+        if not parts:
+            return np.empty(0, dtype=BAR_DTYPE)
+        bars = np.concatenate(parts)
+        if start is not None:
+            bars = bars[bars['time'] >= start.value]
+        return bars
+
+    def last_time(self, source, symbol, interval):
+        """UTC nanoseconds of the newest archived bar, or None."""
+        path = self._path(source, symbol, interval)
+        names = self._partitions(path)
+        if not names:
+            return None
+        return int(np.load(os.path.join(path, names[-1]), mmap_mode='r')['time'][-1])
+
+    def mark_viewed(self, source, symbol, interval):
+        """Record that symbol was charted at interval now."""
+        path = self._path(source, symbol, interval)
+        os.makedirs(path, exist_ok=True)
+        marker = os.path.join(path, '.viewed')
+        try:
+            os.utime(marker)
+        except FileNotFoundError:
+            open(marker, 'a').close()
+
+    def last_viewed(self, source, symbol, interval):
+        """Time of the last mark_viewed for symbol, or None."""
+        try:
+            return os.stat(os.path.join(self._path(source, symbol, interval), '.viewed')).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _timezone(self, path):
+        try:
+            with open(os.path.join(path, 'meta.json')) as f:
+                return json.load(f).get('tz')
+        except (OSError, ValueError):
+            return None
+
+    def frame(self, source, symbol, interval, start=None):
+        """Archived bars as an OHLCV frame indexed in the exchange's timezone, or None."""
+        bars = self.load(source, symbol, interval, start)
+        if not len(bars):
+            return None
+        index = pd.DatetimeIndex(pd.to_datetime(bars['time'], unit='ns', utc=True))
+        tz = self._timezone(self._path(source, symbol, interval))
+        index = index.tz_convert(tz) if tz else index.tz_localize(None)
+        return pd.DataFrame({column: bars[field] for field, column in zip(FIELDS, COLUMNS)}, index=index)
+
+    def append(self, source, symbol, interval, hist):
+        """Archive the completed bars of hist (all but its last) newer than the archive.
+
+        Returns the number of bars written.
+        """
+        if len(hist) < 2:
+            return 0
+        hist = hist.iloc[:-1]
+        index = hist.index if hist.index.tz is not None else hist.index.tz_localize('UTC')
+        times = index.tz_convert('UTC').as_unit('ns').asi8
+        values = {f: hist[c].to_numpy() for f, c in zip(FIELDS, COLUMNS)}
+        path = self._path(source, symbol, interval)
+        last = self.last_time(source, symbol, interval)
+        if last is not None and times[-1] <= last:
+            # Nothing new: skip the lock (partitions are replaced atomically)
+            return 0
+        with self._lock(path):
+            last = self.last_time(source, symbol, interval)
+            keep = ~np.isnan(values['close'].astype(float))
+            if last is not None:
+                keep &= times > last
+            if not keep.any():
+                return 0
+            bars = np.empty(int(keep.sum()), dtype=BAR_DTYPE)
+            bars['time'] = times[keep]
+            for field in FIELDS:
+                bars[field] = np.nan_to_num(values[field][keep].astype(float)) if field == 'volume' else values[field][keep]
+            if last is None:
+                self._write(os.path.join(path, 'meta.json'), json.dumps({'tz': str(hist.index.tz) if hist.index.tz else None}))
+            months = bars['time'].astype('datetime64[ns]').astype('datetime64[M]')
+            existing = set(self._partitions(path))
+            for month in np.unique(months):
+                name = f'{month}.npy'
+                chunk = bars[months == month]
+                if name in existing:
+                    chunk = np.concatenate([np.load(os.path.join(path, name)), chunk])
+                self._write(os.path.join(path, name), chunk)
+            return len(bars)
+
+    @staticmethod
+    def _write(target, content):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if isinstance(content, str):
+                    f.write(content.encode())
+                else:
+                    np.save(f, content, allow_pickle=False)
+            os.replace(tmp, target)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+
+def merge(archived, live):
+    """Archived bars before the live window, then the live bars (which win on overlap)."""
+    if archived is None or archived.empty:
+        return live.copy()
+    if live.empty:
+        return archived
+    older = archived[archived.index < live.index[0]]
+    older = older.reindex(columns=live.columns, fill_value=0.0).astype(live.dtypes.to_dict())
+    merged = pd.concat([older, live])
+    merged.index.name = live.index.name
+    return merged
+
+
+class IntradayCollector:
+    """Background thread that appends recent bars for recently charted symbols.
+
+    ``source()`` is the current provider's cache_id and ``fetch(symbol,
+    period, interval)`` downloads bars. An archived symbol is collected while
+    it was viewed within ``track_seconds`` and is among the ``max_symbols``
+    most recently viewed at its interval. ``extra_symbols`` are always
+    collected at every interval, even before anyone charts them.
+    With several service workers each runs a collector, but only the one
+    holding the archive's collector lock downloads anything.
+    """
+
+    def __init__(self, archive, source, fetch, every, extra_symbols=(), intervals=ARCHIVE_INTERVALS,
+                 track_seconds=TRACK_SECONDS, max_symbols=MAX_TRACKED):
+        self.archive = archive
+        self.source = source
+        self.fetch = fetch
+        self.every = every
+        self.extra_symbols = sorted({s.upper() for s in extra_symbols})
+        self.intervals = intervals
+        self.track_seconds = track_seconds
+        self.max_symbols = max_symbols
+        self.runs = 0
+        self.bars_appended = 0
+        self.errors = 0
+        self.last_run = None
+        self._lock_file = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _acquire(self):
+        if self._lock_file is not None:
+            return True
+        if fcntl is None:
+            self._lock_file = True
+            return True
+        os.makedirs(self.archive.directory, exist_ok=True)
+        f = open(os.path.join(self.archive.directory, 'collector.lock'), 'a')
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._lock_file = f
+        return True
+
+    @property
+    def active(self):
+        return self._lock_file is not None
+
+    def tracked(self):
+        """interval -> symbols the next run collects."""
+        source = self.source()
+        cutoff = time.time() - self.track_seconds
+        result = {}
+        for interval in self.intervals:
+            viewed = []
+            for symbol in self.archive.symbols(source, interval):
+                last = self.archive.last_viewed(source, symbol, interval)
+                if last is not None and last >= cutoff:
+                    viewed.append((last, symbol))
+            recent = [symbol for _, symbol in sorted(viewed, reverse=True)[:self.max_symbols]]
+            result[interval] = sorted(set(recent) | set(self.extra_symbols))
+        return result
+
+    def collect_once(self):
+        """Download and append recent bars for every tracked symbol; returns bars written."""
+        source = self.source()
+        written = 0
+        for interval, symbols in self.tracked().items():
+            for symbol in symbols:
+                known = self.archive.last_time(source, symbol, interval) is not None
+                try:
+                    hist = self.fetch(symbol, RECENT_PERIOD if known else BACKFILL_PERIODS[interval], interval)
+                    written += self.archive.append(source, symbol, interval, hist)
+                except Exception as e:
+                    self.errors += 1
+                    print(f'Intraday collector: {symbol} {interval}: {e}', file=sys.stderr)
+        self.runs += 1
+        self.bars_appended += written
+        self.last_run = time.time()
+        return written
+
+    def _run(self):
+        while True:
+            # Retried every run, so another worker takes over if the holder exits
+            if self._acquire():
+                self.collect_once()
+            if self._stop.wait(self.every):
+                return
+
+    def start(self):
+        if self._thread is None and self.every > 0:
+            self._thread = threading.Thread(target=self._run, name='intraday-collector', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,212 @@
+"""Background jobs for long computations, with progress and cancellation.
+
+Backtests over long intraday ranges, walk-forward runs and model training can
+outlast an HTTP request; the synchronous /backtest gives up after 30 seconds.
+Submitted as a job, the computation runs in a process pool and the request
+returns an id at once. The client then polls the job, fetches its result or
+cancels it:
+
+    queued -> running -> done | failed | cancelled
+
+Job state, results and cancel requests live in the shared cache. With
+``serve --workers N`` any worker can answer for any job, and a finished job's
+result stays available for JOB_TTL_SECONDS. A reloaded page picks it up by
+id instead of computing it again.
+
+Long loops call progress() at checkpoints. Outside a job it does nothing.
+Inside one it records how far the job got (bars simulated, folds trained)
+and raises JobCancelled once the job was cancelled, so the worker stops at
+its next checkpoint. JobCancelled derives from BaseException, so the
+``except Exception`` handlers that turn failures into error dicts let it
+through. Work between checkpoints is not interrupted: walk-forward runs
+terminate their fold processes, but a single model fit (the ``train`` job)
+runs to completion once started.
+"""
+import importlib
+import inspect
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from shared_cache import SharedCache
+
+JOB_TTL_SECONDS = int(os.environ.get('JOB_TTL_SECONDS', '3600'))
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+CHECK_INTERVAL_SECONDS = 0.25  # between progress writes and cancel checks within a stage
+FINISHED = ('done', 'failed', 'cancelled')
+
+_store = SharedCache('jobs', JOB_TTL_SECONDS)
+_current = threading.local()  # .job: the _Checkpoint of the job running on this thread
+
+
+class JobCancelled(BaseException):
+    """Raised at a progress() checkpoint of a job that was cancelled."""
+
+
+def _key(job_id, part='state'):
+    return f'{job_id}.{part}'
+
+
+def _now():
+    return datetime.now().isoformat()
+
+
+def get_job(job_id):
+    """The job's state dict, or None if unknown or expired."""
+    return _store.get(_key(job_id))
+
+
+def get_result(job_id):
+    """The result of a done job, or None."""
+    return _store.get(_key(job_id, 'result'))
+
+
+def _completed(progress):
+    # The last checkpoint write may predate the end of the loop
+    if progress and progress.get('total') is not None:
+        return dict(progress, done=progress['total'])
+    return progress
+
+
+def _update(job_id, **fields):
+    # Under the key's lock: the process running the job writes progress
+    # while a service worker may be recording a cancel
+    with _store.lock(_key(job_id)):
+        state = get_job(job_id)
+        if state is not None:
+            if fields.get('status') == 'done':
+                fields.setdefault('progress', _completed(state.get('progress')))
+            state.update(fields)
+            _store.set(_key(job_id), state)
+    return state
+
+
+def _cancel_requested(job_id):
+    return _store.get(_key(job_id, 'cancel')) is not None
+
+
+class _Checkpoint:
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.stage = None
+        self.next_check = 0.0
+
+
+def progress(stage, done=None, total=None, unit=None):
+    """Record the running job's progress; raises JobCancelled if it was cancelled.
+
+    Writes (and cancel checks) happen on every stage change and otherwise at
+    most every CHECK_INTERVAL_SECONDS, so loops can call this freely.
+    """
+    job = getattr(_current, 'job', None)
+    if job is None:
+        return
+    now = time.monotonic()
+    if stage == job.stage and now < job.next_check:
+        return
+    job.stage, job.next_check = stage, now + CHECK_INTERVAL_SECONDS
+    if _cancel_requested(job.job_id):
+        raise JobCancelled()
+    _update(job.job_id, progress={'stage': stage, 'done': done, 'total': total, 'unit': unit})
+
+
+def _execute(job_id, module, name, params):
+    """Run one job in a pool process and record its outcome."""
+    if _cancel_requested(job_id):
+        _update(job_id, status='cancelled', finishedAt=_now())
+        return
+    _update(job_id, status='running', startedAt=_now())
+    _current.job = _Checkpoint(job_id)
+    try:
+        result = getattr(importlib.import_module(module), name)(**params)
+    except JobCancelled:
+        _update(job_id, status='cancelled', finishedAt=_now())
+        return
+    except Exception as e:
+        print(f'Job {job_id} ({name}) failed: {e}', file=sys.stderr)
+        _update(job_id, status='failed', error=str(e), finishedAt=_now())
+        return
+    finally:
+        _current.job = None
+    error = result.get('error') if isinstance(result, dict) else None
+    if error:
+        _update(job_id, status='failed', error=error, finishedAt=_now())
+        return
+    _store.set(_key(job_id, 'result'), result)
+    _update(job_id, status='done', finishedAt=_now())
+
+
+class JobRunner:
+    """Submits jobs to this worker's process pool.
+
+    ``kinds`` maps a job kind to a function defined in ``module``. Pool
+    processes import that module by this name rather than fn.__module__,
+    which is '__main__' when the service runs as ``python stock_data.py serve``.
+    """
+
+    def __init__(self, kinds, module, workers=JOB_WORKERS):
+        self.kinds = kinds
+        self.module = module
+        self.workers = workers
+        self._pool = None
+        self._futures = {}  # job_id -> Future, while queued or running here
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        if self._pool is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # spawn: the service process has threads, which fork does not copy safely
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def submit(self, kind, params):
+        """Queue a job and return its state; raises ValueError for an unknown kind or bad params."""
+        fn = self.kinds.get(kind)
+        if fn is None:
+            raise ValueError(f'Unknown job kind: {kind!r} (expected one of {sorted(self.kinds)})')
+        params = dict(params or {})
+        try:
+            inspect.signature(fn).bind(**params)
+        except TypeError as e:
+            raise ValueError(f'Invalid parameters for {kind}: {e}')
+        job_id = uuid.uuid4().hex
+        state = {
+            'id': job_id, 'kind': kind, 'status': 'queued', 'progress': None, 'error': None,
+            'createdAt': _now(), 'startedAt': None, 'finishedAt': None,
+        }
+        _store.set(_key(job_id), state)
+        with self._lock:
+            future = self._executor().submit(_execute, job_id, self.module, fn.__name__, params)
+            self._futures[job_id] = future
+        future.add_done_callback(lambda f: self._finished(job_id, f))
+        return state
+
+    def _finished(self, job_id, future):
+        with self._lock:
+            self._futures.pop(job_id, None)
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            # The pool process died (e.g. killed for memory); later jobs get a new pool
+            with self._lock:
+                self._pool = None
+            _update(job_id, status='failed', error=f'Job worker failed: {error}', finishedAt=_now())
+
+    def cancel(self, job_id):
+        """Ask a job to stop; returns its state, or None if unknown."""
+        state = get_job(job_id)
+        if state is None or state['status'] in FINISHED:
+            return state
+        _store.set(_key(job_id, 'cancel'), True)
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None and future.cancel():
+            # Still queued in this worker: it never starts
+            return _update(job_id, status='cancelled', finishedAt=_now())
+        # Running, or queued in another worker: stops at its next checkpoint
+        return get_job(job_id)
@@ -0,0 +1,32 @@
+"""Deferred imports for heavy modules.
+
+pandas and numpy cost a few hundred milliseconds to import, which dominated
+the start-up of CLI calls and backtest workers that may never touch them.
+Modules bind a LazyModule under the usual alias instead:
+
+    pd = LazyModule('pandas', globals(), 'pd')
+
+The real import happens on first attribute access. The proxy then rebinds
+the alias in the owning module's globals, so later ``pd.X`` lookups hit the
+module directly with no proxy overhead.
+"""
+import importlib
+
+
+class LazyModule:
+    def __init__(self, name, namespace=None, alias=None):
+        self._name = name
+        self._namespace = namespace
+        self._alias = alias
+
+    def _load(self):
+        module = importlib.import_module(self._name)
+        if self._namespace is not None and self._namespace.get(self._alias) is self:
+            self._namespace[self._alias] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        return f'<lazy module {self._name!r}>'
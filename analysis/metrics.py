@@ -0,0 +1,258 @@
+"""In-process metrics rendered in the Prometheus text exposition format.
+
+Counters, gauges and fixed-bucket histograms guarded by one lock each; an
+observation is a bisect plus a few integer adds, cheap enough to leave on.
+The FastAPI service exposes REGISTRY at /metrics.
+
+stage() and StageClock time named pipeline stages. Code running in a worker
+process can wrap its work in capture() and ship the recorded stage timings and
+upstream outcomes back, so the parent replays them with observe_captured().
+"""
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels_text(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, '')) for n in self.labelnames)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f'{self.name}{_labels_text(self.labelnames, k)} {_number(v)}' for k, v in items]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][slot] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, **labels):
+        entry = self._values.get(self._key(labels))
+        return entry[2] if entry else 0
+
+    def render(self):
+        with self._lock:
+            items = sorted((k, ([*v[0]], v[1], v[2])) for k, v in self._values.items())
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                labels = _labels_text(self.labelnames, key, [('le', _number(bound))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _labels_text(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_number(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'stock_stage_duration_seconds', 'Time spent in each pipeline stage.', ['stage']))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'stock_http_request_duration_seconds', 'HTTP request latency by endpoint.', ['method', 'endpoint', 'status']))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    'stock_http_requests_in_flight', 'HTTP requests currently being served.', ['endpoint']))
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    'stock_cache_lookups_total', 'Cache lookups by cache and result (hit/miss).', ['cache', 'result']))
+CACHE_ENTRIES = REGISTRY.register(Gauge(
+    'stock_cache_entries', 'Entries currently held per cache.', ['cache']))
+UPSTREAM_CALLS = REGISTRY.register(Counter(
+    'stock_upstream_calls_total', 'Calls to the market data provider by outcome.', ['call', 'outcome']))
+
+_captures = threading.local()
+
+
+def _record(name, elapsed):
+    STAGE_SECONDS.observe(elapsed, stage=name)
+    captured = getattr(_captures, 'current', None)
+    if captured is not None:
+        captured['stages'].append((name, elapsed))
+
+
+@contextmanager
+def stage(name):
+    """Time a block as pipeline stage ``name``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(name, time.perf_counter() - start)
+
+
+class StageClock:
+    """Times consecutive stages of one function without nesting blocks.
+
+    lap(name) records the time since the previous lap (or construction) as
+    stage ``<prefix>.<name>``.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._last = time.perf_counter()
+
+    def lap(self, name):
+        now = time.perf_counter()
+        _record(f'{self.prefix}.{name}', now - self._last)
+        self._last = now
+
+
+@contextmanager
+def capture():
+    """Collect stage timings and upstream outcomes recorded in this thread.
+
+    Yields a JSON-serializable dict: {'stages': [(stage, seconds)...],
+    'upstream': [(call, outcome)...]}.
+    """
+    previous = getattr(_captures, 'current', None)
+    _captures.current = {'stages': [], 'upstream': []}
+    try:
+        yield _captures.current
+    finally:
+        _captures.current = previous
+
+
+def observe_captured(captured):
+    """Replay what capture() collected in another process into REGISTRY."""
+    for name, seconds in captured.get('stages', ()):
+        STAGE_SECONDS.observe(float(seconds), stage=name)
+    for call, outcome in captured.get('upstream', ()):
+        UPSTREAM_CALLS.inc(call=call, outcome=outcome)
+
+
+def cache_lookup(cache, hit):
+    CACHE_LOOKUPS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+@contextmanager
+def upstream(call):
+    """Count a provider call as ok/error and time it as stage ``upstream.<call>``."""
+    outcome = 'error'
+    try:
+        with stage(f'upstream.{call}'):
+            yield
+        outcome = 'ok'
+    finally:
+        UPSTREAM_CALLS.inc(call=call, outcome=outcome)
+        captured = getattr(_captures, 'current', None)
+        if captured is not None:
+            captured['upstream'].append((call, outcome))
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware recording per-endpoint latency and in-flight requests.
+
+    ``resolve(scope)`` maps a request to its route template (e.g.
+    ``/model/status/{symbol}``) so labels stay bounded. Latency covers the
+    whole response, including streamed bodies.
+    """
+
+    def __init__(self, app, resolve):
+        self.app = app
+        self.resolve = resolve
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        endpoint = self.resolve(scope)
+        status = [500]
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc(endpoint=endpoint)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_FLIGHT.dec(endpoint=endpoint)
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - start, method=scope['method'], endpoint=endpoint, status=status[0])
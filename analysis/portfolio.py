@@ -0,0 +1,187 @@
+"""Portfolio analytics over held positions.
+
+Positions are valued as held today (current quantities) over the requested
+range, so the equity curve answers "how has this portfolio behaved", not
+"how did my trading do". Everything is computed from one dates x symbols
+price matrix:
+
+    equity curve    prices @ quantities, with drawdown from the running peak
+    correlation     of the daily returns of every pair of positions
+    contribution    each position's share of the period's P&L (sums to the
+                    total return) and of the portfolio variance (sums to 1)
+    volatility      annualized with sqrt(252), like _compute_metrics' Sharpe
+    beta            against the benchmark's daily returns, for the portfolio
+                    and each position
+
+The matrix is aligned on the union of trading dates with each series carried
+forward over the others' holidays. It starts on the first date every
+position has a price.
+"""
+import math
+from datetime import datetime
+
+from lazy import LazyModule
+
+np = LazyModule('numpy', globals(), 'np')
+
+MAX_HOLDINGS = 200
+TRADING_DAYS = 252
+
+
+def parse_holdings(holdings):
+    """[{'symbol', 'quantity', 'cost_basis'}] merged by symbol, or raise ValueError.
+
+    cost_basis is the total cost of the position (IB's costBasis) and may be
+    omitted.
+    """
+    if not isinstance(holdings, list) or not holdings:
+        raise ValueError('holdings must be a non-empty list')
+    if len(holdings) > MAX_HOLDINGS:
+        raise ValueError(f'At most {MAX_HOLDINGS} holdings are supported')
+    merged = {}
+    for holding in holdings:
+        if not isinstance(holding, dict):
+            raise ValueError(f'Holding must be an object: {holding!r}')
+        symbol = str(holding.get('symbol') or '').strip().upper()
+        if not symbol:
+            raise ValueError('Every holding needs a symbol')
+        quantity = holding.get('quantity')
+        if isinstance(quantity, bool) or not isinstance(quantity, (int, float)) or not math.isfinite(quantity) or quantity == 0:
+            raise ValueError(f'{symbol}: quantity must be a non-zero number')
+        cost = holding.get('cost_basis', holding.get('costBasis'))
+        if cost is not None and (isinstance(cost, bool) or not isinstance(cost, (int, float)) or not math.isfinite(cost)):
+            raise ValueError(f'{symbol}: cost_basis must be a number')
+        entry = merged.setdefault(symbol, {'symbol': symbol, 'quantity': 0.0, 'cost_basis': 0.0})
+        entry['quantity'] += float(quantity)
+        entry['cost_basis'] = None if cost is None or entry['cost_basis'] is None else entry['cost_basis'] + float(cost)
+    return list(merged.values())
+
+
+def align(closes, symbols, benchmark=None):
+    """(dates, prices, benchmark prices) from a closes frame indexed by date.
+
+    prices is (dates, symbols) with no gaps; benchmark prices may hold NaN
+    before the benchmark's first bar, or be None.
+    """
+    frame = closes.sort_index().ffill()
+    held = frame[symbols].to_numpy(dtype=float)
+    complete = ~np.isnan(held).any(axis=1)
+    if not complete.any():
+        raise ValueError('The holdings have no trading dates in common')
+    start = int(complete.argmax())
+    bench = None
+    if benchmark and benchmark in frame.columns:
+        bench = frame[benchmark].to_numpy(dtype=float)[start:]
+    return list(frame.index[start:]), held[start:], bench
+
+
+def _rounded(values, digits):
+    return [None if not math.isfinite(v) else round(v, digits) for v in values.tolist()]
+
+
+def _betas(asset_returns, bench_returns):
+    """Beta of each column of asset_returns on bench_returns, over bars where both are known."""
+    known = ~np.isnan(bench_returns)
+    if known.sum() < 2:
+        return np.full(asset_returns.shape[1], np.nan)
+    a = asset_returns[known] - asset_returns[known].mean(axis=0)
+    b = bench_returns[known] - bench_returns[known].mean()
+    var = (b ** 2).sum()
+    return (a * b[:, None]).sum(axis=0) / var if var > 0 else np.full(asset_returns.shape[1], np.nan)
+
+
+def analyze(closes, positions, benchmark=None):
+    """Analytics for positions (from parse_holdings) over a closes frame.
+
+    Raises ValueError when there are fewer than two common dates or the
+    portfolio's net value is not positive throughout.
+    """
+    symbols = [p['symbol'] for p in positions]
+    dates, prices, bench = align(closes, symbols, benchmark)
+    if len(dates) < 2:
+        raise ValueError('Need at least two common trading dates')
+    quantities = np.array([p['quantity'] for p in positions])
+
+    values = prices * quantities
+    equity = values.sum(axis=1)
+    if (equity <= 0).any():
+        raise ValueError('Portfolio net value must stay positive over the range')
+    asset_returns = prices[1:] / prices[:-1] - 1
+    returns = equity[1:] / equity[:-1] - 1
+    weights = values[-1] / equity[-1]
+
+    peaks = np.maximum.accumulate(equity)
+    drawdown = (peaks - equity) / peaks
+    trough = int(drawdown.argmax())
+    peak = int(equity[:trough + 1].argmax())
+
+    std = returns.std()
+    years = 0.0
+    try:
+        years = (datetime.strptime(dates[-1], '%Y-%m-%d') - datetime.strptime(dates[0], '%Y-%m-%d')).days / 365.25
+    except ValueError:
+        pass
+    growth = equity[-1] / equity[0]
+
+    # Variance share: w_i (Cov w)_i / w'Cov w
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = np.atleast_2d(np.cov(asset_returns, rowvar=False))
+        portfolio_var = weights @ cov @ weights
+        risk_share = weights * (cov @ weights) / portfolio_var if portfolio_var > 0 else np.full(len(symbols), np.nan)
+        correlation = np.atleast_2d(np.corrcoef(asset_returns, rowvar=False))
+
+    bench_returns = None
+    if bench is not None:
+        bench_returns = bench[1:] / bench[:-1] - 1
+    betas = _betas(asset_returns, bench_returns) if bench_returns is not None else np.full(len(symbols), np.nan)
+    portfolio_beta = _betas(returns[:, None], bench_returns)[0] if bench_returns is not None else np.nan
+
+    pnl = values[-1] - values[0]
+    vols = asset_returns.std(axis=0) * math.sqrt(TRADING_DAYS) * 100
+    period_returns = (prices[-1] / prices[0] - 1) * 100
+    positions_out = []
+    for i, p in enumerate(positions):
+        market_value = float(values[-1, i])
+        cost = p['cost_basis']
+        positions_out.append({
+            'symbol': p['symbol'],
+            'quantity': p['quantity'],
+            'price': round(float(prices[-1, i]), 4),
+            'marketValue': round(market_value, 2),
+            'weight': round(float(weights[i]), 4),
+            'costBasis': cost,
+            'unrealizedPnl': None if cost is None else round(market_value - cost, 2),
+            'periodReturn': round(float(period_returns[i]), 2),
+            'volatility': round(float(vols[i]), 2),
+            'beta': _rounded(betas[i:i + 1], 3)[0],
+            'returnContribution': round(float(pnl[i] / equity[0] * 100), 2),
+            'riskContribution': _rounded(risk_share[i:i + 1], 4)[0],
+        })
+
+    return {
+        'start': dates[0],
+        'end': dates[-1],
+        'bars': len(dates),
+        'benchmark': benchmark if bench is not None else None,
+        'summary': {
+            'value': round(float(equity[-1]), 2),
+            'totalReturn': round(float((growth - 1) * 100), 2),
+            'cagr': round(float((growth ** (1 / years) - 1) * 100), 2) if years > 0 else 0.0,
+            'volatility': round(float(std * math.sqrt(TRADING_DAYS) * 100), 2),
+            'sharpe': round(float(returns.mean() / std * math.sqrt(TRADING_DAYS)), 2) if std > 0 else 0.0,
+            'beta': _rounded(np.array([portfolio_beta]), 3)[0],
+            'maxDrawdown': round(float(drawdown[trough] * 100), 2),
+            'maxDrawdownPeak': dates[peak],
+            'maxDrawdownTrough': dates[trough],
+            'currentDrawdown': round(float(drawdown[-1] * 100), 2),
+        },
+        'positions': positions_out,
+        'correlation': {
+            'symbols': symbols,
+            'matrix': [_rounded(row, 4) for row in correlation],
+        },
+        'equityCurve': [
+            {'date': d, 'value': v, 'drawdown': dd}
+            for d, v, dd in zip(dates, _rounded(equity, 2), _rounded(drawdown * 100, 2))
+        ],
+    }
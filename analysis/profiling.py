@@ -0,0 +1,109 @@
+"""Opt-in per-request profiling.
+
+A request asks for a profile with an ``X-Profile: 1`` header or a
+``?profile=1`` query flag; the service only honours it when
+ENABLE_PROFILING=1 is set. The call runs under cProfile and the ranked
+report is kept in a small in-memory store under an id, returned to the
+client in the ``X-Profile-Id`` response header and readable at
+``GET /profiles/{id}``.
+
+profile_call() is process-local, so the backtest worker runs it itself and
+ships the report back with its result.
+"""
+import cProfile
+import os
+import pstats
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+PROFILING_ENABLED = os.environ.get('ENABLE_PROFILING', '').lower() in ('1', 'true', 'yes')
+PROFILE_STORE_SIZE = 50
+REPORT_LIMIT = 30
+
+# Only one cProfile profiler can be active per interpreter
+_profiler_lock = threading.Lock()
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+def profile_requested(headers, query_params):
+    flag = headers.get('x-profile') or query_params.get('profile') or ''
+    return flag.lower() in ('1', 'true', 'yes')
+
+
+def _function_name(key):
+    filename, line, name = key
+    if filename == '~':
+        return name  # built-in
+    return f'{name} ({os.path.basename(filename)}:{line})'
+
+
+def summarize(profiler, wall_seconds, limit=REPORT_LIMIT):
+    """Rank profiled functions by cumulative time and by self time."""
+    stats = pstats.Stats(profiler)
+    rows = []
+    for key, (primitive, calls, self_time, cumulative, _) in stats.stats.items():
+        rows.append({
+            'function': _function_name(key),
+            'calls': calls,
+            'primitiveCalls': primitive,
+            'selfSeconds': round(self_time, 6),
+            'cumulativeSeconds': round(cumulative, 6),
+        })
+    return {
+        'wallSeconds': round(wall_seconds, 6),
+        'totalCalls': stats.total_calls,
+        'cumulative': sorted(rows, key=lambda r: r['cumulativeSeconds'], reverse=True)[:limit],
+        'self': sorted(rows, key=lambda r: r['selfSeconds'], reverse=True)[:limit],
+    }
+
+
+def profile_call(fn, *args, **kwargs):
+    """Run fn under cProfile; return (result, report). Raises ProfilerBusy."""
+    if not _profiler_lock.acquire(blocking=False):
+        raise ProfilerBusy('Another request is already being profiled')
+    try:
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+        return result, summarize(profiler, time.perf_counter() - start)
+    finally:
+        _profiler_lock.release()
+
+
+class ProfileStore:
+    """Most recent profile reports by id."""
+
+    def __init__(self, max_entries=PROFILE_STORE_SIZE):
+        self.max_entries = max_entries
+        self._reports = OrderedDict()
+        self._lock = threading.Lock()
+
+    def save(self, report, **context):
+        profile_id = uuid.uuid4().hex[:12]
+        entry = {'id': profile_id, 'createdAt': datetime.now().isoformat(timespec='seconds'), **context, **report}
+        with self._lock:
+            self._reports[profile_id] = entry
+            while len(self._reports) > self.max_entries:
+                self._reports.popitem(last=False)
+        return profile_id
+
+    def get(self, profile_id):
+        return self._reports.get(profile_id)
+
+    def list(self):
+        with self._lock:
+            entries = list(self._reports.values())
+        return [
+            {k: e.get(k) for k in ('id', 'createdAt', 'endpoint', 'params', 'wallSeconds')}
+            for e in reversed(entries)
+        ]
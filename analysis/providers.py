@@ -0,0 +1,218 @@
+"""Market data providers behind the history, price and fundamentals calls.
+
+A provider has a ``name`` and two methods:
+
+    history(symbol, period, interval) -> DataFrame indexed by bar time with
+        Open/High/Low/Close/Volume columns (yfinance's Ticker.history shape)
+    info(symbol) -> dict of yfinance-style info fields (marketCap, trailingPE...)
+    closes(symbols, period, interval) -> DataFrame of Close prices, one column
+        per symbol, fetched in one batched call where the source allows it
+
+STOCK_DATA_PROVIDER selects the implementation: ``yahoo`` (default) or
+``synthetic``, a deterministic generator that needs no network and is what the
+benchmarks and load tests run against.
+"""
+import math
+import os
+import re
+import zlib
+from functools import lru_cache
+
+from lazy import LazyModule
+
+np = LazyModule('numpy', globals(), 'np')
+pd = LazyModule('pandas', globals(), 'pd')
+
+TRADING_DAYS_PER_YEAR = 252
+
+# ── Yahoo ───────────────────────────────────────────────────────────────────
+
+
+class YahooProvider:
+    name = 'yahoo'
+    cache_id = 'yahoo'
+
+    def history(self, symbol, period, interval='1d'):
+        import yfinance as yf
+        return yf.Ticker(symbol).history(period=period, interval=interval)
+
+    def info(self, symbol):
+        import yfinance as yf
+        return yf.Ticker(symbol).info or {}
+
+    def closes(self, symbols, period, interval='1d'):
+        import yfinance as yf
+        # One download for every symbol; adjusted like Ticker.history
+        data = yf.download(
+            list(symbols), period=period, interval=interval, auto_adjust=True,
+            group_by='column', progress=False, threads=True,
+        )
+        if data.empty:
+            return pd.DataFrame(columns=list(symbols), dtype=float)
+        closes = data['Close']
+        if isinstance(closes, pd.Series):
+            closes = closes.to_frame(symbols[0])
+        return closes.reindex(columns=list(symbols))
+
+
+# ── Synthetic ───────────────────────────────────────────────────────────────
+
+# Bars per regular trading session (6.5 hours)
+_BARS_PER_DAY = {
+    '1m': 390, '2m': 195, '5m': 78, '15m': 26, '30m': 13, '60m': 7, '1h': 7, '90m': 5,
+    '1d': 1, '5d': 1 / 5, '1wk': 1 / 5, '1mo': 1 / 21, '3mo': 1 / 63,
+}
+_INTRADAY_MINUTES = {'1m': 1, '2m': 2, '5m': 5, '15m': 15, '30m': 30, '60m': 60, '1h': 60, '90m': 90}
+_PERIOD_UNITS = {'d': 1, 'wk': 5, 'mo': 21, 'y': TRADING_DAYS_PER_YEAR}
+_PERIOD_RE = re.compile(r'^(\d+)(d|wk|mo|y)$')
+_SECTORS = [
+    ('Technology', 'Software—Infrastructure'), ('Technology', 'Semiconductors'),
+    ('Healthcare', 'Drug Manufacturers—General'), ('Financial Services', 'Banks—Diversified'),
+    ('Consumer Cyclical', 'Internet Retail'), ('Energy', 'Oil & Gas Integrated'),
+    ('Industrials', 'Aerospace & Defense'), ('Utilities', 'Utilities—Regulated Electric'),
+]
+
+
+def _trading_days(period, interval, max_years):
+    if period == 'max':
+        # Yahoo keeps about 60 days of sub-hourly bars and 730 days of hourly ones
+        if interval in _INTRADAY_MINUTES:
+            return 730 if _INTRADAY_MINUTES[interval] >= 60 else 60
+        return max_years * TRADING_DAYS_PER_YEAR
+    if period == 'ytd':
+        today = pd.Timestamp.today()
+        return max(1, int((today - pd.Timestamp(year=today.year, month=1, day=1)).days * 5 / 7))
+    m = _PERIOD_RE.match(period)
+    if not m:
+        raise ValueError(f'Unsupported period: {period}')
+    return int(m.group(1)) * _PERIOD_UNITS[m.group(2)]
+
+
+def _bar_index(interval, bars, end):
+    tz = 'America/New_York'
+    if interval in _INTRADAY_MINUTES:
+        minutes = _INTRADAY_MINUTES[interval]
+        per_day = _BARS_PER_DAY[interval]
+        days = pd.bdate_range(end=end, periods=math.ceil(bars / per_day))
+        offsets = pd.to_timedelta(570 + minutes * np.arange(per_day), unit='m')  # from 09:30
+        stamps = (days.values[:, None] + offsets.values[None, :]).ravel()[-bars:]
+        return pd.DatetimeIndex(stamps).tz_localize(tz)
+    freq = {'1wk': 'W-MON', '5d': 'W-MON', '1mo': 'MS', '3mo': 'QS'}.get(interval, 'B')
+    return pd.date_range(end=end, periods=bars, freq=freq, tz=tz)
+
+
+@lru_cache(maxsize=64)
+def _synthetic_bars(symbol, interval, seed, max_years, end):
+    """Full synthetic history for (symbol, interval); periods take its tail."""
+    per_day = _BARS_PER_DAY[interval]
+    bars = max(2, round(_trading_days('max', interval, max_years) * per_day))
+    rng = np.random.default_rng([zlib.crc32(symbol.encode()), zlib.crc32(interval.encode()), seed])
+
+    # Geometric random walk with slowly drifting volatility regimes and
+    # fat-tailed (Student t, 4 dof) shocks, scaled to the bar length
+    annual_drift = rng.uniform(0.02, 0.14)
+    daily_vol = rng.uniform(0.008, 0.022)
+    noise = rng.normal(0, 1, bars)
+    noise[0] = 0.0
+    regime = pd.Series(noise).ewm(alpha=0.01, adjust=False).mean().to_numpy()
+    vol = daily_vol * np.exp(3.0 * regime) / math.sqrt(per_day)
+    shocks = np.clip(rng.standard_t(4, bars) / math.sqrt(2), -8, 8)
+    returns = annual_drift / TRADING_DAYS_PER_YEAR / per_day - 0.5 * vol ** 2 + vol * shocks
+    close = rng.uniform(10, 400) * np.exp(np.cumsum(returns))
+
+    gaps = np.exp(rng.normal(0, 0.3, bars) * vol)
+    open_ = np.concatenate(([close[0] / math.exp(returns[0])], close[:-1])) * gaps
+    high = np.maximum(open_, close) * np.exp(np.abs(rng.normal(0, 0.6, bars)) * vol)
+    low = np.minimum(open_, close) * np.exp(-np.abs(rng.normal(0, 0.6, bars)) * vol)
+    # Volume rises with the size of the move
+    base_volume = rng.uniform(5e5, 5e7) / per_day
+    volume = base_volume * np.exp(rng.normal(0, 0.35, bars) + 20 * np.abs(returns))
+
+    return pd.DataFrame({
+        'Open': np.round(open_, 4),
+        'High': np.round(high, 4),
+        'Low': np.round(low, 4),
+        'Close': np.round(close, 4),
+        'Volume': np.maximum(1, volume).astype(np.int64),
+        'Dividends': 0.0,
+        'Stock Splits': 0.0,
+    }, index=_bar_index(interval, bars, end))
+
+
+class SyntheticProvider:
+    """Deterministic OHLCV: the same symbol, interval and seed always yield the same bars.
+
+    ``end`` pins the date of the last bar (defaults to today); prices do not
+    depend on it. ``max_years`` is the daily length served for period='max'.
+    """
+
+    name = 'synthetic'
+
+    def __init__(self, seed=0, max_years=40, end=None):
+        self.seed = seed
+        self.max_years = max_years
+        self.end = end
+
+    @property
+    def cache_id(self):
+        """Distinguishes configurations in shared cache keys."""
+        return f'synthetic-{self.seed}-{self.max_years}-{self.end}'
+
+    def history(self, symbol, period, interval='1d'):
+        if interval not in _BARS_PER_DAY:
+            raise ValueError(f'Unsupported interval: {interval}')
+        end = str(pd.Timestamp(self.end or pd.Timestamp.today()).date())
+        full = _synthetic_bars(symbol.upper(), interval, self.seed, self.max_years, end)
+        bars = max(1, round(_trading_days(period, interval, self.max_years) * _BARS_PER_DAY[interval]))
+        return full.iloc[-bars:].copy()
+
+    def closes(self, symbols, period, interval='1d'):
+        return pd.DataFrame({symbol: self.history(symbol, period, interval)['Close'] for symbol in symbols})
+
+    def info(self, symbol):
+        symbol = symbol.upper()
+        daily = self.history(symbol, '1y', '1d')
+        rng = np.random.default_rng([zlib.crc32(symbol.encode()), self.seed, 1])
+        price = float(daily['Close'].iloc[-1])
+        eps = round(price / rng.uniform(8, 60), 2)
+        sector, industry = _SECTORS[zlib.crc32(symbol.encode()) % len(_SECTORS)]
+        return {
+            'symbol': symbol,
+            'shortName': f'{symbol} Synthetic Inc.',
+            'marketCap': int(10 ** rng.uniform(9, 12.5)),
+            'trailingPE': round(price / eps, 2),
+            'forwardPE': round(price / (eps * rng.uniform(1.0, 1.3)), 2),
+            'trailingEps': eps,
+            'dividendYield': round(float(rng.uniform(0, 0.04)), 4),
+            'sector': sector,
+            'industry': industry,
+            'beta': round(float(rng.uniform(0.5, 1.8)), 2),
+            'fiftyTwoWeekLow': round(float(daily['Low'].min()), 2),
+            'fiftyTwoWeekHigh': round(float(daily['High'].max()), 2),
+            'averageVolume': int(daily['Volume'].iloc[-63:].mean()),
+        }
+
+
+# ── Selection ───────────────────────────────────────────────────────────────
+
+PROVIDERS = {'yahoo': YahooProvider, 'synthetic': SyntheticProvider}
+
+_provider = None
+
+
+def get_provider():
+    """The process-wide provider, created from STOCK_DATA_PROVIDER on first use."""
+    global _provider
+    if _provider is None:
+        name = os.environ.get('STOCK_DATA_PROVIDER', 'yahoo').lower()
+        if name not in PROVIDERS:
+            raise ValueError(f'Unknown STOCK_DATA_PROVIDER: {name}')
+        _provider = PROVIDERS[name]()
+    return _provider
+
+
+def set_provider(provider):
+    """Swap the process-wide provider (benchmarks, tests); returns the previous one."""
+    global _provider
+    previous, _provider = _provider, provider
+    return previous
@@ -0,0 +1,151 @@
+"""Live quote fan-out: one upstream poller per subscribed symbol.
+
+Every open watchlist used to poll /current_price on its own, so upstream
+traffic grew with the number of viewers. QuoteHub runs a single poller task
+per symbol that has at least one subscriber, pushes a quote to every
+subscriber only when it changed, and stops the poller as soon as the last
+subscriber for that symbol goes away.
+
+FakeQuoteSource is a deterministic random walk with the same payload shape as
+get_current_stock_price, for tests and offline development (QUOTE_SOURCE=fake).
+"""
+import asyncio
+import json
+import random
+import sys
+import time
+import zlib
+from datetime import datetime
+
+QUEUE_SIZE = 100
+
+
+def quote_fingerprint(quote):
+    """Fields that matter for dedup; the timestamp changes on every poll."""
+    return tuple(sorted((k, v) for k, v in quote.items() if k != 'timestamp'))
+
+
+def format_sse(data, event='quote'):
+    return f'event: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+
+
+class Subscription:
+    """One client's view of the hub: a bounded queue of quote dicts."""
+
+    def __init__(self, symbols):
+        self.symbols = set(symbols)
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def offer(self, quote):
+        # A slow client loses its oldest updates rather than stalling the poller
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(quote)
+
+    async def events(self, heartbeat=15.0):
+        """Yield SSE-formatted quotes, with a comment line when idle."""
+        while True:
+            try:
+                quote = await asyncio.wait_for(self.queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            yield format_sse(quote)
+
+
+class QuoteHub:
+    """Shares one poller per symbol across all subscribers."""
+
+    def __init__(self, fetch_quote, interval=15.0):
+        self.fetch_quote = fetch_quote
+        self.interval = interval
+        self._subscribers = {}   # symbol -> set of Subscription
+        self._pollers = {}       # symbol -> asyncio.Task
+        self._latest = {}        # symbol -> (fingerprint, quote, fetched_at)
+        self.upstream_calls = 0
+
+    def subscribe(self, symbols):
+        sub = Subscription(symbols)
+        for symbol in sub.symbols:
+            self._subscribers.setdefault(symbol, set()).add(sub)
+            latest = self._latest.get(symbol)
+            if latest:
+                sub.offer(latest[1])
+            if symbol not in self._pollers:
+                self._pollers[symbol] = asyncio.get_running_loop().create_task(self._poll(symbol))
+        return sub
+
+    def unsubscribe(self, sub):
+        for symbol in sub.symbols:
+            subs = self._subscribers.get(symbol)
+            if subs is None:
+                continue
+            subs.discard(sub)
+            if not subs:
+                del self._subscribers[symbol]
+                task = self._pollers.pop(symbol, None)
+                if task:
+                    task.cancel()
+                self._latest.pop(symbol, None)
+
+    def latest(self, symbol, max_age=None):
+        """Most recent quote for a polled symbol, or None if absent or stale."""
+        entry = self._latest.get(symbol)
+        if entry is None:
+            return None
+        if max_age is not None and time.monotonic() - entry[2] > max_age:
+            return None
+        return entry[1]
+
+    def symbols(self):
+        return sorted(self._pollers)
+
+    async def _poll(self, symbol):
+        while True:
+            try:
+                self.upstream_calls += 1
+                quote = await asyncio.to_thread(self.fetch_quote, symbol)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                quote = {'error': f'Error fetching current price: {str(e)}'}
+
+            if isinstance(quote, dict) and 'error' not in quote:
+                fingerprint = quote_fingerprint(quote)
+                previous = self._latest.get(symbol)
+                self._latest[symbol] = (fingerprint, quote, time.monotonic())
+                if previous is None or previous[0] != fingerprint:
+                    for sub in list(self._subscribers.get(symbol, ())):
+                        sub.offer(quote)
+            else:
+                print(f"[quotes] {symbol}: {quote.get('error') if isinstance(quote, dict) else quote}", file=sys.stderr)
+
+            await asyncio.sleep(self.interval)
+
+
+class FakeQuoteSource:
+    """Deterministic per-symbol random walk shaped like get_current_stock_price."""
+
+    def __init__(self, seed=0, volatility=0.002):
+        self.seed = seed
+        self.volatility = volatility
+        self._state = {}  # symbol -> (rng, previous_close, price)
+
+    def __call__(self, symbol):
+        symbol = symbol.upper()
+        if symbol not in self._state:
+            rng = random.Random(zlib.crc32(symbol.encode()) ^ self.seed)
+            base = round(rng.uniform(20, 500), 2)
+            self._state[symbol] = (rng, base, base)
+        rng, previous_close, price = self._state[symbol]
+        price = max(0.01, price * (1 + rng.gauss(0, self.volatility)))
+        self._state[symbol] = (rng, previous_close, price)
+        change = price - previous_close
+        return {
+            "symbol": symbol,
+            "price": round(price, 2),
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "previousClose": round(previous_close, 2),
+            "change": round(change, 2),
+            "changePercent": round(change / previous_close * 100, 2),
+        }
@@ -0,0 +1,201 @@
+"""Monte Carlo robustness analysis for backtest results.
+
+_compute_metrics gives one number per metric for the one price path that
+happened. This module asks how much of that is luck:
+
+  bootstrap     circular block bootstrap of the strategy's per-bar returns
+                (blocks keep short-range autocorrelation), giving a
+                distribution of Sharpe, max drawdown, CAGR and total return
+  permutation   the realised positions in random order, each compounding
+                its return on the balance it would have been opened with (a
+                backtest reinvests the whole balance); the final P&L is the
+                same for every order, so this isolates how deep the drawdown
+                could have been
+
+Every path is a row of a matrix. Paths are processed in chunks of rows so
+memory stays bounded, and each chunk is a handful of NumPy calls, with no
+Python loop over paths or bars. Metric formulas match _compute_metrics: the
+Sharpe ratio is annualized with sqrt(252), and CAGR uses the calendar span
+of the equity curve.
+"""
+import math
+from datetime import datetime
+
+from lazy import LazyModule
+
+np = LazyModule('numpy', globals(), 'np')
+
+DEFAULT_PATHS = 5000
+MAX_PATHS = 20000
+DEFAULT_CONFIDENCE = 0.95
+CHUNK_ELEMENTS = 2_000_000  # paths * bars per chunk
+
+
+def parse_options(options):
+    """Validated robustness options, or raise ValueError."""
+    options = dict(options or {})
+    unknown = set(options) - {'paths', 'block_size', 'confidence', 'seed'}
+    if unknown:
+        raise ValueError(f'Unknown robustness options: {sorted(unknown)}')
+    paths = options.get('paths', DEFAULT_PATHS)
+    if isinstance(paths, bool) or not isinstance(paths, int) or not 100 <= paths <= MAX_PATHS:
+        raise ValueError(f'robustness.paths must be an integer between 100 and {MAX_PATHS}')
+    block_size = options.get('block_size')
+    if block_size is not None and (isinstance(block_size, bool) or not isinstance(block_size, int) or block_size < 1):
+        raise ValueError('robustness.block_size must be a positive integer')
+    confidence = options.get('confidence', DEFAULT_CONFIDENCE)
+    if isinstance(confidence, bool) or not isinstance(confidence, (int, float)) or not 0.5 <= confidence < 1:
+        raise ValueError('robustness.confidence must be between 0.5 and 1')
+    seed = options.get('seed')
+    if seed is not None and (isinstance(seed, bool) or not isinstance(seed, int)):
+        raise ValueError('robustness.seed must be an integer')
+    return {'paths': paths, 'block_size': block_size, 'confidence': float(confidence), 'seed': seed}
+
+
+def _interval(samples, confidence):
+    tail = (1 - confidence) / 2 * 100
+    low, median, high = np.percentile(samples, [tail, 50, 100 - tail])
+    return {'low': round(float(low), 2), 'median': round(float(median), 2), 'high': round(float(high), 2)}
+
+
+def _max_drawdown_pct(equity):
+    """Max drawdown (%) of each row of an equity matrix."""
+    peaks = np.maximum.accumulate(equity, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        drawdown = np.where(peaks > 0, (peaks - equity) / peaks, 0.0)
+    return drawdown.max(axis=1) * 100
+
+
+def _chunks(n_paths, n_bars):
+    rows = max(1, CHUNK_ELEMENTS // max(n_bars, 1))
+    for start in range(0, n_paths, rows):
+        yield min(rows, n_paths - start)
+
+
+def _block_sums(values, block_size, tail):
+    """Sums of every circular block of values: full length, and the first tail bars."""
+    extended = np.concatenate([values, values[:block_size - 1]])
+    csum = np.concatenate([[0.0], np.cumsum(extended)])
+    starts = np.arange(len(values))
+    return csum[starts + block_size] - csum[starts], csum[starts + tail] - csum[starts]
+
+
+def block_bootstrap(returns, years, paths, block_size, rng):
+    """Metric samples over paths resampled from returns in circular blocks.
+
+    A path is n_blocks random block starts. Sums over a path (for the mean,
+    variance and total growth) come from precomputed per-block sums; only the
+    drawdown needs the bars themselves, gathered as contiguous blocks in log
+    space.
+    """
+    n = len(returns)
+    n_blocks = -(-n // block_size)
+    tail = n - (n_blocks - 1) * block_size  # bars used from the last block
+    log_returns = np.log1p(np.maximum(returns, -0.999999))  # a -100% bar would be log(0)
+    sums = [_block_sums(v, block_size, tail) for v in (returns, returns ** 2, log_returns)]
+    windows = np.lib.stride_tricks.sliding_window_view(
+        np.concatenate([log_returns, log_returns[:block_size - 1]]), block_size,
+    )
+
+    samples = {'sharpe': [], 'maxDrawdown': [], 'cagr': [], 'totalReturn': []}
+    for rows in _chunks(paths, n):
+        starts = rng.integers(0, n, size=(rows, n_blocks))
+        body, last = starts[:, :-1], starts[:, -1]
+        total, total_sq, total_log = (full[body].sum(axis=1) + part[last] for full, part in sums)
+
+        mean = total / n
+        std = np.sqrt(np.maximum(total_sq / n - mean ** 2, 0.0))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sharpe = np.where(std > 1e-12, mean / std * math.sqrt(252), 0.0)
+        growth = np.exp(total_log)
+        cagr = (growth ** (1 / years) - 1) * 100 if years > 0 else np.zeros(rows)
+
+        # Drawdown from the log equity path, which starts at 0 (= capital)
+        log_equity = np.cumsum(windows[starts].reshape(rows, -1)[:, :n], axis=1)
+        peaks = np.maximum(np.maximum.accumulate(log_equity, axis=1), 0.0)
+        max_drawdown = (1 - np.exp((log_equity - peaks).min(axis=1))) * 100
+
+        samples['sharpe'].append(sharpe)
+        samples['maxDrawdown'].append(np.maximum(max_drawdown, 0.0))
+        samples['cagr'].append(cagr)
+        samples['totalReturn'].append((growth - 1) * 100)
+    return {name: np.concatenate(parts) for name, parts in samples.items()}
+
+
+def position_returns(trades, capital):
+    """Return of each position on the balance it was opened with.
+
+    The partial exits of one position (DCA) share its entry and are summed,
+    so a position stays one unit when trades are reordered.
+    """
+    pnls, entries = [], []
+    for trade in trades:
+        entry = (trade.get('entryDate'), trade.get('entryPrice'))
+        if pnls and entries[-1] == entry:
+            pnls[-1] += trade['pnl']
+        else:
+            pnls.append(trade['pnl'])
+            entries.append(entry)
+    pnls = np.array(pnls, dtype=float)
+    balance = capital + np.concatenate([[0.0], np.cumsum(pnls)[:-1]])
+    returns = np.divide(pnls, balance, out=np.full(len(pnls), -1.0), where=balance > 0)
+    return np.maximum(returns, -1.0)  # a long position loses at most its balance
+
+
+def trade_permutations(returns, capital, paths, rng):
+    """Max drawdown (%) of the positions' returns compounded in random orders."""
+    result = []
+    for rows in _chunks(paths, len(returns)):
+        shuffled = rng.permuted(np.broadcast_to(returns, (rows, len(returns))), axis=1)
+        equity = capital * np.concatenate([np.ones((rows, 1)), np.cumprod(1 + shuffled, axis=1)], axis=1)
+        result.append(_max_drawdown_pct(equity))
+    return np.concatenate(result)
+
+
+def analyze(trades, equity_curve, capital, options=None):
+    """Confidence intervals for a backtest's metrics.
+
+    options: paths (default 5000), block_size (default n ** (1/3) bars),
+    confidence (default 0.95) and seed. Raises ValueError on bad options.
+    """
+    opts = parse_options(options)
+    values = np.array([e['value'] for e in equity_curve], dtype=float)
+    if len(values) < 3 or capital <= 0:
+        return {'error': 'Not enough equity history for robustness analysis'}
+    prev = values[:-1]
+    returns = np.divide(values[1:] - prev, prev, out=np.zeros(len(prev)), where=prev > 0)
+    returns = returns[prev > 0]
+    if len(returns) < 2:
+        return {'error': 'Not enough equity history for robustness analysis'}
+
+    years = 0.0
+    try:
+        first = datetime.strptime(equity_curve[0]['date'], '%Y-%m-%d')
+        last = datetime.strptime(equity_curve[-1]['date'], '%Y-%m-%d')
+        years = (last - first).days / 365.25
+    except ValueError:
+        pass
+
+    block_size = opts['block_size'] or max(1, round(len(returns) ** (1 / 3)))
+    block_size = min(block_size, len(returns))
+    confidence = opts['confidence']
+    rng = np.random.default_rng(opts['seed'])
+
+    boot = block_bootstrap(returns, years, opts['paths'], block_size, rng)
+    result = {
+        'paths': opts['paths'],
+        'confidence': confidence,
+        'bootstrap': {
+            'blockSize': block_size,
+            **{name: _interval(samples, confidence) for name, samples in boot.items()},
+            'probLoss': round(float((boot['totalReturn'] < 0).mean()), 4),
+        },
+        'permutation': None,
+    }
+    positions = position_returns(trades, capital) if trades else np.empty(0)
+    if len(positions) >= 2:
+        drawdowns = trade_permutations(positions, capital, opts['paths'], rng)
+        result['permutation'] = {
+            'trades': len(trades), 'positions': len(positions), 'maxDrawdown': _interval(drawdowns, confidence),
+        }
+    return result
@@ -0,0 +1,160 @@
+"""Declarative strategy rules compiled to NumPy boolean masks.
+
+A rule is a JSON tree, never code:
+
+    {"left": "Close", "op": ">", "right": "MA_200"}            comparison
+    {"left": "MA_50", "op": "crosses_above", "right": "MA_150"} cross-over
+    {"all": [rule, ...]}  {"any": [rule, ...]}  {"not": rule}  combinators
+
+Operands are numbers, column names (price columns or indicator specs such as
+"MA_200" or "RSI_14"), or {"column": "MA_200", "offset": 22} for the value 22
+bars earlier. A comparison may also carry "offset": n to evaluate it as of n
+bars earlier.
+
+compile_rule() turns a tree into one array per bar with three-valued logic:
+a comparison whose operands are missing (NaN, or before the first bar) is
+unknown rather than false, so {"not": ...} of an unknown stays unknown.
+Only bars where the rule is known to be true count as signals. The whole
+tree is evaluated once per backtest, so extra conditions add array work, not
+per-bar Python work.
+"""
+from lazy import LazyModule
+
+np = LazyModule('numpy', globals(), 'np')
+
+RULE_OPS = {
+    '>': lambda a, b: a > b,
+    '<': lambda a, b: a < b,
+    '>=': lambda a, b: a >= b,
+    '<=': lambda a, b: a <= b,
+}
+CROSS_OPS = ('crosses_above', 'crosses_below')
+COMBINATORS = ('all', 'any', 'not')
+MAX_DEPTH = 16
+MAX_OFFSET = 10000
+
+
+def _offset(value):
+    if isinstance(value, bool) or not isinstance(value, int) or not 0 <= value <= MAX_OFFSET:
+        raise ValueError(f'Rule offset must be an integer between 0 and {MAX_OFFSET}: {value!r}')
+    return value
+
+
+def _operand_parts(operand):
+    """(number or column name, offset) for a rule operand."""
+    if isinstance(operand, dict):
+        if set(operand) - {'column', 'offset'} or 'column' not in operand:
+            raise ValueError(f'Invalid rule operand: {operand!r}')
+        return _operand_parts(operand['column'])[0], _offset(operand.get('offset', 0))
+    if isinstance(operand, (int, float, str)):
+        return operand, 0
+    raise ValueError(f'Invalid rule operand: {operand!r}')
+
+
+def _walk(rule, depth=0):
+    """Validate the tree and yield its comparison nodes."""
+    if depth > MAX_DEPTH:
+        raise ValueError(f'Rules nest deeper than {MAX_DEPTH} levels')
+    if not isinstance(rule, dict):
+        raise ValueError(f'Rule must be an object: {rule!r}')
+    kinds = [key for key in COMBINATORS if key in rule]
+    if kinds:
+        if len(kinds) > 1 or len(rule) > 1:
+            raise ValueError(f'Combinator rule must have exactly one of all/any/not: {rule!r}')
+        children = rule[kinds[0]]
+        if kinds[0] == 'not':
+            children = [children]
+        elif not isinstance(children, list) or not children:
+            raise ValueError(f"'{kinds[0]}' needs a non-empty list of rules")
+        for child in children:
+            yield from _walk(child, depth + 1)
+        return
+    if rule.get('op') not in RULE_OPS and rule.get('op') not in CROSS_OPS:
+        raise ValueError(f"Unknown rule op: {rule.get('op')!r}")
+    if 'left' not in rule or 'right' not in rule:
+        raise ValueError(f'Comparison rule needs left and right: {rule!r}')
+    if set(rule) - {'left', 'op', 'right', 'offset'}:
+        raise ValueError(f'Unknown keys in rule: {sorted(set(rule) - {"left", "op", "right", "offset"})}')
+    _offset(rule.get('offset', 0))
+    yield rule
+
+
+def comparisons(rule):
+    """The comparison nodes of a rule tree; raises ValueError if the tree is invalid."""
+    return list(_walk(rule))
+
+
+def rule_columns(rule):
+    """Column names (price columns and indicator specs) a rule reads."""
+    columns = []
+    for node in comparisons(rule):
+        for key in ('left', 'right'):
+            value, _ = _operand_parts(node[key])
+            if isinstance(value, str) and value not in columns:
+                columns.append(value)
+    return columns
+
+
+def _shift(values, n):
+    if n == 0:
+        return values
+    out = np.full(len(values), np.nan)
+    if n < len(values):
+        out[n:] = values[:-n]
+    return out
+
+
+def _operand(df, operand, n):
+    value, offset = _operand_parts(operand)
+    if isinstance(value, str):
+        # A column the frame does not have is unknown on every bar
+        values = df[value].to_numpy(dtype=float) if value in df.columns else np.full(n, np.nan)
+    else:
+        values = np.full(n, float(value))
+    return _shift(values, offset)
+
+
+def _compile(df, rule, n):
+    """(known true, known false) masks for rule over the n rows of df."""
+    if 'all' in rule or 'any' in rule:
+        parts = [_compile(df, child, n) for child in rule.get('all', rule.get('any'))]
+        trues = np.array([t for t, _ in parts])
+        falses = np.array([f for _, f in parts])
+        if 'all' in rule:
+            return trues.all(axis=0), falses.any(axis=0)
+        return trues.any(axis=0), falses.all(axis=0)
+    if 'not' in rule:
+        true, false = _compile(df, rule['not'], n)
+        return false, true
+
+    left = _operand(df, rule['left'], n)
+    right = _operand(df, rule['right'], n)
+    with np.errstate(invalid='ignore'):
+        if rule['op'] in CROSS_OPS:
+            # Compared with the previous bar: left moved from <= right to > right
+            if rule['op'] == 'crosses_below':
+                left, right = right, left
+            prev_left, prev_right = _shift(left, 1), _shift(right, 1)
+            known = ~(np.isnan(left) | np.isnan(right) | np.isnan(prev_left) | np.isnan(prev_right))
+            result = (left > right) & (prev_left <= prev_right)
+        else:
+            known = ~(np.isnan(left) | np.isnan(right))
+            result = RULE_OPS[rule['op']](left, right)
+    offset = rule.get('offset', 0)
+    true, false = known & result, known & ~result
+    if offset:
+        true, false = _shift_mask(true, offset), _shift_mask(false, offset)
+    return true, false
+
+
+def _shift_mask(mask, n):
+    out = np.zeros(len(mask), dtype=bool)
+    if n < len(mask):
+        out[n:] = mask[:-n]
+    return out
+
+
+def compile_rule(df, rule):
+    """Boolean array: True on the rows of df where rule is known to hold."""
+    comparisons(rule)  # validate before touching data
+    return _compile(df, rule, len(df))[0]
@@ -0,0 +1,283 @@
+"""Server-side stock screener over a universe of symbols.
+
+ScreenUniverse keeps, for every symbol it has seen, the trailing SEED_BARS
+bars of its daily history as one row of a symbols x bars matrix (closes;
+volumes, highs and lows only as deep as a column needs). The latest value of
+every SCREEN_COLUMNS column is computed from those matrices with NumPy
+across all rows at once, and stored in a symbols x columns matrix. A screen
+gathers the requested rows of that matrix and evaluates the condition tree
+over them in one vectorized pass (rules.compile_rule with symbols as rows).
+
+A refresh reloads only symbols whose rows are older than max_age. Of those,
+only the ones whose history actually changed (a new or revised bar) have
+their window rows and latest values recomputed.
+
+The columns match the chart's (incremental.compute_full) on the last bar:
+moving averages and extremes are NaN until their window is full, and up-day
+counts need as many bars as their window. Conditions use the backtest rule
+syntax restricted to latest values: comparisons with the RULE_OPS operators,
+combined with all/any/not. Offsets and cross-overs need a bar history and are
+rejected.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from incremental import (
+    CHART_COLUMNS, CLOSE_MA_PERIODS, EXTREMES, FEATURE_COLUMNS, PRICE_CHANGE_LAGS, SEED_BARS, UPTREND_WINDOWS,
+    VOLUME_MA_PERIODS,
+)
+from indicators import data_version
+from lazy import LazyModule
+from rules import RULE_OPS, comparisons, compile_rule, rule_columns
+
+np = LazyModule('numpy', globals(), 'np')
+pd = LazyModule('pandas', globals(), 'pd')
+
+BAR_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+DERIVED_COLUMNS = ['Dollar_Volume', 'Pct_above_52week_low', 'Pct_below_52week_high']
+SCREEN_COLUMNS = BAR_COLUMNS + CHART_COLUMNS + FEATURE_COLUMNS + DERIVED_COLUMNS
+_COLUMN_INDEX = {col: i for i, col in enumerate(SCREEN_COLUMNS)}
+
+# Deepest High/Low window (Month_High/Month_Low)
+_RANGE_BARS = max(window for source, window, _ in EXTREMES.values() if source != 'Close')
+_VOLUME_BARS = max(VOLUME_MA_PERIODS)
+
+MAX_SYMBOLS = 5000  # per screen
+UNIVERSE_CAPACITY = 10000  # rows kept; least recently screened are evicted
+FETCH_WORKERS = 8
+DEFAULT_LIMIT = 50
+
+
+def parse_symbols(symbols):
+    """Upper-cased, de-duplicated symbols, or raise ValueError."""
+    if not isinstance(symbols, list) or not symbols:
+        raise ValueError('symbols must be a non-empty list')
+    parsed = list(dict.fromkeys(str(s).strip().upper() for s in symbols if str(s).strip()))
+    if len(parsed) > MAX_SYMBOLS:
+        raise ValueError(f'At most {MAX_SYMBOLS} symbols can be screened at once')
+    return parsed
+
+
+def validate_conditions(conditions):
+    """Columns a screen condition tree reads; raises ValueError if it is not screenable."""
+    for node in comparisons(conditions):
+        if node['op'] not in RULE_OPS:
+            raise ValueError(f"Screen conditions support {sorted(RULE_OPS)}, not {node['op']!r}")
+        if node.get('offset') or isinstance(node['left'], dict) or isinstance(node['right'], dict):
+            raise ValueError('Screen conditions compare latest values; offsets are not supported')
+    columns = rule_columns(conditions)
+    unknown = [col for col in columns if col not in _COLUMN_INDEX]
+    if unknown:
+        raise ValueError(f'Unknown screen columns: {unknown}')
+    return columns
+
+
+# ── Latest values ───────────────────────────────────────────────────────────
+
+def _tail(values, width):
+    """values right-aligned in a row of width, NaN-padded on the left."""
+    row = np.full(width, np.nan)
+    tail = values[-width:]
+    row[width - len(tail):] = tail
+    return row
+
+
+def _rolling_mean(values, window):
+    """Trailing means along axis 1; NaN where the window holds a NaN or is short."""
+    filled = np.nan_to_num(values)
+    sums = np.concatenate([np.zeros((len(values), 1)), np.cumsum(filled, axis=1)], axis=1)
+    nans = np.concatenate([np.zeros((len(values), 1)), np.cumsum(np.isnan(values), axis=1)], axis=1)
+    means = (sums[:, window:] - sums[:, :-window]) / window
+    means[(nans[:, window:] - nans[:, :-window]) > 0] = np.nan
+    return means
+
+
+def _up_days(values, window, bars):
+    """Count of rises over the last window bars; NaN for rows with fewer bars."""
+    with np.errstate(invalid='ignore'):
+        rises = (values[:, -window:] - values[:, -window - 1:-1]) > 0
+    return np.where(bars >= window, rises.sum(axis=1), np.nan)
+
+
+def latest_values(close, high, low, volume, open_, bars):
+    """(rows, SCREEN_COLUMNS) latest values from trailing bar windows.
+
+    close is (rows, SEED_BARS), volume (rows, 90), high and low (rows, 22),
+    open_ the last open and bars each row's total history length.
+    """
+    out = np.full((len(close), len(SCREEN_COLUMNS)), np.nan)
+
+    def put(col, values):
+        out[:, _COLUMN_INDEX[col]] = values
+
+    last = close[:, -1]
+    for col, values in (('Open', open_), ('High', high[:, -1]), ('Low', low[:, -1]),
+                        ('Close', last), ('Volume', volume[:, -1])):
+        put(col, values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for period in CLOSE_MA_PERIODS:
+            put(f'{period}MA', close[:, -period:].mean(axis=1))
+        for period in VOLUME_MA_PERIODS:
+            put(f'Volume_{period}MA', volume[:, -period:].mean(axis=1))
+
+        volume_20ma = _rolling_mean(volume[:, -30:], 20)  # last 11 bars
+        put('Volume_20MA_uptrend_count', _up_days(volume_20ma, 10, bars))
+        ma200 = _rolling_mean(close, 200)  # last SEED_BARS - 199 bars
+        for col, window in UPTREND_WINDOWS.items():
+            put(col, _up_days(ma200, window, bars))
+        put('MA200_month_ago', ma200[:, -23])
+
+        put('52week_low', close[:, -252:].min(axis=1))
+        put('52week_high', close[:, -252:].max(axis=1))
+        put('Week_High', high[:, -5:].max(axis=1))
+        put('Week_Low', low[:, -5:].min(axis=1))
+        put('Month_High', high[:, -22:].max(axis=1))
+        put('Month_Low', low[:, -22:].min(axis=1))
+        for col, lag in PRICE_CHANGE_LAGS.items():
+            previous = close[:, -1 - lag]
+            put(col, (last - previous) / previous * 100)
+        changes = close[:, -22:] - close[:, -23:-1]
+        put('Price_rise_days_month', np.where(bars >= 22, (changes > 0).sum(axis=1), np.nan))
+        put('Price_fall_days_month', np.where(bars >= 22, (changes < 0).sum(axis=1), np.nan))
+
+        put('Dollar_Volume', last * volume[:, -1])
+        low_52, high_52 = out[:, _COLUMN_INDEX['52week_low']], out[:, _COLUMN_INDEX['52week_high']]
+        put('Pct_above_52week_low', np.where(low_52 > 0, (last / low_52 - 1) * 100, np.nan))
+        put('Pct_below_52week_high', np.where(high_52 > 0, (1 - last / high_52) * 100, np.nan))
+    return out
+
+
+# ── Universe ────────────────────────────────────────────────────────────────
+
+class ScreenUniverse:
+    """Trailing bars and latest screen values for up to ``capacity`` symbols."""
+
+    def __init__(self, capacity=UNIVERSE_CAPACITY):
+        self.capacity = capacity
+        self._entries = OrderedDict()  # symbol -> entry, least recently screened first
+        self._lock = threading.Lock()
+        self._rows = 0  # allocated matrix rows; grown by doubling up to capacity
+        self.updates = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _grow(self, needed):
+        rows = min(self.capacity, max(needed, 2 * self._rows, 64))
+        shapes = {
+            'close': SEED_BARS, 'volume': _VOLUME_BARS, 'high': _RANGE_BARS, 'low': _RANGE_BARS,
+            'values': len(SCREEN_COLUMNS),
+        }
+        for name, width in shapes.items():
+            grown = np.full((rows, width), np.nan)
+            if self._rows:
+                grown[:self._rows] = getattr(self, '_' + name)
+            setattr(self, '_' + name, grown)
+        for name in ('open', 'bars'):
+            grown = np.full(rows, np.nan)
+            if self._rows:
+                grown[:self._rows] = getattr(self, '_' + name)
+            setattr(self, '_' + name, grown)
+        self._rows = rows
+
+    def _slot(self):
+        if len(self._entries) < self.capacity:
+            if len(self._entries) >= self._rows:
+                self._grow(len(self._entries) + 1)
+            return len(self._entries)
+        _, evicted = self._entries.popitem(last=False)
+        return evicted['slot']
+
+    def refresh(self, symbols, load, max_age):
+        """Reload rows older than max_age seconds; load(symbol) returns daily OHLCV.
+
+        Histories are loaded in a thread pool, since loading is mostly
+        waiting on the provider. Rows whose history changed are recomputed
+        together. Returns (rows recomputed, symbols without data).
+        """
+        now = time.monotonic()
+        with self._lock:
+            for symbol in symbols:
+                if symbol in self._entries:
+                    self._entries.move_to_end(symbol)
+            stale = [s for s in symbols if s not in self._entries or now - self._entries[s]['refreshed'] > max_age]
+
+        def fetch(symbol):
+            try:
+                return symbol, load(symbol)
+            except Exception:
+                return symbol, None
+
+        dirty, missing = [], []
+        if stale:
+            with ThreadPoolExecutor(min(FETCH_WORKERS, len(stale))) as pool:
+                loaded = list(pool.map(fetch, stale))
+            with self._lock:
+                for symbol, hist in loaded:
+                    entry = self._entries.get(symbol)
+                    if hist is None or hist.empty:
+                        if entry is None:
+                            missing.append(symbol)
+                        continue
+                    version = data_version(hist)
+                    if entry is not None and entry['version'] == version:
+                        entry['refreshed'] = now
+                        continue
+                    if entry is None:
+                        entry = self._entries[symbol] = {'slot': self._slot()}
+                    entry.update(version=version, refreshed=now, date=str(hist.index[-1])[:10])
+                    self._store(entry['slot'], hist)
+                    dirty.append(entry['slot'])
+                if dirty:
+                    slots = np.array(dirty, dtype=np.intp)
+                    self._values[slots] = latest_values(
+                        self._close[slots], self._high[slots], self._low[slots],
+                        self._volume[slots], self._open[slots], self._bars[slots],
+                    )
+                    self.updates += len(dirty)
+        return len(dirty), missing
+
+    def _store(self, slot, hist):
+        self._close[slot] = _tail(hist['Close'].to_numpy(dtype=float), SEED_BARS)
+        self._volume[slot] = _tail(hist['Volume'].to_numpy(dtype=float), _VOLUME_BARS)
+        self._high[slot] = _tail(hist['High'].to_numpy(dtype=float), _RANGE_BARS)
+        self._low[slot] = _tail(hist['Low'].to_numpy(dtype=float), _RANGE_BARS)
+        self._open[slot] = float(hist['Open'].iloc[-1])
+        self._bars[slot] = len(hist)
+
+    def screen(self, symbols, conditions=None, rank_by=None, descending=True, limit=DEFAULT_LIMIT):
+        """Symbols whose latest values satisfy conditions, ranked by rank_by.
+
+        Returns {'matches': [...], 'matched': n, 'screened': n}; each match
+        carries its as-of date, Close, the rank column and every column the
+        conditions read.
+        """
+        with self._lock:
+            rows = [(s, self._entries[s]) for s in symbols if s in self._entries]
+            if not rows:
+                return {'matches': [], 'matched': 0, 'screened': 0}
+            values = self._values[np.array([e['slot'] for _, e in rows], dtype=np.intp)]
+            dates = [e['date'] for _, e in rows]
+
+        if conditions:
+            mask = compile_rule(pd.DataFrame(values, columns=SCREEN_COLUMNS, copy=False), conditions)
+            hits = np.flatnonzero(mask)
+        else:
+            hits = np.arange(len(rows))
+        if rank_by:
+            key = values[hits, _COLUMN_INDEX[rank_by]]
+            hits = hits[np.argsort(-key if descending else key, kind='stable')]  # NaN sorts last
+
+        shown = ['Close'] + ([rank_by] if rank_by else []) + (rule_columns(conditions) if conditions else [])
+        shown = list(dict.fromkeys(shown))
+        picked = values[hits[:limit]][:, [_COLUMN_INDEX[col] for col in shown]]
+        matches = []
+        for i, row in zip(hits[:limit].tolist(), picked.tolist()):
+            match = {'symbol': rows[i][0], 'date': dates[i]}
+            for col, v in zip(shown, row):
+                match[col] = round(v, 4) if math.isfinite(v) else None
+            matches.append(match)
+        return {'matches': matches, 'matched': int(len(hits)), 'screened': len(rows)}
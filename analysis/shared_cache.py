@@ -0,0 +1,291 @@
+"""File-backed cache shared by every process on the host.
+
+With ``serve --workers N`` each uvicorn worker is its own process, so an
+in-memory dict would mean N copies of every model and N trainings per symbol.
+SharedCache keeps one pickle file per key under a namespace directory:
+
+  - writes go to a temp file that is atomically renamed over the entry, so
+    readers never see a partial file
+  - get_or_compute() takes an exclusive fcntl lock on the key's lock file and
+    re-checks before computing, so one process trains or fetches a key while
+    the others wait and then read its result (cross-process single-flight)
+  - each process memoizes unpickled entries and revalidates them with one
+    stat() call, so hot keys are not unpickled on every request
+
+Each file starts with an 8-byte expiry time ahead of the pickle. Expired
+files are ignored on read. A sweep that reads only those headers runs on a
+background timer PRUNE_DELAY_SECONDS after a write, never inside set(). It
+deletes expired entries together with their lock files.
+"""
+import hashlib
+import os
+import pickle
+import re
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from metrics import cache_lookup
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks are only process-local
+    fcntl = None
+
+CACHE_DIR = os.environ.get('STOCK_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache'))
+MEMO_SIZE = 64
+PRUNE_DELAY_SECONDS = 60  # from a write to the sweep of expired entries it schedules
+_HEADER = struct.Struct('>d')  # expiry as a Unix time; 0 for entries that never expire
+
+
+class SharedCache:
+    """One namespace (e.g. 'models', 'history') of the on-disk cache."""
+
+    def __init__(self, namespace, default_ttl=None, directory=None):
+        self.namespace = namespace
+        self.default_ttl = default_ttl
+        self.directory = os.path.join(directory or CACHE_DIR, namespace)
+        self._memo = OrderedDict()  # path -> (stat signature, entry)
+        self._memo_lock = threading.Lock()
+        self._local_locks = {}
+        self._prune_timer = None
+
+    def _path(self, key):
+        text = key if isinstance(key, str) else repr(key)
+        slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', text)[:60]
+        return os.path.join(self.directory, f'{slug}-{hashlib.sha1(text.encode()).hexdigest()[:12]}.pkl')
+
+    def _read(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._memo_lock:
+            memo = self._memo.get(path)
+            if memo and memo[0] == signature:
+                self._memo.move_to_end(path)
+                return memo[1]
+        try:
+            with open(path, 'rb') as f:
+                f.seek(_HEADER.size)
+                entry = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        with self._memo_lock:
+            self._memo[path] = (signature, entry)
+            while len(self._memo) > MEMO_SIZE:
+                self._memo.popitem(last=False)
+        return entry
+
+    def entry(self, key):
+        """The stored entry {'key', 'value', 'created', 'expires'} if fresh, else None."""
+        entry = self._read(self._path(key))
+        if entry is not None and entry['expires'] is not None and entry['expires'] <= time.time():
+            return None
+        return entry
+
+    def version(self, key):
+        """Token that changes whenever key is rewritten; None if missing or past default_ttl.
+
+        Costs one stat() and never unpickles, so callers can key derived
+        results (e.g. encoded responses) on the entries they were built from.
+        """
+        try:
+            st = os.stat(self._path(key))
+        except FileNotFoundError:
+            return None
+        if self.default_ttl and st.st_mtime + self.default_ttl <= time.time():
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def get(self, key, default=None):
+        entry = self.entry(key)
+        cache_lookup(self.namespace, entry is not None)
+        return entry['value'] if entry is not None else default
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        now = time.time()
+        entry = {'key': key, 'value': value, 'created': now, 'expires': now + ttl if ttl else None}
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(_HEADER.pack(entry['expires'] or 0.0))
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        self._schedule_prune()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def lock(self, key):
+        """Exclusive lock on ``key`` across threads and processes."""
+        path = self._path(key)
+        with self._memo_lock:
+            local = self._local_locks.setdefault(path, threading.Lock())
+        with local:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            lock_path = path[:-4] + '.lock'
+            while True:
+                f = open(lock_path, 'a')
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                # prune() may have deleted the lock file while we waited on
+                # it; a lock on the unlinked file would exclude nobody
+                try:
+                    if os.stat(lock_path).st_ino == os.fstat(f.fileno()).st_ino:
+                        break
+                except FileNotFoundError:
+                    pass
+                f.close()
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                f.close()
+
+    def get_or_compute(self, key, compute, ttl=None, cacheable=None):
+        """Return the cached value, or compute it once across all processes.
+
+        ``cacheable(value)`` can veto storing a result (e.g. an error dict);
+        such results are returned but the next caller computes again.
+        """
+        entry = self.entry(key)
+        if entry is not None:
+            cache_lookup(self.namespace, True)
+            return entry['value']
+        with self.lock(key):
+            # Another process may have filled it while we waited for the lock
+            entry = self.entry(key)
+            cache_lookup(self.namespace, entry is not None)
+            if entry is not None:
+                return entry['value']
+            value = compute()
+            if cacheable is None or cacheable(value):
+                self.set(key, value, ttl)
+            return value
+
+    def _entry_paths(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.directory, n) for n in names if n.endswith('.pkl')]
+
+    def __len__(self):
+        return len(self._entry_paths())
+
+    def clear(self):
+        for path in self._entry_paths():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        with self._memo_lock:
+            self._memo.clear()
+
+    def _schedule_prune(self):
+        # One pending sweep at a time, run off the writing thread
+        with self._memo_lock:
+            if self._prune_timer is not None:
+                return
+            self._prune_timer = threading.Timer(PRUNE_DELAY_SECONDS, self._scheduled_prune)
+            self._prune_timer.daemon = True
+            self._prune_timer.start()
+
+    def _scheduled_prune(self):
+        with self._memo_lock:
+            self._prune_timer = None
+        try:
+            self.prune()
+        except OSError:
+            pass
+
+    @staticmethod
+    def _expires(path):
+        """The expiry stored in an entry's header: a Unix time, 0 for never, None if unreadable."""
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(_HEADER.size)
+        except OSError:
+            return None
+        return _HEADER.unpack(header)[0] if len(header) == _HEADER.size else None
+
+    def _remove_unlocked(self, entry_path, stale):
+        """Delete an entry and its lock file if stale(entry_path) holds under the key's lock.
+
+        Keys another process holds the lock for are skipped.
+        """
+        lock_path = entry_path[:-4] + '.lock'
+        if fcntl is None or not os.path.exists(lock_path):
+            if not stale(entry_path):
+                return
+            for path in (entry_path, lock_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            return
+        try:
+            f = open(lock_path, 'a')
+        except OSError:
+            return
+        with f:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return  # being recomputed right now
+            if not stale(entry_path):
+                return  # rewritten since the caller looked
+            for path in (entry_path, lock_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def prune(self):
+        """Delete expired entries, and lock files left without an entry.
+
+        Reads only the 8-byte header of each entry, never the pickle.
+        """
+        now = time.time()
+
+        def expired(path):
+            expires = self._expires(path)
+            return expires is None or 0 < expires <= now
+
+        def missing(path):
+            return not os.path.exists(path)
+
+        try:
+            names = set(os.listdir(self.directory))
+        except FileNotFoundError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if name.endswith('.pkl'):
+                if expired(path):
+                    self._remove_unlocked(path, expired)
+            elif name.endswith('.lock') and name[:-5] + '.pkl' not in names:
+                # Keys whose value was never stored (e.g. error results)
+                self._remove_unlocked(path[:-5] + '.pkl', missing)
+        with self._memo_lock:
+            for path in [p for p in self._memo if not os.path.exists(p)]:
+                del self._memo[path]
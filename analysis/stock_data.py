@@ -1,117 +1,246 @@
-import yfinance as yf
-import pandas as pd
-import numpy as np
 import sys
 import json
 import os
-import pickle
 import math
-from datetime import datetime, timedelta
-
-# ── Model cache ──────────────────────────────────────────────────────────────
+from datetime import datetime
+
+from incremental import CHART_COLUMNS, FEATURE_COLUMNS, IncrementalIndicatorCache
+from httpcache import choose_encoding, compress, etag_matches, make_etag, representation_etag
+from indicators import PRICE_COLUMNS, canonical_spec, data_version, engine_cache_size, get_engine
+from intraday_archive import (
+    ARCHIVE_INTERVALS, BACKFILL_PERIODS, LIVE_PERIOD, RECENT_PERIOD, IntradayArchive, IntradayCollector,
+    merge as merge_archived,
+)
+from jobs import progress
+from lazy import LazyModule
+from metrics import (
+    CACHE_ENTRIES, REGISTRY, RequestMetricsMiddleware, StageClock,
+    cache_lookup, observe_captured, stage, upstream,
+)
+from portfolio import analyze as analyze_portfolio, parse_holdings
+from providers import get_provider
+from robustness import analyze as analyze_robustness, parse_options as parse_robustness
+from rules import compile_rule, rule_columns
+from screener import SCREEN_COLUMNS, ScreenUniverse, parse_symbols, validate_conditions
+from shared_cache import SharedCache
+from walkforward import (
+    LABEL_HORIZON, parse_options as parse_walk_forward, plan_folds, predict_folds, shutdown_pool as shutdown_fold_pool,
+)
+
+# pandas/numpy load on first use, FastAPI only when the app is built, and
+# yfinance/sklearn inside the functions that call them. CLI calls and
+# backtest workers import just what their code path touches.
+pd = LazyModule('pandas', globals(), 'pd')
+np = LazyModule('numpy', globals(), 'np')
+
+# ── Shared caches ────────────────────────────────────────────────────────────
+# Trained models, price histories and ticker info live in a file-backed cache
+# shared by every uvicorn worker and backtest subprocess on the host, so with
+# ``serve --workers N`` each model is still trained, and each history fetched,
+# by one process only (see shared_cache.py).
 MODEL_CACHE_TTL_HOURS = 4
-_model_cache = {}  # symbol -> {'model_data': ..., 'trained_at': datetime}
+HISTORY_CACHE_TTL_SECONDS = int(os.environ.get('HISTORY_CACHE_TTL_SECONDS', '60'))
+INFO_CACHE_TTL_SECONDS = 3600
+_model_cache = SharedCache('models', MODEL_CACHE_TTL_HOURS * 3600)  # symbol -> {'model_data': ..., 'trained_at': datetime}
+_history_cache = SharedCache('history', HISTORY_CACHE_TTL_SECONDS)
+_info_cache = SharedCache('info', INFO_CACHE_TTL_SECONDS)
+_closes_cache = SharedCache('closes', HISTORY_CACHE_TTL_SECONDS)  # aligned portfolio price matrices
 
-# Optional disk persistence directory (created on first use)
-MODEL_CACHE_DIR = os.path.join(os.path.dirname(__file__), 'model_cache')
 
+def _get_or_train_model(symbol, stock_data):
+    """Return the cached training result for symbol, training it if missing.
 
-def _get_cache_path(symbol):
-    safe = ''.join(c for c in symbol.upper() if c.isalnum())
-    return os.path.join(MODEL_CACHE_DIR, f'{safe}.pkl')
+    Concurrent callers in any process wait for the one that trains. Failed
+    trainings (error dicts) are returned but not cached.
+    """
+    def train():
+        print(f"Training new model with {symbol}...", file=sys.stderr)
+        return {'model_data': train_random_forest_model(stock_data), 'trained_at': datetime.now()}
 
+    entry = _model_cache.get_or_compute(
+        symbol.upper(), train, cacheable=lambda e: 'error' not in e['model_data'],
+    )
+    return entry['model_data']
 
-def _load_model_from_disk(symbol):
-    path = _get_cache_path(symbol)
-    if not os.path.exists(path):
-        return None
-    try:
-        with open(path, 'rb') as f:
-            return pickle.load(f)
-    except Exception:
-        return None
 
+# Rolling columns are kept per (symbol, interval, date_range); a refresh only
+# streams new or revised bars through the running state (see incremental.py)
+_rolling_cache = IncrementalIndicatorCache()
 
-def _save_model_to_disk(symbol, cache_entry):
-    os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
-    path = _get_cache_path(symbol)
-    try:
-        with open(path, 'wb') as f:
-            pickle.dump(cache_entry, f)
-    except Exception:
-        pass
 
+def _period(date_range):
+    # Unknown date_range presets fall back to 2y
+    return date_range if date_range in ['max', '1y', '2y', '5y'] else "2y"
+
+
+def _cached_bars(provider, symbol, period, interval):
+    """The shared (read-only) OHLCV frame for a provider period.
+
+    The shared cache keeps the downloaded frame for HISTORY_CACHE_TTL_SECONDS.
+    """
+    key = (provider.cache_id, symbol.upper(), period, interval)
+
+    def fetch():
+        with upstream('history'):
+            return provider.history(symbol, period, interval)
+
+    return _history_cache.get_or_compute(key, fetch, cacheable=lambda h: not h.empty)
+
+
+def _cached_history(provider, symbol, date_range, interval):
+    """The shared (read-only) OHLCV frame for a date_range preset."""
+    return _cached_bars(provider, symbol, _period(date_range), interval)
+
+
+# ── Intraday archive ────────────────────────────────────────────────────────
+# Completed intraday bars are kept on disk (see intraday_archive.py), so an
+# intraday chart downloads only the latest session and history reaches back
+# past the provider's short intraday window.
+INTRADAY_ARCHIVE = os.environ.get('INTRADAY_ARCHIVE', '1') != '0'
+INTRADAY_COLLECT_INTERVAL_SECONDS = float(os.environ.get('INTRADAY_COLLECT_INTERVAL_SECONDS', '900'))
+INTRADAY_ARCHIVE_SYMBOLS = [s.strip() for s in os.environ.get('INTRADAY_ARCHIVE_SYMBOLS', '').split(',') if s.strip()]
+_intraday_archive = IntradayArchive()
+
+
+def _intraday_parts(provider, symbol, date_range, interval):
+    """Archived bars from the start of the date_range preset, and a live download.
+
+    The live window is the shortest (LIVE_PERIOD, then RECENT_PERIOD, then
+    the provider's whole intraday window) that reaches back to the archive's
+    last bar, so the two leave no gap. Nothing is written to the archive.
+    """
+    period = _period(date_range)
+    start = None if period == 'max' else pd.Timestamp.now(tz='UTC') - pd.DateOffset(years=int(period[:-1]))
+    archived = _intraday_archive.frame(provider.cache_id, symbol, interval, start)
+    periods = (LIVE_PERIOD, RECENT_PERIOD) if archived is not None else ()
+    for live_period in periods + (BACKFILL_PERIODS[interval],):
+        live = _cached_bars(provider, symbol, live_period, interval)
+        if not live.empty and (archived is None or live.index[0] <= archived.index[-1]):
+            break
+    return archived, live
+
+
+def _intraday_history(provider, symbol, date_range, interval, archive=True):
+    """Archived bars followed by the live download.
+
+    With ``archive``, the view is recorded, which keeps IntradayCollector
+    downloading the symbol, and completed live bars newer than the archive are
+    appended; usually the collector already has them and no bars are written.
+    """
+    archived, live = _intraday_parts(provider, symbol, date_range, interval)
+    if archive:
+        _intraday_archive.mark_viewed(provider.cache_id, symbol, interval)
+        if len(live) > 1 and (archived is None or live.index[-2] > archived.index[-1]):
+            _intraday_archive.append(provider.cache_id, symbol, interval, live)
+    return merge_archived(archived, live)
+
+
+def _history_frame(provider, symbol, date_range, interval, archive=True):
+    """The OHLCV frame served for a date_range preset; may be shared, do not modify.
+
+    ``archive=False`` leaves the intraday archive untouched.
+    """
+    if INTRADAY_ARCHIVE and interval in ARCHIVE_INTERVALS:
+        return _intraday_history(provider, symbol, date_range, interval, archive)
+    return _cached_history(provider, symbol, date_range, interval)
 
-def _get_cached_model(symbol):
-    """Return cached model_data if present and not stale, else None."""
-    symbol = symbol.upper()
-    now = datetime.now()
 
-    # Check in-memory cache first
-    entry = _model_cache.get(symbol)
-    if entry:
-        age = now - entry['trained_at']
-        if age < timedelta(hours=MODEL_CACHE_TTL_HOURS):
-            return entry['model_data']
-        # Stale — evict
-        del _model_cache[symbol]
+def _fetch_history(provider, symbol, date_range, interval):
+    """Download OHLCV for a date_range preset; returns a private copy."""
+    return _history_frame(provider, symbol, date_range, interval).copy()
 
-    # Try disk cache
-    entry = _load_model_from_disk(symbol)
-    if entry:
-        age = now - entry['trained_at']
-        if age < timedelta(hours=MODEL_CACHE_TTL_HOURS):
-            _model_cache[symbol] = entry
-            return entry['model_data']
 
-    return None
+def _fetch_info(provider, symbol):
+    """Ticker info dict, shared across processes for INFO_CACHE_TTL_SECONDS."""
+    def fetch():
+        with upstream('info'):
+            return provider.info(symbol) or {}
 
+    return _info_cache.get_or_compute((provider.cache_id, symbol.upper()), fetch)
 
-def _set_cached_model(symbol, model_data):
-    """Store model_data in memory and optionally on disk."""
-    symbol = symbol.upper()
-    entry = {'model_data': model_data, 'trained_at': datetime.now()}
-    _model_cache[symbol] = entry
-    _save_model_to_disk(symbol, entry)
 
+def history_etag(symbol, date_range, interval, auto_predict, indicators):
+    """Strong ETag for a get_stock_price_history response, or None if there is no data.
 
-def get_stock_price_history(symbol, date_range='max', interval='1d', auto_predict=False): 
+    Built from the request, a hash of every bar (indicators.data_version), the
+    market cap and, with predictions, the model version, so an adjusted bar
+    changes it and a refetch without changes keeps it. Missing history and
+    info are fetched into the shared cache, but the intraday archive is left
+    alone: a 304 writes nothing.
+    """
+    provider = get_provider()
+    try:
+        hist = _history_frame(provider, symbol, date_range, interval, archive=False)
+    except Exception:
+        return None
+    if hist.empty:
+        return None
     try:
-        # Use yfinance to get stock data
-        ticker = yf.Ticker(symbol)
+        market_cap = _fetch_info(provider, symbol).get('marketCap')
+    except Exception:
+        market_cap = None
+    model = _model_cache.version(symbol.upper()) if auto_predict and interval == '1d' else None
+    return make_etag(
+        symbol.upper(), date_range, interval, bool(auto_predict), tuple(indicators),
+        provider.cache_id, data_version(hist), market_cap, model,
+    )
+
+
+def _format_date(date_index, interval):
+    if interval in ['1d', '5d', '1wk', '1mo', '3mo']:
+        # Daily and longer intervals: date only (YYYY-MM-DD)
+        return str(date_index)[:10]
+    # Intraday intervals: include time (YYYY-MM-DD HH:MM:SS)
+    return str(date_index)[:19]
+
+
+def get_stock_price_history(symbol, date_range='max', interval='1d', auto_predict=False, indicators=None,
+                            with_prediction=True):
+    """Fetch OHLCV plus chart indicators for a symbol.
+
+    ``indicators`` is an optional list of extra indicator spec strings
+    (e.g. ``["RSI_14", "BBUPPER_20_2"]``); each is added to every row under
+    the spec as given. ``with_prediction=False`` returns the auto_predict
+    feature and label columns without training or predicting.
+    """
+    indicators = list(indicators or [])
+    try:
+        for spec in indicators:
+            canonical_spec(spec)
+    except ValueError as e:
+        return {"error": str(e)}
+
+    try:
+        # Market data comes from the configured provider (Yahoo by default)
+        provider = get_provider()
         
         # Fetch market cap from ticker info (static per symbol)
         try:
-            info = ticker.info
+            info = _fetch_info(provider, symbol)
             market_cap = info.get('marketCap') if info else None
         except Exception:
             market_cap = None
         
-        # Map date range to yfinance periods or calculate dates
-        if date_range == 'max':
-            hist = ticker.history(period="max", interval=interval)
-        elif date_range in ['1y', '2y', '5y']:
-            hist = ticker.history(period=date_range, interval=interval)
-        else:
-            # Default to 2 years if invalid range provided
-            hist = ticker.history(period="2y", interval=interval)
+        hist = _fetch_history(provider, symbol, date_range, interval)
         
         # Check if data is available
         if hist.empty:
             return {"error": f"No data found for symbol: {symbol}"}
         
-        hist['200MA'] = hist['Close'].rolling(window=200, min_periods=200).mean()
-        hist['150MA'] = hist['Close'].rolling(window=150, min_periods=150).mean()
-        hist['50MA'] = hist['Close'].rolling(window=50, min_periods=50).mean()
-        hist['20MA'] = hist['Close'].rolling(window=20, min_periods=20).mean()
-        hist['10MA'] = hist['Close'].rolling(window=10, min_periods=10).mean()
-        
-        # Volume moving averages
-        hist['Volume_10MA'] = hist['Volume'].rolling(window=10, min_periods=10).mean()
-        hist['Volume_20MA'] = hist['Volume'].rolling(window=20, min_periods=20).mean()
-        hist['Volume_30MA'] = hist['Volume'].rolling(window=30, min_periods=30).mean()
-        hist['Volume_60MA'] = hist['Volume'].rolling(window=60, min_periods=60).mean()
-        hist['Volume_90MA'] = hist['Volume'].rolling(window=90, min_periods=90).mean()
+        clock = StageClock('history')
+        # Moving averages, volume MAs and the rolling ML inputs come from the
+        # incremental cache, which falls back to the shared indicator engine
+        # (memoized per symbol, interval and data version) on a cold or
+        # inconsistent history.
+        ml_features = auto_predict and interval == '1d'
+        engine = get_engine(hist, symbol, interval)
+        rolling = _rolling_cache.columns(
+            (symbol.upper(), interval, date_range), hist,
+            CHART_COLUMNS + (FEATURE_COLUMNS if ml_features else []), engine,
+        )
+        for col, values in rolling.items():
+            hist[col] = values
+        clock.lap('rolling')
         
         # Dollar volume (Close * Volume)
         hist['Dollar_Volume'] = hist['Close'] * hist['Volume']
@@ -119,83 +248,48 @@ def get_stock_price_history(symbol, date_range='max', interval='1d', auto_predic
         # ── ML feature computation (only when auto_predict is requested) ──
         # The chart does NOT display these 16 features — they are only used for
         # RandomForest training and prediction. Skipping them when auto_predict=false
-        # saves ~100 lines of rolling-window pandas operations per symbol load.
-        if auto_predict and interval == '1d':
+        # saves the rolling-window work for every plain chart load.
+        if ml_features:
             
             # Technical indicator features (binary: 1 = True, 0 = False)
             hist['MA50_above_MA150'] = (hist['50MA'] > hist['150MA']).astype(int)
             hist['MA150_above_MA200'] = (hist['150MA'] > hist['200MA']).astype(int)
             hist['Price_above_MA50'] = (hist['Close'] > hist['50MA']).astype(int)
             
-            # Volume trend feature: check if 20-day volume MA is in uptrend
-            hist['Volume_20MA_daily_change'] = hist['Volume_20MA'].diff()
-            hist['Volume_20MA_up_day'] = (hist['Volume_20MA_daily_change'] > 0).astype(int)
-            # Check if 70% of past 10 days had volume 20MA going up (shorter window for volume)
-            hist['Volume_20MA_uptrend_count'] = hist['Volume_20MA_up_day'].rolling(window=10, min_periods=10).sum()
+            # Volume trend feature: check if 70% of past 10 days had volume 20MA
+            # going up (shorter window for volume)
             hist['Volume_20MA_uptrend'] = (hist['Volume_20MA_uptrend_count'] >= 7).astype(int)  # 7/10 = 70%
             
-            # 200MA uptrend feature: check if 200MA is in uptrend for past month
-            # Calculate daily change in 200MA
-            hist['MA200_daily_change'] = hist['200MA'].diff()
-            hist['MA200_up_day'] = (hist['MA200_daily_change'] > 0).astype(int)
-            
-            # Rolling window to check if 90% of past period had 200MA going up
+            # 200MA uptrend feature: check if 90% of past period had 200MA going up
             # Past month (22 trading days)
-            hist['MA200_uptrend_count'] = hist['MA200_up_day'].rolling(window=22, min_periods=22).sum()
             hist['MA200_uptrend_past_month'] = (hist['MA200_uptrend_count'] >= 20).astype(int)  # 20/22 = ~90%
             
             # 200MA vs 1 month ago: current 200MA > 200MA 22 trading days ago
-            hist['MA200_month_ago'] = hist['200MA'].shift(22)
             hist['MA200_above_month_ago'] = (hist['200MA'] > hist['MA200_month_ago']).astype(int)
             
             # Past 6 months (~132 trading days)
-            hist['MA200_uptrend_count_6m'] = hist['MA200_up_day'].rolling(window=132, min_periods=132).sum()
             hist['MA200_uptrend_past_6months'] = (hist['MA200_uptrend_count_6m'] >= 119).astype(int)  # 119/132 = ~90%
             
             # Past 1 year (~252 trading days)
-            hist['MA200_uptrend_count_1y'] = hist['MA200_up_day'].rolling(window=252, min_periods=252).sum()
             hist['MA200_uptrend_past_year'] = (hist['MA200_uptrend_count_1y'] >= 227).astype(int)  # 227/252 = ~90%
             
             # 52-week low feature: check if current price is at least 30% above 52-week low
-            hist['52week_low'] = hist['Close'].rolling(window=252, min_periods=252).min()
             hist['Price_above_52week_low_30pct'] = ((hist['Close'] - hist['52week_low']) / hist['52week_low'] >= 0.30).astype(int)
             
             # 52-week high feature: check if current price is within 25% of 52-week high
-            hist['52week_high'] = hist['Close'].rolling(window=252, min_periods=252).max()
             hist['Price_within_25pct_of_52week_high'] = ((hist['52week_high'] - hist['Close']) / hist['52week_high'] <= 0.25).astype(int)
             
             # Price range features: volatility indicators
             # Past week (5 trading days)
-            hist['Week_High'] = hist['High'].rolling(window=5, min_periods=5).max()
-            hist['Week_Low'] = hist['Low'].rolling(window=5, min_periods=5).min()
             hist['Week_Price_Range'] = hist['Week_High'] - hist['Week_Low']
             
             # Past month (22 trading days)
-            hist['Month_High'] = hist['High'].rolling(window=22, min_periods=22).max()
-            hist['Month_Low'] = hist['Low'].rolling(window=22, min_periods=22).min()
             hist['Month_Price_Range'] = hist['Month_High'] - hist['Month_Low']
             
-            # Price change features: momentum indicators
-            # 1-day price change (percentage)
-            hist['Price_Change_1D'] = (hist['Close'] - hist['Close'].shift(1)) / hist['Close'].shift(1) * 100
-            
-            # 1-week price change (percentage)
-            hist['Price_Change_1W'] = (hist['Close'] - hist['Close'].shift(5)) / hist['Close'].shift(5) * 100
-            
-            # 1-month price change (percentage)
-            hist['Price_Change_1M'] = (hist['Close'] - hist['Close'].shift(22)) / hist['Close'].shift(22) * 100
-            
-            # 3-month price change (percentage)
-            hist['Price_Change_3M'] = (hist['Close'] - hist['Close'].shift(66)) / hist['Close'].shift(66) * 100
+            # Price change features (Price_Change_1D/1W/1M/3M, percentage) are
+            # rolling columns already.
             
             # Price rise/fall day feature: check if more rising days than falling days in past month
-            hist['Price_daily_change'] = hist['Close'].diff()
-            hist['Price_up_day'] = (hist['Price_daily_change'] > 0).astype(int)
-            hist['Price_down_day'] = (hist['Price_daily_change'] < 0).astype(int)
-            
-            # Count rise and fall days in past month (22 trading days)
-            hist['Price_rise_days_month'] = hist['Price_up_day'].rolling(window=22, min_periods=22).sum()
-            hist['Price_fall_days_month'] = hist['Price_down_day'].rolling(window=22, min_periods=22).sum()
             hist['Price_more_rise_than_fall_month'] = (hist['Price_rise_days_month'] > hist['Price_fall_days_month']).astype(int)
             
             # Shift close price back to get future price
@@ -206,18 +300,18 @@ def get_stock_price_history(symbol, date_range='max', interval='1d', auto_predic
             
             # Create buy/sell label: 1 = buy (price up by more than 5%), 0 = sell (price up by 5% or less)
             hist['Label'] = (hist['Future_Return'] > 0.05).astype(int)
+        clock.lap('features')
 
+        # Extra indicators requested by spec string
+        extra_columns = [spec for spec in indicators if spec not in hist.columns]
+        for spec in extra_columns:
+            hist[spec] = engine.compute(spec)
+        clock.lap('indicators')
 
         # Convert to list of dictionaries
         stock_data = []
         for date_index, row in hist.iterrows():
-            # Format date based on interval
-            if interval in ['1d', '5d', '1wk', '1mo', '3mo']:
-                # Daily and longer intervals: date only (YYYY-MM-DD)
-                date_str = str(date_index)[:10]
-            else:
-                # Intraday intervals: include time (YYYY-MM-DD HH:MM:SS)
-                date_str = str(date_index)[:19]
+            date_str = _format_date(date_index, interval)
             
             data_point = {
                 "Date": date_str,
@@ -260,25 +354,21 @@ def get_stock_price_history(symbol, date_range='max', interval='1d', auto_predic
                 data_point["Price_Change_3M"] = round(float(row['Price_Change_3M']), 2) if pd.notna(row['Price_Change_3M']) else None
                 data_point["Price_more_rise_than_fall_month"] = int(row['Price_more_rise_than_fall_month']) if pd.notna(row['Price_more_rise_than_fall_month']) else None
                 data_point["Label"] = int(row['Label']) if pd.notna(row['Label']) else None
+            for spec in extra_columns:
+                data_point[spec] = round(float(row[spec]), 4) if pd.notna(row[spec]) else None
             
             stock_data.append(data_point)
 
 
         # Sort by date ascending (oldest first)
         stock_data.sort(key=lambda x: x['Date'])
+        clock.lap('serialize')
         
         # Auto-training and prediction feature
-        if auto_predict and interval == '1d':
+        if auto_predict and interval == '1d' and with_prediction:
             try:
-                cached = _get_cached_model(symbol)
-                if cached:
-                    print(f"Using cached model for {symbol}", file=sys.stderr)
-                    train_result = cached
-                else:
-                    print(f"Training new model with {symbol}...", file=sys.stderr)
-                    train_result = train_random_forest_model(stock_data)
-                    if 'error' not in train_result:
-                        _set_cached_model(symbol, train_result)
+                train_result = _get_or_train_model(symbol, stock_data)
+                clock.lap('model')
                 if 'error' in train_result:
                     print(f"Training failed: {train_result['error']}", file=sys.stderr)
                     # Add error status to response for insufficient data
@@ -294,6 +384,7 @@ def get_stock_price_history(symbol, date_range='max', interval='1d', auto_predic
                     print(f"Model trained successfully with accuracy: {train_result['test_accuracy']:.2%}", file=sys.stderr)
 
                     prediction_result = predict_stock_recommendation(stock_data, train_result['model_data'])
+                    clock.lap('predict')
                     if 'error' not in prediction_result:
                         # Add successful prediction to the response
                         stock_data.append({
@@ -333,9 +424,9 @@ def get_current_stock_price(symbol):
     Get the most recent current price and day change for a stock symbol.
     """
     try:
-        ticker = yf.Ticker(symbol)
         # Fetch 2 days to get previous close for day-change calculation
-        hist = ticker.history(period="5d")
+        with upstream('price'):
+            hist = get_provider().history(symbol, "5d", "1d")
         if hist.empty:
             return {"error": f"No price data found for symbol: {symbol}"}
 
@@ -362,11 +453,10 @@ def get_current_stock_price(symbol):
 
 def get_fundamentals(symbol):
     """
-    Fetch key fundamental data for a stock symbol from yfinance.
+    Fetch key fundamental data for a stock symbol from the market data provider.
     """
     try:
-        ticker = yf.Ticker(symbol)
-        info = ticker.info or {}
+        info = _fetch_info(get_provider(), symbol)
 
         def fmt_mcap(value):
             if value is None or not isinstance(value, (int, float)):
@@ -428,33 +518,12 @@ def get_fundamentals(symbol):
 # ponytail: no slippage, commission, partial fills, shorting. Add when needed.
 
 
-RULE_OPS = {'>': lambda a, b: a > b, '<': lambda a, b: a < b, '>=': lambda a, b: a >= b, '<=': lambda a, b: a <= b}
-
-
-def _get_col_val(df, i, spec):
-    """Resolve a rule operand to a scalar value. spec is column name or literal number."""
-    if isinstance(spec, (int, float)):
-        return float(spec)
-    col = str(spec)
-    val = df.loc[i, col] if col in df.columns else None
-    return float(val) if pd.notna(val) else None
-
-
-def _check_rule(df, i, rule):
-    """Check a single rule at row i. rule: {left, op, right}."""
-    op_fn = RULE_OPS.get(rule['op'])
-    if not op_fn:
-        return None
-    left_val = _get_col_val(df, i, rule['left'])
-    right_val = _get_col_val(df, i, rule['right'])
-    if left_val is None or right_val is None:
-        return None
-    return op_fn(left_val, right_val)
-
-
 def _apply_rules(df, entry_rule, exit_rule, exit_mode, dca_periods, dca_unit, eval_frequency='daily'):
     """Apply declarative strategy rules to generate buy/sell_pct signals.
 
+    Entry and exit rules are compiled to boolean arrays once (see rules.py);
+    the loop below only tracks position state.
+
     DCA sells only once per period (month/week), on the first bar where
     exit_rule triggers in that period. State persists across above/below
     transitions so DCA resumes rather than restarting on each dip.
@@ -462,38 +531,40 @@ def _apply_rules(df, entry_rule, exit_rule, exit_mode, dca_periods, dca_unit, ev
     eval_frequency 'monthly': rules checked on first trading bar of each
     month only; entry uses level (above/below) not crossover.
     """
-    df['buy'] = False
-    df['sell_pct'] = 0.0
+    entry_mask = compile_rule(df, entry_rule).tolist()
+    exit_mask = compile_rule(df, exit_rule).tolist()
+
+    dates = pd.DatetimeIndex(df['Date'])
+    month_keys = (dates.year * 12 + dates.month).tolist()
+    if dca_unit == 'month':
+        period_keys = month_keys
+    elif dca_unit == 'week':
+        iso = dates.isocalendar()
+        period_keys = (iso['year'] * 100 + iso['week']).tolist()
+    else:
+        period_keys = dates.normalize().asi8.tolist()
 
-    prev_entry = None
+    buy = [False] * len(df)
+    sell_pct = [0.0] * len(df)
+    prev_entry = False
     dca_state = None
     in_position = False
     last_eval_month = None
     monthly = eval_frequency == 'monthly'
 
-    def _period_key(d):
-        if dca_unit == 'month':
-            return d.year * 12 + d.month
-        if dca_unit == 'week':
-            return d.isocalendar()[0] * 100 + d.isocalendar()[1]
-        return d.toordinal()
-
     for i in range(len(df)):
-        dt = pd.to_datetime(df.loc[i, 'Date'])
         if monthly:
-            month_key = dt.year * 12 + dt.month
-            if last_eval_month == month_key:
+            if last_eval_month == month_keys[i]:
                 continue
-            last_eval_month = month_key
+            last_eval_month = month_keys[i]
 
-        entry_val = _check_rule(df, i, entry_rule)
-        exit_val = _check_rule(df, i, exit_rule)
-        pkey = _period_key(dt)
+        entry_val = entry_mask[i]
+        pkey = period_keys[i]
 
         # Exit before entry (matches simulation order)
-        if in_position and exit_val is True:
+        if in_position and exit_mask[i]:
             if exit_mode == 'immediate':
-                df.loc[i, 'sell_pct'] = 1.0
+                sell_pct[i] = 1.0
                 in_position = False
                 dca_state = None
             else:
@@ -501,33 +572,38 @@ def _apply_rules(df, entry_rule, exit_rule, exit_mode, dca_periods, dca_unit, ev
                     dca_state = {'left': dca_periods, 'sold': set()}
                 if pkey not in dca_state['sold'] and dca_state['left'] > 0:
                     dca_state['sold'].add(pkey)
-                    df.loc[i, 'sell_pct'] = 1.0 / dca_state['left']
+                    sell_pct[i] = 1.0 / dca_state['left']
                     dca_state['left'] -= 1
                     if dca_state['left'] == 0:
                         in_position = False
                         dca_state = None
                 elif pkey not in dca_state['sold']:
                     dca_state['sold'].add(pkey)
-                    df.loc[i, 'sell_pct'] = 1.0
+                    sell_pct[i] = 1.0
                     in_position = False
                     dca_state = None
 
         # Entry — crossover on daily eval; level check on monthly eval
         entry_trigger = (
             not in_position
-            and entry_val is True
+            and entry_val
             and dca_state is None
-            and ((not monthly and prev_entry is not True) or monthly)
+            and (monthly or not prev_entry)
         )
         if entry_trigger:
-            df.loc[i, 'buy'] = True
+            buy[i] = True
             in_position = True
 
         prev_entry = entry_val
 
+    df['buy'] = buy
+    df['sell_pct'] = sell_pct
     return df
 
 
+SIMULATION_CHECKPOINT_BARS = 500  # bars between job progress checkpoints
+
+
 def _run_simulation(df, capital):
     """Simulate trades from buy/sell columns. Supports sell_pct (0-1) for fractional exits.
     Returns (trades, equityCurve, final_value)."""
@@ -539,7 +615,9 @@ def _run_simulation(df, capital):
     entry_date = None
     has_sell_pct = 'sell_pct' in df.columns
 
-    for idx, row in df.iterrows():
+    for i, (idx, row) in enumerate(df.iterrows()):
+        if i % SIMULATION_CHECKPOINT_BARS == 0:
+            progress('simulate', i, len(df), 'bars')
         date_str = str(row['Date'])[:10]
         buy_signal = bool(row.get('buy', False))
         sell_signal = bool(row.get('sell', False))
@@ -669,12 +747,15 @@ def _compute_metrics(trades, equity_curve, initial_capital, final_value):
     }
 
 
-def run_backtest(symbol, strategy_config, capital=10000, date_range='2y', interval='1d'):
+def run_backtest(symbol, strategy_config, capital=10000, date_range='2y', interval='1d', robustness=None):
     """Execute backtest from declarative strategy config dict.
 
     Config format:
     {
-        "entry": {"left": "Close", "op": ">", "right": "MA_200"},
+        "entry": {"all": [
+            {"left": "Close", "op": ">", "right": "MA_200"},
+            {"left": "MA_50", "op": "crosses_above", "right": "MA_150"}
+        ]},
         "exit_condition": {"left": "Close", "op": "<", "right": "MA_200"},
         "exit_mode": "dca",
         "dca_periods": 3,
@@ -682,6 +763,14 @@ def run_backtest(symbol, strategy_config, capital=10000, date_range='2y', interv
         "eval_frequency": "monthly"
     }
 
+    Rules are comparison trees combined with all/any/not (see rules.py).
+    Operands are numbers, raw price columns (Open/High/Low/Close/Volume),
+    indicator specs such as "MA_200", "EMA_20" or "RSI_14" (see indicators.py),
+    or {"column": ..., "offset": n} for the value n bars earlier.
+
+    robustness, when given (e.g. {"paths": 5000}), adds Monte Carlo
+    confidence intervals for the metrics (see robustness.py).
+
     If strategy_config is a string, parse as JSON.
     """
     if isinstance(strategy_config, str):
@@ -696,39 +785,40 @@ def run_backtest(symbol, strategy_config, capital=10000, date_range='2y', interv
     if eval_frequency == 'monthly' and dca_unit == 'week':
         dca_unit = 'month'
 
+    # Every string operand other than a raw price column names an indicator
     try:
-        raw = get_stock_price_history(symbol, date_range, interval, auto_predict=False)
-        if isinstance(raw, dict) and 'error' in raw:
-            return {'error': raw['error']}
+        operands = [
+            spec for spec in rule_columns({'all': [entry_rule, exit_rule]}) if spec not in PRICE_COLUMNS
+        ]
+        for spec in operands:
+            canonical_spec(spec)
+        if robustness is not None:
+            robustness = parse_robustness(robustness)
+    except ValueError as e:
+        return {'error': str(e)}
 
-        df = pd.DataFrame(raw)
-        if df.empty:
+    try:
+        progress('fetch')
+        hist = _fetch_history(get_provider(), symbol, date_range, interval)
+        if hist.empty:
             return {'error': f'No data found for {symbol}'}
 
-        df['Date'] = pd.to_datetime(df['Date'])
-        df.sort_values('Date', inplace=True)
-        df.reset_index(drop=True, inplace=True)
-
-        # Compute standard MAs (10-200) plus any MA referenced in config
-        needed_periods = set([10, 20, 50, 150, 200])
-        for rule in [entry_rule, exit_rule]:
-            for key in ['left', 'right']:
-                val = rule.get(key, '')
-                if isinstance(val, str) and val.startswith('MA_'):
-                    try:
-                        needed_periods.add(int(val.split('_')[1]))
-                    except (IndexError, ValueError):
-                        pass
-
-        for period in sorted(needed_periods):
-            col = f'MA_{period}'
-            if col not in df.columns:
-                df[col] = df['Close'].rolling(window=period, min_periods=min(period, 20)).mean()
+        progress('indicators')
+        clock = StageClock('backtest')
+        # Same engine and min_periods rules as the chart's indicator columns
+        engine = get_engine(hist, symbol, interval)
+        df = pd.DataFrame({col: hist[col].to_numpy() for col in PRICE_COLUMNS})
+        df.insert(0, 'Date', pd.to_datetime([_format_date(d, interval) for d in hist.index]))
+        for spec in operands:
+            if spec not in df.columns:
+                df[spec] = engine.compute(spec)
+        clock.lap('indicators')
 
         # Apply strategy rules
         df = _apply_rules(
             df, entry_rule, exit_rule, exit_mode, dca_periods, dca_unit, eval_frequency,
         )
+        clock.lap('rules')
 
         # Trim NaN rows where rules couldn't evaluate
         valid = df.dropna(subset=['buy', 'sell_pct'])
@@ -736,20 +826,46 @@ def run_backtest(symbol, strategy_config, capital=10000, date_range='2y', interv
             return {'error': 'No valid rows after NaN removal — data may be insufficient'}
 
         trades, equity_curve, final_value = _run_simulation(valid, capital)
+        clock.lap('simulate')
         metrics = _compute_metrics(trades, equity_curve, capital, final_value)
+        clock.lap('metrics')
 
-        return {
+        result = {
             'metrics': metrics,
             'trades': trades,
             'equityCurve': equity_curve,
             'error': None,
         }
+        if robustness is not None:
+            progress('robustness')
+            result['robustness'] = analyze_robustness(trades, equity_curve, capital, robustness)
+            clock.lap('robustness')
+        return result
 
     except json.JSONDecodeError as e:
         return {'error': f'Invalid strategy JSON: {str(e)}'}
     except Exception as e:
         return {'error': f'Backtest failed: {str(e)}'}
 
+# RandomForest inputs, in model column order, and its hyperparameters
+MODEL_FEATURES = (
+    'MA50_above_MA150', 'MA150_above_MA200', 'Price_above_MA50',
+    'Volume_20MA_uptrend', 'MA200_uptrend_past_month', 'MA200_uptrend_past_6months',
+    'MA200_uptrend_past_year', 'Price_above_52week_low_30pct',
+    'Price_within_25pct_of_52week_high', 'Week_Price_Range', 'Month_Price_Range',
+    'Price_Change_1D', 'Price_Change_1W', 'Price_Change_1M', 'Price_Change_3M',
+    'Price_more_rise_than_fall_month',
+)
+RANDOM_FOREST_PARAMS = {
+    'n_estimators': 200,
+    'max_depth': 15,
+    'min_samples_split': 10,
+    'min_samples_leaf': 5,
+    'random_state': 42,
+    'class_weight': 'balanced',
+}
+
+
 def train_random_forest_model(stock_data):
     """
     Train a Random Forest model using pre-fetched stock data from a single symbol.
@@ -761,15 +877,11 @@ def train_random_forest_model(stock_data):
         import numpy as np
         
         print("Training Random Forest model with single symbol data...", file=sys.stderr)
+        clock = StageClock('train')
         
         # Filter for complete data points (no None values in features)
         complete_data = []
-        feature_fields = ['MA50_above_MA150', 'MA150_above_MA200', 'Price_above_MA50', 
-                        'Volume_20MA_uptrend', 'MA200_uptrend_past_month', 'MA200_uptrend_past_6months',
-                        'MA200_uptrend_past_year', 'Price_above_52week_low_30pct', 
-                        'Price_within_25pct_of_52week_high', 'Week_Price_Range', 'Month_Price_Range',
-                        'Price_Change_1D', 'Price_Change_1W', 'Price_Change_1M', 'Price_Change_3M',
-                        'Price_more_rise_than_fall_month']
+        feature_fields = MODEL_FEATURES
         
         for row in stock_data:
             if row.get('Label') is not None:  # Must have a label
@@ -791,12 +903,7 @@ def train_random_forest_model(stock_data):
         print(f"Using {len(complete_data)} data points for training (time-series ordered)", file=sys.stderr)
         
         # Prepare features and labels
-        feature_names = ['MA50_above_MA150', 'MA150_above_MA200', 'Price_above_MA50', 
-                        'Volume_20MA_uptrend', 'MA200_uptrend_past_month', 'MA200_uptrend_past_6months',
-                        'MA200_uptrend_past_year', 'Price_above_52week_low_30pct', 
-                        'Price_within_25pct_of_52week_high', 'Week_Price_Range', 'Month_Price_Range',
-                        'Price_Change_1D', 'Price_Change_1W', 'Price_Change_1M', 'Price_Change_3M',
-                        'Price_more_rise_than_fall_month']
+        feature_names = list(MODEL_FEATURES)
         
         X = []
         y = []
@@ -808,6 +915,7 @@ def train_random_forest_model(stock_data):
         
         X = np.array(X)
         y = np.array(y)
+        clock.lap('prepare')
         
         # Time-series split: train on first 80%, test on last 20%
         # Data is sorted by date ascending, so this respects temporal order
@@ -818,20 +926,15 @@ def train_random_forest_model(stock_data):
         
         # Train Random Forest
         print("Training Random Forest...", file=sys.stderr)
-        rf_model = RandomForestClassifier(
-            n_estimators=200,
-            max_depth=15,
-            min_samples_split=10,
-            min_samples_leaf=5,
-            random_state=42,
-            class_weight='balanced'
-        )
+        rf_model = RandomForestClassifier(**RANDOM_FOREST_PARAMS)
         
         rf_model.fit(X_train, y_train)
+        clock.lap('fit')
         
         # Evaluate model
         train_accuracy = accuracy_score(y_train, rf_model.predict(X_train))
         test_accuracy = accuracy_score(y_test, rf_model.predict(X_test))
+        clock.lap('evaluate')
         
         print(f"Training Accuracy: {train_accuracy:.4f}", file=sys.stderr)
         print(f"Testing Accuracy: {test_accuracy:.4f}", file=sys.stderr)
@@ -940,21 +1043,307 @@ def predict_stock_recommendation(stock_data, model_data):
         return {"error": f"Prediction failed: {str(e)}"}
 
 
+def retrain_model(symbol, date_range='max'):
+    """Train a new model for symbol now and replace the cached one.
+
+    POST /model/retrain only evicts the model, so the next prediction request
+    pays for training; this runs as a job instead.
+    """
+    progress('fetch')
+    rows = get_stock_price_history(symbol, date_range, '1d', auto_predict=True, with_prediction=False)
+    if isinstance(rows, dict):
+        return rows
+    progress('train')
+    _model_cache.delete(symbol.upper())
+    model_data = _get_or_train_model(symbol, rows)
+    if 'error' in model_data:
+        return {'error': model_data['error']}
+    entry = _model_cache.get(symbol.upper())
+    return {
+        'symbol': symbol.upper(),
+        'trainedAt': entry['trained_at'].isoformat() if entry else None,
+        'testAccuracy': model_data.get('test_accuracy'),
+        'featureImportance': model_data.get('feature_importance', []),
+        'error': None,
+    }
+
+
+# ── Walk-forward evaluation ────────────────────────────────────────────────
+# The RandomForest signal as a strategy, predicted out of sample fold by fold
+# (see walkforward.py) and run through the backtest simulation.
+
+
+def run_walk_forward(symbol, date_range='max', capital=10000, options=None, strategy_config=None):
+    """Backtest the model's BUY/SELL signal with walk-forward retraining.
+
+    options: mode ('expanding' or 'rolling'), train_bars (default 504),
+    step (bars per fold, default 63) and threshold (buy probability, default
+    0.5). The position is entered when the out-of-sample signal turns BUY
+    and exited when it turns SELL; strategy_config may set exit_mode,
+    dca_periods and dca_unit as in run_backtest.
+    """
+    strategy_config = strategy_config or {}
+    try:
+        opts = parse_walk_forward(options)
+    except ValueError as e:
+        return {'error': str(e)}
+
+    try:
+        progress('fetch')
+        rows = get_stock_price_history(symbol, date_range, '1d', auto_predict=True, with_prediction=False)
+        if isinstance(rows, dict):
+            return rows
+        clock = StageClock('walkforward')
+        X = np.array(
+            [[np.nan if row.get(f) is None else row[f] for f in MODEL_FEATURES] for row in rows], dtype=float,
+        )
+        y = np.array([-1 if row.get('Label') is None else row['Label'] for row in rows], dtype=np.int64)
+        y[-LABEL_HORIZON:] = -1  # forward return not known yet
+        folds = plan_folds(len(rows), opts['mode'], opts['train_bars'], opts['step'])
+        if not folds:
+            return {'error': f"Not enough history for walk-forward: need more than {opts['train_bars'] + LABEL_HORIZON} bars"}
+        clock.lap('features')
+
+        probabilities, summaries = predict_folds(X, y, folds, RANDOM_FOREST_PARAMS)
+        clock.lap('folds')
+        predicted = np.flatnonzero(~np.isnan(probabilities))
+        if len(predicted) == 0:
+            return {'error': 'No fold had enough complete training data'}
+
+        # Simulate from the first out-of-sample bar; bars without features have no signal
+        start = predicted[0]
+        signal = np.where(np.isnan(probabilities), np.nan, probabilities >= opts['threshold'])[start:]
+        oos = rows[start:]
+        df = pd.DataFrame({col: [row[col] for row in oos] for col in PRICE_COLUMNS})
+        df.insert(0, 'Date', pd.to_datetime([row['Date'] for row in oos]))
+        df['ModelBuy'] = signal
+        df = _apply_rules(
+            df,
+            {'left': 'ModelBuy', 'op': '>=', 'right': 1},
+            {'left': 'ModelBuy', 'op': '<', 'right': 1},
+            strategy_config.get('exit_mode', 'immediate'),
+            int(strategy_config.get('dca_periods', 3)),
+            strategy_config.get('dca_unit', 'month'),
+        )
+        trades, equity_curve, final_value = _run_simulation(df, capital)
+        metrics = _compute_metrics(trades, equity_curve, capital, final_value)
+        clock.lap('simulate')
+
+        scored = predicted[y[predicted] >= 0]
+        hits = (probabilities[scored] >= opts['threshold']) == (y[scored] == 1)
+        fold_results = []
+        for summary in summaries:
+            test = np.arange(summary['testStart'], summary['testEnd'])
+            test = test[~np.isnan(probabilities[test]) & (y[test] >= 0)]
+            accuracy = ((probabilities[test] >= opts['threshold']) == (y[test] == 1)).mean() if len(test) else None
+            fold_results.append({
+                'trainStart': rows[summary['trainStart']]['Date'],
+                'trainEnd': rows[summary['trainEnd'] - 1]['Date'],
+                'testStart': rows[summary['testStart']]['Date'],
+                'testEnd': rows[summary['testEnd'] - 1]['Date'],
+                'trainSamples': summary['trainSamples'],
+                'predicted': summary['predicted'],
+                'accuracy': None if accuracy is None else round(float(accuracy), 4),
+                'cached': summary['cached'],
+            })
+
+        return {
+            'metrics': metrics,
+            'trades': trades,
+            'equityCurve': equity_curve,
+            'walkForward': {
+                **opts,
+                'purgeBars': LABEL_HORIZON,
+                'predictedBars': int(len(predicted)),
+                'accuracy': round(float(hits.mean()), 4) if len(hits) else None,
+                'buyRate': round(float((probabilities[predicted] >= opts['threshold']).mean()), 4),
+                'trainedFolds': sum(1 for f in fold_results if f['predicted'] and not f['cached']),
+                'cachedFolds': sum(1 for f in fold_results if f['cached']),
+                'folds': fold_results,
+            },
+            'error': None,
+        }
+    except Exception as e:
+        return {'error': f'Walk-forward failed: {str(e)}'}
+
+
+# ── Portfolio analytics ────────────────────────────────────────────────────
+# One batched download of daily closes for every holding and the benchmark,
+# aligned by date and shared-cached as a whole (see portfolio.py).
+
+
+def _aligned_closes(provider, symbols, date_range):
+    """Daily closes, one column per symbol, indexed by YYYY-MM-DD date."""
+    symbols = sorted(set(symbols))
+    period = _period(date_range)
+
+    def fetch():
+        with upstream('closes'):
+            closes = provider.closes(symbols, period, '1d')
+        closes.index = [_format_date(d, '1d') for d in closes.index]
+        return closes.groupby(level=0).last().sort_index()
+
+    return _closes_cache.get_or_compute(
+        (provider.cache_id, period, tuple(symbols)), fetch, cacheable=lambda c: not c.empty,
+    )
+
+
+def get_portfolio_analytics(holdings, benchmark='SPY', date_range='1y'):
+    """Equity curve, correlation, contribution, volatility, beta and drawdown for holdings.
+
+    holdings: [{"symbol": "AAPL", "quantity": 10, "cost_basis": 1500.0}, ...]
+    with cost_basis the position's total cost (optional). benchmark may be
+    empty to skip beta.
+    """
+    try:
+        positions = parse_holdings(holdings)
+    except ValueError as e:
+        return {'error': str(e)}
+    benchmark = (benchmark or '').strip().upper() or None
+
+    try:
+        symbols = [p['symbol'] for p in positions]
+        clock = StageClock('portfolio')
+        closes = _aligned_closes(get_provider(), symbols + ([benchmark] if benchmark else []), date_range)
+        clock.lap('closes')
+        missing = [s for s in symbols if s not in closes.columns or closes[s].isna().all()]
+        if missing:
+            return {'error': f"No price data for: {', '.join(missing)}"}
+        result = analyze_portfolio(closes, positions, benchmark)
+        clock.lap('analytics')
+        result['error'] = None
+        return result
+    except ValueError as e:
+        return {'error': str(e)}
+    except Exception as e:
+        return {'error': f'Portfolio analytics failed: {str(e)}'}
+
+
+# ── Screener ───────────────────────────────────────────────────────────────
+# Latest chart values for every screened symbol, refreshed incrementally once
+# its history is older than the history cache TTL (see screener.py). One
+# universe per provider configuration.
+SCREEN_HISTORY_RANGE = '2y'  # covers the 452-bar warm-up of the longest rolling column
+_screen_universes = {}
+
+
+def run_screen(symbols, conditions=None, rank_by=None, descending=True, limit=50):
+    """Screen symbols on their latest values and rank the matches.
+
+    conditions is a rule tree over SCREEN_COLUMNS with >, <, >= and <=, e.g.
+    {"all": [{"left": "Pct_below_52week_high", "op": "<=", "right": 25},
+             {"left": "200MA", "op": ">", "right": "MA200_month_ago"}]}
+    """
+    try:
+        symbols = parse_symbols(symbols)
+        if conditions:
+            validate_conditions(conditions)
+        if rank_by is not None and rank_by not in SCREEN_COLUMNS:
+            raise ValueError(f'Unknown rank column: {rank_by}')
+        if isinstance(limit, bool) or not isinstance(limit, int) or limit < 1:
+            raise ValueError('limit must be a positive integer')
+    except ValueError as e:
+        return {'error': str(e)}
+
+    try:
+        provider = get_provider()
+        universe = _screen_universes.setdefault(provider.cache_id, ScreenUniverse())
+        clock = StageClock('screen')
+        updated, missing = universe.refresh(
+            symbols, lambda s: _cached_history(provider, s, SCREEN_HISTORY_RANGE, '1d'), HISTORY_CACHE_TTL_SECONDS,
+        )
+        clock.lap('refresh')
+        result = universe.screen(symbols, conditions, rank_by, descending, limit)
+        clock.lap('evaluate')
+        result.update(refreshed=updated, missing=missing, error=None)
+        return result
+    except Exception as e:
+        return {'error': f'Screen failed: {str(e)}'}
+
+
+# ── Jobs ───────────────────────────────────────────────────────────────────
+# Computations that can also run in the background through POST /jobs, with
+# progress, cancellation, and results kept for JOB_TTL_SECONDS (see jobs.py)
+JOB_KINDS = {
+    'backtest': run_backtest,
+    'walkforward': run_walk_forward,
+    'train': retrain_model,
+}
+
+
 # ── FastAPI service ──────────────────────────────────────────────────────────
-# Run with: python stock_data.py serve
+# Run with: python stock_data.py serve [host] [port] [--workers N]
 # Exposes two endpoints used by the Express backend instead of execFile spawning.
 
+# Live quotes: one upstream poll per subscribed symbol every N seconds.
+# QUOTE_SOURCE=fake swaps Yahoo for a deterministic local random walk.
+QUOTE_POLL_INTERVAL_SECONDS = float(os.environ.get('QUOTE_POLL_INTERVAL_SECONDS', '15'))
+QUOTE_SOURCE = os.environ.get('QUOTE_SOURCE', 'yahoo')
+QUOTE_STREAM_MAX_SYMBOLS = 50
+
+# Encoded /stock_history bodies kept per worker, keyed on request and input versions
+ENCODED_CACHE_MAX_BYTES = int(os.environ.get('ENCODED_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+
 def _make_fastapi_app():
-    from fastapi import FastAPI, HTTPException
-    from pydantic import BaseModel
+    from contextlib import asynccontextmanager
+
+    from fastapi import FastAPI, HTTPException, Request, Response
+    from fastapi.responses import PlainTextResponse, StreamingResponse
+    from typing import Optional
 
-    service = FastAPI(title="Stock Analysis Service")
+    from pydantic import BaseModel
+    from starlette.routing import Match
+
+    from fastjson import EncodedCache, JSONBytesResponse, dumps
+    from jobs import JobRunner, get_job, get_result
+    from profiling import PROFILING_ENABLED, ProfileStore, ProfilerBusy, profile_call, profile_requested
+    from quotes import FakeQuoteSource, QuoteHub
+
+    # Large payloads are returned pre-encoded (see fastjson.py); the default
+    # class covers the small dict responses.
+    @asynccontextmanager
+    async def lifespan(app):
+        yield
+        shutdown_fold_pool()
+
+    service = FastAPI(title="Stock Analysis Service", default_response_class=JSONBytesResponse, lifespan=lifespan)
+    quote_source = FakeQuoteSource() if QUOTE_SOURCE == 'fake' else get_current_stock_price
+    quote_hub = QuoteHub(quote_source, QUOTE_POLL_INTERVAL_SECONDS)
+    service.state.quote_hub = quote_hub
+    job_runner = JobRunner(JOB_KINDS, 'stock_data')
+    # Every worker runs one; only the holder of the archive's collector lock downloads
+    intraday_collector = IntradayCollector(
+        _intraday_archive, lambda: get_provider().cache_id,
+        lambda symbol, period, interval: _cached_bars(get_provider(), symbol, period, interval),
+        INTRADAY_COLLECT_INTERVAL_SECONDS if INTRADAY_ARCHIVE else 0, INTRADAY_ARCHIVE_SYMBOLS,
+    )
+    intraday_collector.start()
+    service.state.intraday_collector = intraday_collector
+
+    def route_template(scope):
+        for route in service.router.routes:
+            if route.matches(scope)[0] == Match.FULL:
+                return route.path
+        return 'unmatched'
+
+    service.add_middleware(RequestMetricsMiddleware, resolve=route_template)
+    profile_store = ProfileStore()
+    encoded_history = EncodedCache('encoded_history', ENCODED_CACHE_MAX_BYTES)
+
+    def wants_profile(request):
+        if not profile_requested(request.headers, request.query_params):
+            return False
+        if not PROFILING_ENABLED:
+            raise HTTPException(status_code=403, detail="Profiling is disabled (set ENABLE_PROFILING=1)")
+        return True
 
     class HistoryRequest(BaseModel):
         symbol: str
         date_range: str = 'max'
         interval: str = '1d'
         auto_predict: bool = False
+        indicators: list[str] = []
 
     class PriceRequest(BaseModel):
         symbol: str
@@ -965,25 +1354,163 @@ def _make_fastapi_app():
         capital: float = 10000
         date_range: str = '2y'
         interval: str = '1d'
+        robustness: Optional[dict] = None
+
+    class ScreenRequest(BaseModel):
+        symbols: list
+        conditions: Optional[dict] = None
+        rank_by: Optional[str] = None
+        descending: bool = True
+        limit: int = 50
+
+    class PortfolioRequest(BaseModel):
+        holdings: list
+        benchmark: Optional[str] = 'SPY'
+        date_range: str = '1y'
+
+    class JobRequest(BaseModel):
+        kind: str
+        params: dict = {}
+
+    class WalkForwardRequest(BaseModel):
+        symbol: str
+        date_range: str = 'max'
+        capital: float = 10000
+        options: Optional[dict] = None
+        strategy_config: Optional[dict] = None
 
     @service.get("/health")
     def health():
         return {"status": "ok"}
 
+    @service.get("/metrics")
+    def prometheus_metrics():
+        CACHE_ENTRIES.set(len(_model_cache), cache='models')
+        CACHE_ENTRIES.set(len(_history_cache), cache='history')
+        CACHE_ENTRIES.set(len(_info_cache), cache='info')
+        CACHE_ENTRIES.set(len(_closes_cache), cache='closes')
+        CACHE_ENTRIES.set(sum(len(u) for u in _screen_universes.values()), cache='screen_universe')
+        CACHE_ENTRIES.set(engine_cache_size(), cache='indicator_engine')
+        CACHE_ENTRIES.set(len(_rolling_cache), cache='rolling_columns')
+        CACHE_ENTRIES.set(len(quote_hub.symbols()), cache='quote_pollers')
+        CACHE_ENTRIES.set(len(encoded_history), cache='encoded_history')
+        return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+    def history_response(req, request):
+        args = (req.symbol, req.date_range, req.interval, req.auto_predict, req.indicators)
+        if wants_profile(request):
+            try:
+                result, report = profile_call(get_stock_price_history, *args)
+            except ProfilerBusy as e:
+                raise HTTPException(status_code=409, detail=str(e))
+            headers = {"X-Profile-Id": profile_store.save(report, endpoint="/stock_history", params=req.model_dump())}
+            if isinstance(result, dict) and "error" in result:
+                raise HTTPException(status_code=500, detail=result["error"], headers=headers)
+            return JSONBytesResponse(dumps(result), headers=headers)
+
+        # Conditional request: the tag names the data, so no new bar means 304
+        headers = {"Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        predicting = req.auto_predict and req.interval == '1d'
+        model_cached = _model_cache.version(req.symbol.upper()) is not None
+        etag = history_etag(*args)
+        if etag and etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag, **headers})
+
+        body = encoded_history.get((etag, 'identity')) if etag else None
+        if body is None:
+            result = get_stock_price_history(*args)
+            if isinstance(result, dict) and "error" in result:
+                raise HTTPException(status_code=500, detail=result["error"])
+            with stage('history.encode'):
+                body = dumps(result)
+            # Training a model changes the tag; any other change means an
+            # input was refreshed mid-request, so leave the body uncached
+            after = history_etag(*args)
+            if after and (after == etag or (predicting and not model_cached)):
+                etag = after
+                encoded_history.put((etag, 'identity'), body)
+            else:
+                etag = None
+
+        encoding = choose_encoding(request.headers.get("accept-encoding"), len(body))
+        if encoding != 'identity':
+            compressed = encoded_history.get((etag, encoding)) if etag else None
+            if compressed is None:
+                with stage('history.compress'):
+                    compressed = compress(body, encoding)
+                if etag:
+                    encoded_history.put((etag, encoding), compressed)
+            body = compressed
+            headers["Content-Encoding"] = encoding
+        if etag:
+            headers["ETag"] = representation_etag(etag, encoding)
+        return JSONBytesResponse(body, headers=headers)
+
+    @service.get("/stock_history")
+    def stock_history_get(request: Request, symbol: str, date_range: str = 'max', interval: str = '1d',
+                          auto_predict: bool = False, indicators: str = ''):
+        req = HistoryRequest(
+            symbol=symbol, date_range=date_range, interval=interval, auto_predict=auto_predict,
+            indicators=[s.strip() for s in indicators.split(',') if s.strip()],
+        )
+        return history_response(req, request)
+
     @service.post("/stock_history")
-    def stock_history(req: HistoryRequest):
-        result = get_stock_price_history(req.symbol, req.date_range, req.interval, req.auto_predict)
-        if isinstance(result, dict) and "error" in result:
-            raise HTTPException(status_code=500, detail=result["error"])
-        return result
+    def stock_history(req: HistoryRequest, request: Request):
+        return history_response(req, request)
 
     @service.post("/current_price")
     def current_price(req: PriceRequest):
-        result = get_current_stock_price(req.symbol)
+        # Reuse the streaming poller's quote when someone is subscribed
+        result = quote_hub.latest(req.symbol.upper(), max_age=QUOTE_POLL_INTERVAL_SECONDS)
+        if result is None:
+            result = quote_source(req.symbol)
         if isinstance(result, dict) and "error" in result:
             raise HTTPException(status_code=500, detail=result["error"])
         return result
 
+    @service.get("/quotes/stream")
+    async def quote_stream(symbols: str):
+        wanted = sorted({s.strip().upper() for s in symbols.split(',') if s.strip()})
+        if not wanted or len(wanted) > QUOTE_STREAM_MAX_SYMBOLS:
+            raise HTTPException(status_code=400, detail=f"Provide 1-{QUOTE_STREAM_MAX_SYMBOLS} symbols")
+        subscription = quote_hub.subscribe(wanted)
+
+        async def events():
+            try:
+                async for chunk in subscription.events():
+                    yield chunk
+            finally:
+                # Runs on client disconnect; stops pollers nobody watches
+                quote_hub.unsubscribe(subscription)
+
+        return StreamingResponse(
+            events(), media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    @service.get("/quotes/status")
+    def quote_status():
+        return {
+            "symbols": quote_hub.symbols(),
+            "intervalSeconds": quote_hub.interval,
+            "upstreamCalls": quote_hub.upstream_calls,
+        }
+
+    @service.get("/intraday/status")
+    def intraday_status():
+        last_run = intraday_collector.last_run
+        return {
+            "enabled": INTRADAY_ARCHIVE,
+            "collecting": intraday_collector.active,
+            "intervalSeconds": intraday_collector.every,
+            "symbols": intraday_collector.tracked(),
+            "runs": intraday_collector.runs,
+            "barsAppended": intraday_collector.bars_appended,
+            "errors": intraday_collector.errors,
+            "lastRun": datetime.fromtimestamp(last_run).isoformat() if last_run else None,
+        }
+
     @service.post("/fundamentals")
     def fundamentals(req: PriceRequest):
         result = get_fundamentals(req.symbol)
@@ -992,16 +1519,33 @@ def _make_fastapi_app():
         return result
 
     @service.post("/backtest")
-    def backtest(req: BacktestRequest):
-        import subprocess, os
-        # Run backtest in subprocess so we can kill on timeout
+    def backtest(req: BacktestRequest, request: Request):
+        import subprocess, os, time
+        # Run backtest in subprocess so we can kill on timeout. The worker
+        # reports its own stage timings so they land in this process's
+        # metrics, and profiles itself when asked to. It writes a metadata
+        # line and then the encoded result, which is returned as-is.
+        profile = wants_profile(request)
         script = (
-            "import sys, json\n"
+            "import sys, json, time\n"
+            "start = time.perf_counter()\n"
             f"sys.path.insert(0, {json.dumps(os.path.dirname(__file__) or '.')})\n"
             "from stock_data import run_backtest\n"
-            "params = json.loads(sys.stdin.read())\n"
-            "result = run_backtest(**params)\n"
-            "print(json.dumps(result))\n"
+            "from metrics import capture\n"
+            "from fastjson import dumps\n"
+            "import_seconds = time.perf_counter() - start\n"
+            "payload = json.loads(sys.stdin.read())\n"
+            "report = None\n"
+            "with capture() as captured:\n"
+            "    if payload['profile']:\n"
+            "        from profiling import profile_call\n"
+            "        result, report = profile_call(run_backtest, **payload['params'])\n"
+            "    else:\n"
+            "        result = run_backtest(**payload['params'])\n"
+            "captured['stages'].append(('backtest.worker_import', import_seconds))\n"
+            "error = result.get('error') if isinstance(result, dict) else None\n"
+            "meta = dumps({'error': error, 'metrics': captured, 'profile': report})\n"
+            "sys.stdout.buffer.write(meta + b'\\n' + dumps(result))\n"
         )
         params = {
             'symbol': req.symbol,
@@ -1009,26 +1553,108 @@ def _make_fastapi_app():
             'capital': req.capital,
             'date_range': req.date_range,
             'interval': req.interval,
+            'robustness': req.robustness,
         }
+        start = time.perf_counter()
         proc = subprocess.Popen(
             [sys.executable, '-c', script],
             stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
         )
         try:
-            stdout, stderr = proc.communicate(input=json.dumps(params).encode(), timeout=30)
+            payload = {'params': params, 'profile': profile}
+            stdout, stderr = proc.communicate(input=json.dumps(payload).encode(), timeout=30)
             if stderr:
                 sys.stderr.write(f'[backtest-worker] {stderr.decode().strip()}\n')
-            result = json.loads(stdout.decode())
+            meta, _, body = stdout.partition(b'\n')
+            output = json.loads(meta)
+            captured = output['metrics']
+            # Whatever the worker didn't account for is interpreter start-up and IPC
+            worker_seconds = sum(seconds for _, seconds in captured['stages'])
+            captured['stages'].append(('backtest.spawn', max(0.0, time.perf_counter() - start - worker_seconds)))
+            observe_captured(captured)
+            report = output.get('profile')
         except subprocess.TimeoutExpired:
             proc.kill()
             proc.wait()
-            raise HTTPException(status_code=408, detail='Backtest timed out (30s)')
-        except json.JSONDecodeError:
+            raise HTTPException(status_code=408, detail='Backtest timed out (30s); submit it to POST /jobs instead')
+        except (json.JSONDecodeError, KeyError, TypeError):
             raise HTTPException(status_code=500, detail='Backtest worker returned invalid JSON')
 
-        if isinstance(result, dict) and result.get('error'):
+        headers = {}
+        if report:
+            headers['X-Profile-Id'] = profile_store.save(report, endpoint='/backtest', params=req.model_dump())
+        if output.get('error'):
+            raise HTTPException(status_code=400, detail=output['error'], headers=headers)
+        return JSONBytesResponse(body, headers=headers)
+
+    @service.post("/screen")
+    def screen(req: ScreenRequest):
+        result = run_screen(req.symbols, req.conditions, req.rank_by, req.descending, req.limit)
+        if result.get('error'):
             raise HTTPException(status_code=400, detail=result['error'])
-        return result
+        return JSONBytesResponse(dumps(result))
+
+    @service.post("/portfolio/analytics")
+    def portfolio_analytics(req: PortfolioRequest):
+        result = get_portfolio_analytics(req.holdings, req.benchmark, req.date_range)
+        if result.get('error'):
+            raise HTTPException(status_code=400, detail=result['error'])
+        return JSONBytesResponse(dumps(result))
+
+    @service.post("/walkforward")
+    def walkforward(req: WalkForwardRequest):
+        # Folds train in a process pool (walkforward.py); cached folds are reused
+        result = run_walk_forward(req.symbol, req.date_range, req.capital, req.options, req.strategy_config)
+        if result.get('error'):
+            raise HTTPException(status_code=400, detail=result['error'])
+        return JSONBytesResponse(dumps(result))
+
+    @service.post("/jobs", status_code=202)
+    def submit_job(req: JobRequest):
+        try:
+            return job_runner.submit(req.kind, req.params)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    def known_job(job_id):
+        state = get_job(job_id)
+        if state is None:
+            raise HTTPException(status_code=404, detail="Unknown or expired job")
+        return state
+
+    @service.get("/jobs/{job_id}")
+    def job_status(job_id: str):
+        return known_job(job_id)
+
+    @service.get("/jobs/{job_id}/result")
+    def job_result(job_id: str):
+        state = known_job(job_id)
+        if state['status'] == 'failed':
+            raise HTTPException(status_code=400, detail=state['error'])
+        if state['status'] != 'done':
+            raise HTTPException(status_code=409, detail=f"Job is {state['status']}")
+        result = get_result(job_id)
+        if result is None:
+            raise HTTPException(status_code=404, detail="Unknown or expired job")
+        return JSONBytesResponse(dumps(result))
+
+    @service.post("/jobs/{job_id}/cancel")
+    def cancel_job(job_id: str):
+        state = job_runner.cancel(job_id)
+        if state is None:
+            raise HTTPException(status_code=404, detail="Unknown or expired job")
+        return state
+
+    @service.get("/profiles")
+    def profiles():
+        return profile_store.list()
+
+    @service.get("/profiles/{profile_id}")
+    def profile_report(profile_id: str):
+        report = profile_store.get(profile_id)
+        if report is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        return report
 
     @service.get("/model/status/{symbol}")
     def model_status(symbol: str):
@@ -1049,19 +1675,19 @@ def _make_fastapi_app():
     def model_retrain(symbol: str):
         # Evict cache and force a retrain on next stock_history call
         sym = symbol.upper()
-        if sym in _model_cache:
-            del _model_cache[sym]
-        path = _get_cache_path(sym)
-        if os.path.exists(path):
-            try:
-                os.remove(path)
-            except Exception:
-                pass
+        _model_cache.delete(sym)
         return {"symbol": sym, "message": "Cache cleared. Model will be retrained on next prediction request."}
 
     return service
 
-app = _make_fastapi_app()
+
+def __getattr__(name):
+    # Build the app on first access (``stock_data.app``, ``uvicorn stock_data:app``)
+    if name == 'app':
+        globals()['app'] = _make_fastapi_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == "__main__":
 
@@ -1069,10 +1695,21 @@ if __name__ == "__main__":
 
     if function_name == "serve":
         import uvicorn
-        host = sys.argv[2] if len(sys.argv) > 2 else "127.0.0.1"
-        port = int(sys.argv[3]) if len(sys.argv) > 3 else 8000
-        print(f"Starting Stock Analysis FastAPI service on {host}:{port}", file=sys.stderr)
-        uvicorn.run(app, host=host, port=port)
+        args = sys.argv[2:]
+        workers = int(os.environ.get('SERVICE_WORKERS', '1'))
+        if '--workers' in args:
+            i = args.index('--workers')
+            workers = int(args[i + 1])
+            del args[i:i + 2]
+        host = args[0] if len(args) > 0 else "127.0.0.1"
+        port = int(args[1]) if len(args) > 1 else 8000
+        print(f"Starting Stock Analysis FastAPI service on {host}:{port} ({workers} worker(s))", file=sys.stderr)
+        if workers > 1:
+            # Worker processes import the app by name; caches are shared through shared_cache
+            uvicorn.run("stock_data:app", host=host, port=port, workers=workers,
+                        app_dir=os.path.dirname(os.path.abspath(__file__)))
+        else:
+            uvicorn.run(_make_fastapi_app(), host=host, port=port)
 
     elif function_name == "get_stock_price_history":
         if len(sys.argv) < 3:
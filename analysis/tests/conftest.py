@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+# The modules under analysis/ import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the shared cache and intraday archive out of the working tree
+_scratch = tempfile.mkdtemp(prefix='analysis-tests-')
+os.environ.setdefault('STOCK_CACHE_DIR', os.path.join(_scratch, 'cache'))
+os.environ.setdefault('INTRADAY_ARCHIVE_DIR', os.path.join(_scratch, 'archive'))
+os.environ.setdefault('STOCK_DATA_PROVIDER', 'synthetic')
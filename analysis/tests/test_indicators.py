@@ -0,0 +1,59 @@
+import math
+
+import pytest
+
+import stock_data
+from incremental import CHART_COLUMNS, IncrementalIndicatorCache
+from indicators import data_version
+from providers import SyntheticProvider, set_provider
+
+SYMBOLS = ['AAPL', 'MSFT', 'ZZZ']
+
+
+def _baseline(hist, column):
+    """The chart's moving averages as computed and rounded before the indicator engine."""
+    period = int(column.removeprefix('Volume_')[:-2])
+    source = 'Volume' if column.startswith('Volume_') else 'Close'
+    return _rounded(column, hist[source].rolling(window=period, min_periods=period).mean())
+
+
+def _rounded(column, values):
+    digits = 0 if column.startswith('Volume_') else 2
+    return [round(float(v), digits) if not math.isnan(v) else None for v in values]
+
+
+@pytest.fixture
+def provider():
+    provider = SyntheticProvider(end='2026-10-16')
+    previous = set_provider(provider)
+    yield provider
+    set_provider(previous)
+
+
+@pytest.mark.parametrize('symbol', SYMBOLS)
+def test_chart_moving_averages_match_rolling_mean(provider, symbol):
+    hist = provider.history(symbol, 'max', '1d')
+    rows = [r for r in stock_data.get_stock_price_history(symbol, 'max', '1d', False) if 'Date' in r]
+    assert len(rows) == len(hist)
+    for column in CHART_COLUMNS:
+        assert [r[column] for r in rows] == _baseline(hist, column), column
+
+
+@pytest.mark.parametrize('symbol', SYMBOLS)
+def test_incremental_updates_match_rolling_mean(provider, symbol):
+    hist = provider.history(symbol, 'max', '1d')
+    cache = IncrementalIndicatorCache()
+    cache.columns(symbol, hist.iloc[:-300], CHART_COLUMNS)
+    for end in range(len(hist) - 299, len(hist) + 1):
+        columns = cache.columns(symbol, hist.iloc[:end], CHART_COLUMNS)
+    assert cache.incremental_updates == 300
+    for column in CHART_COLUMNS:
+        assert _rounded(column, columns[column]) == _baseline(hist, column), column
+
+
+def test_data_version_ignores_index_time_unit(provider):
+    hist = provider.history('AAPL', '1mo', '5m')
+    assert data_version(hist.set_axis(hist.index.as_unit('us'))) == data_version(hist.set_axis(hist.index.as_unit('ns')))
+    adjusted = hist.copy()
+    adjusted.iloc[10, adjusted.columns.get_loc('Close')] *= 0.5
+    assert data_version(adjusted) != data_version(hist)
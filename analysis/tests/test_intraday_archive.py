@@ -0,0 +1,58 @@
+import os
+import time
+
+import pytest
+
+from intraday_archive import IntradayArchive, IntradayCollector
+from providers import SyntheticProvider
+
+SOURCE = 'synthetic'
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = IntradayArchive(str(tmp_path))
+    provider = SyntheticProvider(end='2026-09-01')
+    for symbol in ('AAA', 'BBB', 'CCC', 'DDD'):
+        archive.append(SOURCE, symbol, '5m', provider.history(symbol, '5d', '5m'))
+    return archive
+
+
+def _viewed(archive, symbol, seconds_ago):
+    archive.mark_viewed(SOURCE, symbol, '5m')
+    when = time.time() - seconds_ago
+    os.utime(os.path.join(archive._path(SOURCE, symbol, '5m'), '.viewed'), (when, when))
+
+
+def _collector(archive, fetched=None, **kwargs):
+    def fetch(symbol, period, interval):
+        if fetched is not None:
+            fetched.append(symbol)
+        return SyntheticProvider(end='2026-09-02').history(symbol, period, interval)
+    return IntradayCollector(archive, lambda: SOURCE, fetch, every=0, intervals=('5m',), **kwargs)
+
+
+def test_symbols_not_viewed_recently_expire(archive):
+    _viewed(archive, 'AAA', 60)
+    _viewed(archive, 'BBB', 3 * 24 * 3600)
+    # CCC and DDD were archived but never viewed
+    collector = _collector(archive, track_seconds=24 * 3600, extra_symbols=['zzz'])
+    assert collector.tracked() == {'5m': ['AAA', 'ZZZ']}
+    assert 'BBB' in archive.symbols(SOURCE, '5m')  # archived bars stay
+
+
+def test_cap_keeps_the_most_recently_viewed(archive):
+    for age, symbol in enumerate(['AAA', 'BBB', 'CCC', 'DDD']):
+        _viewed(archive, symbol, age * 60)
+    collector = _collector(archive, max_symbols=2)
+    assert collector.tracked() == {'5m': ['AAA', 'BBB']}
+    _viewed(archive, 'DDD', 0)
+    assert collector.tracked() == {'5m': ['AAA', 'DDD']}
+
+
+def test_collect_once_downloads_only_tracked_symbols(archive):
+    _viewed(archive, 'CCC', 60)
+    fetched = []
+    collector = _collector(archive, fetched, track_seconds=3600)
+    assert collector.collect_once() > 0
+    assert fetched == ['CCC']
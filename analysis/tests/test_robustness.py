@@ -0,0 +1,36 @@
+import numpy as np
+
+from robustness import analyze, position_returns, trade_permutations
+
+
+def _trades(pnls, entries=None):
+    entries = entries or range(len(pnls))
+    return [{'entryDate': f'2024-01-{e + 1:02d}', 'entryPrice': 100.0, 'pnl': pnl} for e, pnl in zip(entries, pnls)]
+
+
+def test_permuted_drawdown_stays_within_bounds():
+    # Added up instead of compounded, these P&Ls reach a 150% drawdown
+    returns = position_returns(_trades([5000, -6000, -5000, 8000, -4000]), 10000)
+    drawdowns = trade_permutations(returns, 10000, 2000, np.random.default_rng(0))
+    assert drawdowns.min() >= 0
+    assert drawdowns.max() <= 100
+
+
+def test_every_order_ends_at_the_realised_balance():
+    pnls = [5000, -6000, -5000, 8000, -4000]
+    returns = position_returns(_trades(pnls), 10000)
+    assert np.isclose(10000 * np.prod(1 + returns), 10000 + sum(pnls))
+
+
+def test_partial_exits_stay_one_position():
+    returns = position_returns(_trades([500, 300, -200], entries=[0, 0, 1]), 10000)
+    assert np.allclose(returns, [800 / 10000, -200 / 10800])
+
+
+def test_analyze_reports_positions():
+    values = 10000 * np.cumprod(np.r_[1, 1 + np.random.default_rng(1).normal(0, 0.01, 300)])
+    curve = [{'date': f'{2020 + i // 250}-01-01', 'value': v} for i, v in enumerate(values)]
+    result = analyze(_trades([400, -300, 200, 100], entries=[0, 0, 1, 2]), curve, 10000, {'paths': 200, 'seed': 3})
+    assert result['permutation']['trades'] == 4
+    assert result['permutation']['positions'] == 3
+    assert 0 <= result['permutation']['maxDrawdown']['high'] <= 100
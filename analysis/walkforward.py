@@ -0,0 +1,223 @@
+"""Walk-forward folds for the RandomForest signal.
+
+The chart's model reports one 80/20 split accuracy. A walk-forward run
+instead retrains on a window of past bars, predicts the next ``step`` bars,
+moves forward and repeats, so every prediction is out of sample:
+
+    expanding   train on every bar before the test block
+    rolling     train on the last ``train_bars`` bars before the test block
+
+Labels look LABEL_HORIZON bars ahead, so the training window stops that many
+bars before the test block (a purge). Otherwise the last training labels
+would be computed from prices inside the test block.
+
+Folds run in parallel in a spawn process pool that is started by the first
+parallel run and kept for later ones, so a run does not pay for interpreter
+start-up and the sklearn import again. A cancelled or failed run terminates
+the pool unless another run is using it. Each fold's predictions are stored
+in the shared cache under a hash of its training and test data. Fold
+boundaries are counted from the first bar, so when history is extended,
+earlier folds hash the same and only new folds are trained.
+"""
+import hashlib
+import os
+import signal
+import threading
+
+from jobs import CHECK_INTERVAL_SECONDS, progress
+from lazy import LazyModule
+from metrics import stage
+from shared_cache import SharedCache
+
+np = LazyModule('numpy', globals(), 'np')
+
+LABEL_HORIZON = 22  # bars; matches the Label column's forward return
+MIN_TRAIN_SAMPLES = 50
+FOLD_CACHE_TTL_SECONDS = 7 * 24 * 3600
+MAX_WORKERS = int(os.environ.get('WALKFORWARD_WORKERS', str(os.cpu_count() or 1)))
+
+_fold_cache = SharedCache('walkforward', FOLD_CACHE_TTL_SECONDS)
+
+_pool = None
+_pool_workers = 0
+_pool_users = 0  # runs currently waiting on _pool
+_pool_pids = None  # queue the pool's processes put their pid on at start
+_pool_finalizer = None
+_pool_lock = threading.Lock()
+
+
+def parse_options(options):
+    """Validated walk-forward options, or raise ValueError."""
+    options = dict(options or {})
+    unknown = set(options) - {'mode', 'train_bars', 'step', 'threshold'}
+    if unknown:
+        raise ValueError(f'Unknown walk-forward options: {sorted(unknown)}')
+    mode = options.get('mode', 'expanding')
+    if mode not in ('expanding', 'rolling'):
+        raise ValueError("mode must be 'expanding' or 'rolling'")
+    train_bars = options.get('train_bars', 504)
+    step = options.get('step', 63)
+    for name, value, low in (('train_bars', train_bars, MIN_TRAIN_SAMPLES), ('step', step, 1)):
+        if isinstance(value, bool) or not isinstance(value, int) or value < low:
+            raise ValueError(f'{name} must be an integer of at least {low}')
+    threshold = options.get('threshold', 0.5)
+    if isinstance(threshold, bool) or not isinstance(threshold, (int, float)) or not 0 < threshold < 1:
+        raise ValueError('threshold must be between 0 and 1')
+    return {'mode': mode, 'train_bars': train_bars, 'step': step, 'threshold': float(threshold)}
+
+
+def plan_folds(n, mode, train_bars, step, purge=LABEL_HORIZON):
+    """(train_lo, train_hi, test_lo, test_hi) row ranges covering bars train_bars + purge onwards."""
+    folds = []
+    test_lo = train_bars + purge
+    while test_lo < n:
+        train_hi = test_lo - purge
+        train_lo = 0 if mode == 'expanding' else train_hi - train_bars
+        folds.append((train_lo, train_hi, test_lo, min(test_lo + step, n)))
+        test_lo += step
+    return folds
+
+
+def fit_predict(X_train, y_train, X_test, params):
+    """Buy probability for each test row (runs in pool workers)."""
+    classes = np.unique(y_train)
+    if len(classes) == 1:
+        return np.full(len(X_test), float(classes[0]))
+    from sklearn.ensemble import RandomForestClassifier
+    model = RandomForestClassifier(**params, n_jobs=1)
+    model.fit(X_train, y_train)
+    return model.predict_proba(X_test)[:, list(model.classes_).index(1)]
+
+
+def _fold_key(X_train, y_train, X_test, params):
+    digest = hashlib.sha1()
+    for array in (X_train, y_train, X_test):
+        digest.update(np.ascontiguousarray(array).tobytes())
+        digest.update(repr(array.shape).encode())
+    digest.update(repr(sorted(params.items())).encode())
+    return digest.hexdigest()
+
+
+# ── Pool ────────────────────────────────────────────────────────────────────
+
+def _report_pid(pids):
+    pids.put(os.getpid())
+
+
+def _acquire_pool(workers):
+    global _pool, _pool_workers, _pool_users, _pool_pids, _pool_finalizer
+    with _pool_lock:
+        if _pool is not None and _pool_workers != workers and not _pool_users:
+            _pool.shutdown(wait=False)
+            _pool = None
+        if _pool is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # spawn: the service process has threads, which fork does not copy safely
+            context = multiprocessing.get_context('spawn')
+            _pool_pids = context.SimpleQueue()
+            _pool = ProcessPoolExecutor(workers, mp_context=context, initializer=_report_pid, initargs=(_pool_pids,))
+            _pool_workers = workers
+            if _pool_finalizer is None:
+                from multiprocessing.util import Finalize
+                # Runs before a pool process (e.g. a job's) joins its children at
+                # exit, which would otherwise wait on this pool's idle processes
+                _pool_finalizer = Finalize(None, shutdown_pool, exitpriority=10)
+        _pool_users += 1
+        return _pool
+
+
+def _terminate_pool():
+    # Caller holds _pool_lock. ProcessPoolExecutor cannot kill a running
+    # task, so its processes are signalled by the pids they reported.
+    global _pool
+    _pool.shutdown(wait=False, cancel_futures=True)
+    while not _pool_pids.empty():
+        try:
+            os.kill(_pool_pids.get(), signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    _pool = None
+
+
+def _release_pool(pool, abandon):
+    """Hand the pool back; ``abandon`` kills its fits in flight if no other run uses it."""
+    global _pool_users
+    with _pool_lock:
+        _pool_users -= 1
+        if abandon and pool is _pool and not _pool_users:
+            _terminate_pool()
+
+
+def shutdown_pool():
+    """Terminate the fold pool, if one was started (at service shutdown)."""
+    with _pool_lock:
+        if _pool is not None:
+            _terminate_pool()
+
+
+def predict_folds(X, y, folds, params, workers=MAX_WORKERS):
+    """Out-of-sample buy probabilities for every bar, plus one summary per fold.
+
+    X is an (n, features) array with NaN rows where features are incomplete;
+    y holds 0/1 labels and -1 where the label is unknown. Bars no fold
+    predicts are NaN.
+    """
+    complete = ~np.isnan(X).any(axis=1)
+    labeled = complete & (y >= 0)
+    probabilities = np.full(len(X), np.nan)
+    summaries, pending = [], []
+    for train_lo, train_hi, test_lo, test_hi in folds:
+        train_rows = np.flatnonzero(labeled[train_lo:train_hi]) + train_lo
+        test_rows = np.flatnonzero(complete[test_lo:test_hi]) + test_lo
+        summary = {
+            'trainStart': train_lo, 'trainEnd': train_hi, 'testStart': test_lo, 'testEnd': test_hi,
+            'trainSamples': len(train_rows), 'predicted': 0, 'cached': False,
+        }
+        summaries.append(summary)
+        if len(train_rows) < MIN_TRAIN_SAMPLES or len(test_rows) == 0:
+            continue
+        X_train, y_train, X_test = X[train_rows], y[train_rows], X[test_rows]
+        key = _fold_key(X_train, y_train, X_test, params)
+        cached = _fold_cache.get(key)
+        if cached is not None:
+            probabilities[test_rows] = cached
+            summary.update(predicted=len(test_rows), cached=True)
+        else:
+            pending.append((summary, key, test_rows, (X_train, y_train, X_test, params)))
+
+    done = len(folds) - len(pending)
+    progress('train', done, len(folds), 'folds')
+
+    def finished(job, result):
+        # Cached as each fold completes, so a cancelled run keeps its folds
+        nonlocal done
+        summary, key, test_rows, _ = job
+        _fold_cache.set(key, result)
+        probabilities[test_rows] = result
+        summary['predicted'] = len(test_rows)
+        done += 1
+        progress('train', done, len(folds), 'folds')
+
+    with stage('walkforward.train'):
+        if workers > 1 and len(pending) > 1:
+            from concurrent.futures import FIRST_COMPLETED, wait
+            pool = _acquire_pool(workers)
+            abandon = True
+            try:
+                futures = {pool.submit(fit_predict, *job[3]): job for job in pending}
+                while futures:
+                    # Wakes up while folds are still fitting, so a cancel is seen within
+                    # CHECK_INTERVAL_SECONDS rather than when the next fold ends
+                    ready, _ = wait(futures, timeout=CHECK_INTERVAL_SECONDS, return_when=FIRST_COMPLETED)
+                    for future in ready:
+                        finished(futures.pop(future), future.result())
+                    progress('train', done, len(folds), 'folds')
+                abandon = False
+            finally:
+                # Also replaces a pool broken by a killed process
+                _release_pool(pool, abandon)
+        else:
+            for job in pending:
+                finished(job, fit_predict(*job[3]))
+    return probabilities, summaries
@@ -0,0 +1,109 @@
+'use strict';
+
+const zlib = require('node:zlib');
+
+// Bodies smaller than this are sent uncompressed
+const MIN_COMPRESS_BYTES = 1024;
+const GZIP_LEVEL = 6;
+const BROTLI_QUALITY = 5;
+const ENCODING_SUFFIXES = ['-gzip', '-br'];
+
+// A compressed body is a different byte sequence, so it gets its own strong
+// tag ("<tag>-gzip"); If-None-Match compares tags with the suffix removed.
+function representationEtag(etag, encoding) {
+  return encoding === 'identity' ? etag : `${etag.slice(0, -1)}-${encoding}"`;
+}
+
+function baseTag(tag) {
+  let value = tag.trim();
+  if (value.startsWith('W/')) {
+    value = value.slice(2);
+  }
+  for (const suffix of ENCODING_SUFFIXES) {
+    if (value.endsWith(`${suffix}"`)) {
+      return `${value.slice(0, -suffix.length - 1)}"`;
+    }
+  }
+  return value;
+}
+
+function etagMatches(ifNoneMatch, etag) {
+  if (!ifNoneMatch || !etag) {
+    return false;
+  }
+  if (ifNoneMatch.trim() === '*') {
+    return true;
+  }
+  return ifNoneMatch.split(',').some((tag) => baseTag(tag) === etag);
+}
+
+function chooseEncoding(acceptEncoding, size) {
+  if (size < MIN_COMPRESS_BYTES || !acceptEncoding) {
+    return 'identity';
+  }
+  const accepted = new Map();
+  for (const item of String(acceptEncoding).split(',')) {
+    const [name, ...params] = item.trim().split(';');
+    const qParam = params.map((p) => p.trim()).find((p) => p.startsWith('q='));
+    const q = qParam ? Number(qParam.slice(2)) : 1;
+    accepted.set(name.trim().toLowerCase(), Number.isFinite(q) ? q : 0);
+  }
+  for (const encoding of ['br', 'gzip']) {
+    const q = accepted.has(encoding) ? accepted.get(encoding) : accepted.get('*') ?? 0;
+    if (q > 0) {
+      return encoding;
+    }
+  }
+  return 'identity';
+}
+
+function compressBody(body, encoding) {
+  if (encoding === 'gzip') {
+    return zlib.gzipSync(body, { level: GZIP_LEVEL });
+  }
+  if (encoding === 'br') {
+    return zlib.brotliCompressSync(body, {
+      params: {
+        [zlib.constants.BROTLI_PARAM_QUALITY]: BROTLI_QUALITY,
+        [zlib.constants.BROTLI_PARAM_SIZE_HINT]: body.length,
+      },
+    });
+  }
+  return body;
+}
+
+// Sends a cached JSON body ({ body: Buffer, etag }) honouring If-None-Match
+// and Accept-Encoding. Compressed variants are kept on the entry so each is
+// built once per body.
+function sendCachedJson(req, res, entry) {
+  res.set('Cache-Control', 'no-cache');
+  res.vary('Accept-Encoding');
+  if (entry.etag && etagMatches(req.get('If-None-Match'), entry.etag)) {
+    res.set('ETag', entry.etag);
+    return res.status(304).end();
+  }
+
+  const encoding = chooseEncoding(req.get('Accept-Encoding'), entry.body.length);
+  let body = entry.body;
+  if (encoding !== 'identity') {
+    entry.variants = entry.variants || {};
+    if (!entry.variants[encoding]) {
+      entry.variants[encoding] = compressBody(entry.body, encoding);
+    }
+    body = entry.variants[encoding];
+    res.set('Content-Encoding', encoding);
+  }
+  if (entry.etag) {
+    res.set('ETag', representationEtag(entry.etag, encoding));
+  }
+  res.type('application/json');
+  return res.send(body);
+}
+
+module.exports = {
+  chooseEncoding,
+  compressBody,
+  etagMatches,
+  representationEtag,
+  sendCachedJson,
+};
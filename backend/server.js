@@ -5,6 +5,7 @@ const cors = require('cors');
 const { spawn } = require('child_process');
 const path = require('path');
 const { buildChatIbContext, parseChatResponse } = require('./chatSafety');
+const { sendCachedJson } = require('./httpCache');
 
 const IB = require('ib');
 
@@ -693,7 +694,7 @@ app.get('/api/stock/:symbol', async (req, res) => {
 
   try {
     const { symbol } = req.params;
-    const { date_range = 'max', interval = '1d', auto_predict = 'false' } = req.query;
+    const { date_range = 'max', interval = '1d', auto_predict = 'false', indicators = '' } = req.query;
     
     // Input validation / whitelist
     const ALLOWED_DATE_RANGES = new Set(['max', '1y', '2y', '5y']);
@@ -713,25 +714,42 @@ app.get('/api/stock/:symbol', async (req, res) => {
     }
 
     const sanitizedAutoPredict = auto_predict === 'true' ? 'true' : 'false';
+
+    // Extra indicator specs, e.g. indicators=RSI_14,BBUPPER_20_2
+    const indicatorSpecs = String(indicators).split(',').map(s => s.trim()).filter(Boolean);
+    if (indicatorSpecs.length > 20 || indicatorSpecs.some(s => !/^[A-Za-z0-9_.:]{1,40}$/.test(s))) {
+      return res.status(400).json({ error: 'Invalid indicators' });
+    }
     
-    const cacheKey = `${sanitizedSymbol}-${date_range}-${interval}-${sanitizedAutoPredict}`;
+    // Cached as the encoded body plus the Python service's ETag, so hits are
+    // sent without re-serializing and browsers revalidate with If-None-Match
+    const cacheKey = `${sanitizedSymbol}-${date_range}-${interval}-${sanitizedAutoPredict}-${indicatorSpecs.join(',')}`;
     const cachedData = cache.get(cacheKey);
 
     if (cachedData && (Date.now() - cachedData.timestamp < CACHE_TTL)) {
       console.log('Returning cached data for:', cacheKey);
-      return res.json(cachedData.data);
+      return sendCachedJson(req, res, cachedData);
     }
-    
-    const pyRes = await fetch(`${PYTHON_SERVICE_URL}/stock_history`, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({
-        symbol: sanitizedSymbol,
-        date_range,
-        interval,
-        auto_predict: sanitizedAutoPredict === 'true',
-      }),
+
+    const params = new URLSearchParams({
+      symbol: sanitizedSymbol,
+      date_range,
+      interval,
+      auto_predict: sanitizedAutoPredict,
+      indicators: indicatorSpecs.join(','),
     });
+    const pyHeaders = { 'Accept-Encoding': 'identity' };
+    if (cachedData?.etag) {
+      // Stale entry: the service answers 304 if no new bar has arrived
+      pyHeaders['If-None-Match'] = cachedData.etag;
+    }
+    const pyRes = await fetch(`${PYTHON_SERVICE_URL}/stock_history?${params}`, { headers: pyHeaders });
+
+    if (pyRes.status === 304 && cachedData) {
+      console.log('[python-service] Not modified:', cacheKey);
+      cachedData.timestamp = Date.now();
+      return sendCachedJson(req, res, cachedData);
+    }
 
     if (!pyRes.ok) {
       const errBody = await pyRes.json().catch(() => ({}));
@@ -739,13 +757,17 @@ app.get('/api/stock/:symbol', async (req, res) => {
       return res.status(502).json({ error: errBody.detail || 'Python service error' });
     }
 
-    const result = await pyRes.json();
-    console.log('[python-service] Response received, items:', Array.isArray(result) ? result.length : 'N/A');
+    const entry = {
+      timestamp: Date.now(),
+      etag: pyRes.headers.get('etag'),
+      body: Buffer.from(await pyRes.arrayBuffer()),
+    };
+    console.log('[python-service] Response received, bytes:', entry.body.length);
 
     // Cache the result
-    cache.set(cacheKey, { timestamp: Date.now(), data: result });
+    cache.set(cacheKey, entry);
 
-    res.json(result);
+    sendCachedJson(req, res, entry);
 
   } catch (error) {
     console.error('[python-service] Fetch failed:', error.message);
@@ -809,6 +831,50 @@ app.get('/api/ib/status', (req, res) => {
   res.json({ connected: ibConnected });
 });
 
+// ── Live price stream (Server-Sent Events, one upstream poller per symbol) ───
+// Declared before /api/price/:symbol so "stream" isn't taken as a symbol.
+app.get('/api/price/stream', async (req, res) => {
+  const symbols = String(req.query.symbols || '')
+    .split(',')
+    .map(s => s.trim().toUpperCase())
+    .filter(Boolean);
+  if (symbols.length === 0 || symbols.length > 50 || symbols.some(s => !/^[A-Z0-9.\-]{1,20}$/.test(s))) {
+    return res.status(400).json({ error: 'Invalid symbols' });
+  }
+
+  const controller = new AbortController();
+  req.on('close', () => controller.abort());
+
+  try {
+    const pyRes = await fetch(
+      `${PYTHON_SERVICE_URL}/quotes/stream?symbols=${encodeURIComponent(symbols.join(','))}`,
+      { signal: controller.signal },
+    );
+    if (!pyRes.ok || !pyRes.body) {
+      const errBody = await pyRes.json().catch(() => ({}));
+      return res.status(502).json({ error: errBody.detail || 'Python service error' });
+    }
+
+    res.writeHead(200, {
+      'Content-Type': 'text/event-stream',
+      'Cache-Control': 'no-cache',
+      Connection: 'keep-alive',
+    });
+    for await (const chunk of pyRes.body) {
+      res.write(chunk);
+    }
+    res.end();
+  } catch (error) {
+    if (controller.signal.aborted) return;
+    console.error('[python-service] Price stream failed:', error.message);
+    if (!res.headersSent) {
+      res.status(502).json({ error: 'Could not reach Python analysis service' });
+    } else {
+      res.end();
+    }
+  }
+});
+
 // ── Lightweight current price endpoint (for watchlist polling) ──────────────
 app.get('/api/price/:symbol', async (req, res) => {
   try {
@@ -1351,6 +1417,48 @@ app.get('/api/portfolio', async (req, res) => {
   }
 });
 
+app.post('/api/portfolio/analytics', async (req, res) => {
+  try {
+    const body = req.body ?? {};
+    const holdings = body.holdings;
+    const benchmark = String(body.benchmark ?? 'SPY').trim().toUpperCase();
+    const dateRange = String(body.dateRange ?? '1y').trim();
+
+    if (!Array.isArray(holdings) || holdings.length === 0) {
+      return res.status(400).json({ error: 'Holdings are required' });
+    }
+
+    if (benchmark && !/^[A-Z0-9.\-^]{1,20}$/.test(benchmark)) {
+      return res.status(400).json({ error: 'Invalid benchmark symbol' });
+    }
+
+    const pyRes = await fetch(`${PYTHON_SERVICE_URL}/portfolio/analytics`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({
+        holdings: holdings.map((h) => ({
+          symbol: h?.symbol,
+          quantity: h?.quantity,
+          cost_basis: h?.cost_basis ?? h?.costBasis ?? null,
+        })),
+        benchmark,
+        date_range: dateRange,
+      }),
+    });
+
+    if (!pyRes.ok) {
+      const errBody = await pyRes.json().catch(() => ({}));
+      return res.status(400).json({ error: errBody.detail || 'Portfolio analytics failed' });
+    }
+
+    const result = await pyRes.json();
+    res.json(result);
+  } catch (error) {
+    console.error('[portfolio-analytics] Error:', error.message);
+    res.status(502).json({ error: 'Could not reach Python analysis service' });
+  }
+});
+
 app.get('/api/orders/pending', async (req, res) => {
   try {
     if (!ibConnected) {
@@ -1528,6 +1636,7 @@ app.post('/api/backtest', async (req, res) => {
     const capital = Number(body.capital ?? 10000);
     const dateRange = String(body.dateRange ?? '2y').trim();
     const interval = String(body.interval ?? '1d').trim();
+    const robustness = body.robustness ?? null;
 
     if (!/^[A-Z0-9.\-]{1,20}$/.test(symbol)) {
       return res.status(400).json({ error: 'Invalid symbol' });
@@ -1541,6 +1650,10 @@ app.post('/api/backtest', async (req, res) => {
       return res.status(400).json({ error: 'Capital must be a positive number' });
     }
 
+    if (robustness !== null && (typeof robustness !== 'object' || Array.isArray(robustness))) {
+      return res.status(400).json({ error: 'Robustness options must be an object' });
+    }
+
     const pyRes = await fetch(`${PYTHON_SERVICE_URL}/backtest`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
@@ -1550,6 +1663,7 @@ app.post('/api/backtest', async (req, res) => {
         capital,
         date_range: dateRange,
         interval,
+        robustness,
       }),
     });
 
@@ -1566,6 +1680,163 @@ app.post('/api/backtest', async (req, res) => {
   }
 });
 
+app.post('/api/screen', async (req, res) => {
+  try {
+    const body = req.body ?? {};
+    const symbols = body.symbols;
+    const conditions = body.conditions ?? null;
+    const rankBy = body.rankBy ?? null;
+    const descending = body.descending ?? true;
+    const limit = Number(body.limit ?? 50);
+
+    if (!Array.isArray(symbols) || symbols.length === 0) {
+      return res.status(400).json({ error: 'Symbols are required' });
+    }
+
+    if (conditions !== null && (typeof conditions !== 'object' || Array.isArray(conditions))) {
+      return res.status(400).json({ error: 'Conditions must be an object' });
+    }
+
+    if (!Number.isInteger(limit) || limit <= 0) {
+      return res.status(400).json({ error: 'Limit must be a positive integer' });
+    }
+
+    const pyRes = await fetch(`${PYTHON_SERVICE_URL}/screen`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({
+        symbols: symbols.map((s) => String(s).trim().toUpperCase()),
+        conditions,
+        rank_by: rankBy,
+        descending: Boolean(descending),
+        limit,
+      }),
+    });
+
+    if (!pyRes.ok) {
+      const errBody = await pyRes.json().catch(() => ({}));
+      return res.status(400).json({ error: errBody.detail || 'Screen failed' });
+    }
+
+    const result = await pyRes.json();
+    res.json(result);
+  } catch (error) {
+    console.error('[screen] Error:', error.message);
+    res.status(502).json({ error: 'Could not reach Python analysis service' });
+  }
+});
+
+app.post('/api/backtest/walkforward', async (req, res) => {
+  try {
+    const body = req.body ?? {};
+    const symbol = String(body.symbol ?? '').trim().toUpperCase();
+    const capital = Number(body.capital ?? 10000);
+    const dateRange = String(body.dateRange ?? 'max').trim();
+    const options = body.options ?? null;
+    const strategyConfig = body.strategyConfig ?? null;
+
+    if (!/^[A-Z0-9.\-]{1,20}$/.test(symbol)) {
+      return res.status(400).json({ error: 'Invalid symbol' });
+    }
+
+    if (!Number.isFinite(capital) || capital <= 0) {
+      return res.status(400).json({ error: 'Capital must be a positive number' });
+    }
+
+    for (const [name, value] of [['Walk-forward options', options], ['Strategy config', strategyConfig]]) {
+      if (value !== null && (typeof value !== 'object' || Array.isArray(value))) {
+        return res.status(400).json({ error: `${name} must be an object` });
+      }
+    }
+
+    const pyRes = await fetch(`${PYTHON_SERVICE_URL}/walkforward`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({
+        symbol,
+        capital,
+        date_range: dateRange,
+        options,
+        strategy_config: strategyConfig,
+      }),
+    });
+
+    if (!pyRes.ok) {
+      const errBody = await pyRes.json().catch(() => ({}));
+      return res.status(400).json({ error: errBody.detail || 'Walk-forward backtest failed' });
+    }
+
+    const result = await pyRes.json();
+    res.json(result);
+  } catch (error) {
+    console.error('[walkforward] Error:', error.message);
+    res.status(502).json({ error: 'Could not reach Python analysis service' });
+  }
+});
+
+// Long-running backtests, walk-forward runs and model training as background
+// jobs. Status codes from the Python service are passed through so clients can
+// tell a pending job (409) from an unknown or expired one (404).
+const JOB_ID_PATTERN = /^[a-f0-9]{32}$/;
+
+async function forwardJobRequest(res, method, pyPath, body) {
+  try {
+    const pyRes = await fetch(`${PYTHON_SERVICE_URL}${pyPath}`, {
+      method,
+      headers: body ? { 'Content-Type': 'application/json' } : undefined,
+      body: body ? JSON.stringify(body) : undefined,
+    });
+
+    if (!pyRes.ok) {
+      const errBody = await pyRes.json().catch(() => ({}));
+      return res.status(pyRes.status).json({ error: errBody.detail || 'Job request failed' });
+    }
+
+    const result = await pyRes.json();
+    res.status(pyRes.status).json(result);
+  } catch (error) {
+    console.error('[jobs] Error:', error.message);
+    res.status(502).json({ error: 'Could not reach Python analysis service' });
+  }
+}
+
+app.post('/api/jobs', async (req, res) => {
+  const body = req.body ?? {};
+  const kind = String(body.kind ?? '').trim();
+  const params = body.params ?? {};
+
+  if (!kind) {
+    return res.status(400).json({ error: 'Job kind is required' });
+  }
+
+  if (typeof params !== 'object' || params === null || Array.isArray(params)) {
+    return res.status(400).json({ error: 'Job params must be an object' });
+  }
+
+  return forwardJobRequest(res, 'POST', '/jobs', { kind, params });
+});
+
+app.get('/api/jobs/:id', async (req, res) => {
+  if (!JOB_ID_PATTERN.test(req.params.id)) {
+    return res.status(400).json({ error: 'Invalid job id' });
+  }
+  return forwardJobRequest(res, 'GET', `/jobs/${req.params.id}`);
+});
+
+app.get('/api/jobs/:id/result', async (req, res) => {
+  if (!JOB_ID_PATTERN.test(req.params.id)) {
+    return res.status(400).json({ error: 'Invalid job id' });
+  }
+  return forwardJobRequest(res, 'GET', `/jobs/${req.params.id}/result`);
+});
+
+app.post('/api/jobs/:id/cancel', async (req, res) => {
+  if (!JOB_ID_PATTERN.test(req.params.id)) {
+    return res.status(400).json({ error: 'Invalid job id' });
+  }
+  return forwardJobRequest(res, 'POST', `/jobs/${req.params.id}/cancel`);
+});
+
 
 // ── Python FastAPI service manager ───────────────────────────────────────────
 const PYTHON_SCRIPT = path.join(__dirname, '../analysis/stock_data.py');
@@ -3,7 +3,9 @@ const { describe, it } = require('node:test');
 const assert = require('node:assert/strict');
 const fs = require('node:fs');
 const path = require('node:path');
+const zlib = require('node:zlib');
 const { buildChatIbContext, normalizeDraftOrder, parseChatResponse } = require('../chatSafety');
+const { chooseEncoding, compressBody, etagMatches, representationEtag, sendCachedJson } = require('../httpCache');
 
 describe('Backend', () => {
   it('server.js exists and is parseable', () => {
@@ -186,4 +188,62 @@ describe('Backend', () => {
       draftOrder: null,
     });
   });
+
+  it('matches If-None-Match against strong tags in any content coding', () => {
+    const etag = '"abc123"';
+    assert.equal(representationEtag(etag, 'identity'), '"abc123"');
+    assert.equal(representationEtag(etag, 'gzip'), '"abc123-gzip"');
+    assert.ok(etagMatches('"abc123"', etag));
+    assert.ok(etagMatches('"other", "abc123-br"', etag));
+    assert.ok(etagMatches('W/"abc123-gzip"', etag));
+    assert.ok(etagMatches('*', etag));
+    assert.ok(!etagMatches('"abc1234"', etag));
+    assert.ok(!etagMatches(undefined, etag));
+    assert.ok(!etagMatches('"abc123"', null));
+  });
+
+  it('negotiates compression only for large bodies', () => {
+    assert.equal(chooseEncoding('gzip, deflate, br', 100), 'identity');
+    assert.equal(chooseEncoding('gzip, deflate, br', 5000), 'br');
+    assert.equal(chooseEncoding('gzip, br;q=0', 5000), 'gzip');
+    assert.equal(chooseEncoding('identity', 5000), 'identity');
+    assert.equal(chooseEncoding('*', 5000), 'br');
+    assert.equal(chooseEncoding(undefined, 5000), 'identity');
+
+    const body = Buffer.from(JSON.stringify(Array.from({ length: 500 }, (_, i) => ({ Date: i, Close: i * 1.5 }))));
+    assert.deepEqual(zlib.gunzipSync(compressBody(body, 'gzip')), body);
+    assert.deepEqual(zlib.brotliDecompressSync(compressBody(body, 'br')), body);
+  });
+
+  it('serves cached JSON bodies with 304s and compressed variants', async () => {
+    const express = require('express');
+    const rows = Array.from({ length: 500 }, (_, i) => ({ Date: `2024-01-${i}`, Close: i }));
+    const entry = { etag: '"v1"', body: Buffer.from(JSON.stringify(rows)) };
+    const app = express();
+    app.get('/history', (req, res) => sendCachedJson(req, res, entry));
+    const server = app.listen(0);
+    await new Promise((resolve) => server.once('listening', resolve));
+    const url = `http://127.0.0.1:${server.address().port}/history`;
+    try {
+      const plain = await fetch(url, { headers: { 'Accept-Encoding': 'identity' } });
+      assert.equal(plain.status, 200);
+      assert.equal(plain.headers.get('etag'), '"v1"');
+      assert.equal(plain.headers.get('content-encoding'), null);
+      assert.deepEqual(await plain.json(), rows);
+
+      const gzipped = await fetch(url, { headers: { 'Accept-Encoding': 'gzip' } });
+      assert.equal(gzipped.headers.get('content-encoding'), 'gzip');
+      assert.equal(gzipped.headers.get('etag'), '"v1-gzip"');
+      assert.match(gzipped.headers.get('vary'), /Accept-Encoding/);
+      assert.deepEqual(await gzipped.json(), rows);
+      assert.ok(entry.variants.gzip.length < entry.body.length);
+
+      const notModified = await fetch(url, { headers: { 'If-None-Match': '"v1-gzip"' } });
+      assert.equal(notModified.status, 304);
+      assert.equal(notModified.headers.get('etag'), '"v1"');
+      assert.equal((await notModified.arrayBuffer()).byteLength, 0);
+    } finally {
+      server.close();
+    }
+  });
 });
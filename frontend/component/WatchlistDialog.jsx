@@ -65,7 +65,8 @@ function WatchlistDialog({ isOpen, onClose, onStockSelect }) {
     return () => window.removeEventListener('watchlist-updated', handleUpdate);
   }, [isOpen]);
 
-  // Fetch prices for all watchlist items when dialog opens, then poll every 30s
+  // Fetch prices for all watchlist items when dialog opens, then follow the
+  // live price stream (or poll every 30s if streaming is unavailable)
   useEffect(() => {
     if (!isOpen || watchlist.length === 0) return;
 
@@ -100,11 +101,45 @@ function WatchlistDialog({ isOpen, onClose, onStockSelect }) {
       }
     };
 
+    const startPolling = () => {
+      if (!pollIntervalRef.current) {
+        pollIntervalRef.current = setInterval(fetchPrices, 30000);
+      }
+    };
+
     fetchPrices();
-    pollIntervalRef.current = setInterval(fetchPrices, 30000);
+
+    // Prefer the shared server-side stream; fall back to polling without it
+    let source = null;
+    if (typeof EventSource !== 'undefined') {
+      const symbols = watchlist.map(item => item.symbol).join(',');
+      source = new EventSource(`/api/price/stream?symbols=${encodeURIComponent(symbols)}`);
+      source.addEventListener('quote', (event) => {
+        if (!active) return;
+        try {
+          const data = JSON.parse(event.data);
+          if (data.symbol == null || data.price == null) return;
+          const upper = String(data.symbol).toUpperCase();
+          const symbol = watchlist.find(item => item.symbol.toUpperCase() === upper)?.symbol ?? upper;
+          setPrices(prev => ({ ...prev, [symbol]: Math.round(parseFloat(data.price) * 100) / 100 }));
+          if (data.changePercent != null) {
+            setPriceChanges(prev => ({ ...prev, [symbol]: Math.round(parseFloat(data.changePercent) * 100) / 100 }));
+          }
+          setLastUpdated(new Date());
+        } catch {
+          // Ignore malformed events
+        }
+      });
+      source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) startPolling();
+      };
+    } else {
+      startPolling();
+    }
 
     return () => {
       active = false;
+      if (source) source.close();
       if (pollIntervalRef.current) {
         clearInterval(pollIntervalRef.current);
         pollIntervalRef.current = null;